@@ -0,0 +1,208 @@
+"""
+Admission control for the inference routes.
+
+A fixed number of requests may run inference at once. The number is sized
+to the CPU cores, and torch's intra-op threads are sized to match, so
+request threads times torch threads never oversubscribes the machine. The
+rest wait in bounded per-lane queues. Interactive requests are always
+admitted before bulk ones. A request is shed instead of queued when the
+queue is full (503), when its lane is full (429), or when the estimated wait
+already exceeds its deadline (503). A queued request that reaches its
+deadline is dropped (503). Every rejection carries a Retry-After hint
+derived from the current backlog.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import Histogram, observe_stage
+
+LANES = ('interactive', 'bulk')
+
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Rejected(Exception):
+    """The request was shed; answer with status and a Retry-After of retry_after seconds"""
+
+    def __init__(self, reason, status, retry_after, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_capacity(cores, workers=0, torch_threads=0, batching=False):
+    """Return (workers, torch threads) for the cores; 0 means choose automatically
+
+    With batching a single batcher thread runs the models, so it gets every
+    core and the admitted requests just feed it batches. Without batching,
+    each admitted request runs the models on its own thread, so the cores
+    are divided between them.
+    """
+    cores = max(1, cores)
+    workers = workers or cores
+    if not torch_threads:
+        torch_threads = cores if batching else max(1, cores // workers)
+    return workers, torch_threads
+
+
+class _Waiter:
+    __slots__ = ('lane', 'deadline', 'event', 'granted')
+
+    def __init__(self, lane, deadline):
+        self.lane = lane
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionController:
+    """Bounded concurrency with priority lanes and deadline-aware shedding"""
+
+    def __init__(self, workers, max_queue=64, lane_limits=None, default_timeout=10.0, min_retry_after=1):
+        self.workers = max(1, int(workers))
+        self.max_queue = max_queue
+        self.lane_limits = dict(lane_limits or {})
+        self.default_timeout = default_timeout
+        self.min_retry_after = min_retry_after
+        self.wait_ms = Histogram(WAIT_BUCKETS_MS)
+        self._active = 0
+        self._queues = {lane: deque() for lane in LANES}
+        self._service_seconds = None
+        self._lock = threading.Lock()
+        self._counters = {'admitted': 0, 'completed': 0}
+        self._rejected = {'queue_full': 0, 'lane_full': 0, 'deadline': 0, 'expired': 0}
+
+    def _queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _ahead_of(self, lane):
+        # Caller holds self._lock; everyone in this lane or a higher one goes first
+        ahead = 0
+        for name in LANES:
+            ahead += len(self._queues[name])
+            if name == lane:
+                break
+        return ahead
+
+    def _estimated_wait(self, ahead):
+        if self._service_seconds is None:
+            return 0.0
+        return (ahead + 1) * self._service_seconds / self.workers
+
+    def _retry_after(self):
+        # Caller holds self._lock
+        return max(self.min_retry_after, math.ceil(self._estimated_wait(self._queued())))
+
+    def _reject(self, reason, status, message):
+        # Caller holds self._lock
+        self._rejected[reason] += 1
+        return Rejected(reason, status, self._retry_after(), message)
+
+    def acquire(self, lane='interactive', timeout=None):
+        """Wait for a slot; returns the admission time or raises Rejected"""
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane '{lane}', expected one of {LANES}")
+        arrived = time.monotonic()
+        timeout = self.default_timeout if timeout is None else timeout
+
+        with self._lock:
+            ahead = self._ahead_of(lane)
+            if self._active < self.workers and ahead == 0:
+                self._active += 1
+                self._counters['admitted'] += 1
+                self._record_wait(0.0)
+                return arrived
+            if self._queued() >= self.max_queue:
+                raise self._reject('queue_full', 503, 'The inference queue is full')
+            limit = self.lane_limits.get(lane)
+            if limit is not None and len(self._queues[lane]) >= limit:
+                raise self._reject('lane_full', 429, f'Too many queued {lane} requests')
+            if self._estimated_wait(ahead) > timeout:
+                raise self._reject('deadline', 503, 'The request would miss its deadline in the queue')
+            waiter = _Waiter(lane, arrived + timeout)
+            self._queues[lane].append(waiter)
+
+        waiter.event.wait(max(0.0, waiter.deadline - time.monotonic()))
+        with self._lock:
+            if not waiter.granted:
+                # Still queued (timed out) or dropped by release() after its deadline
+                try:
+                    self._queues[lane].remove(waiter)
+                except ValueError:
+                    pass
+                raise self._reject('expired', 503, 'Timed out waiting for an inference slot')
+            self._record_wait(time.monotonic() - arrived)
+        return time.monotonic()
+
+    def _record_wait(self, seconds):
+        self.wait_ms.observe(seconds * 1000.0)
+        observe_stage('admission.wait', seconds)
+
+    def release(self, admitted_at):
+        """Free a slot, handing it straight to the next waiter still within its deadline"""
+        now = time.monotonic()
+        with self._lock:
+            self._counters['completed'] += 1
+            elapsed = now - admitted_at
+            if self._service_seconds is None:
+                self._service_seconds = elapsed
+            else:
+                self._service_seconds += 0.2 * (elapsed - self._service_seconds)
+
+            for lane in LANES:
+                queue = self._queues[lane]
+                while queue:
+                    waiter = queue.popleft()
+                    if waiter.deadline <= now:
+                        waiter.event.set()
+                        continue
+                    waiter.granted = True
+                    self._counters['admitted'] += 1
+                    waiter.event.set()
+                    return
+            self._active -= 1
+
+    def slot(self, lane='interactive', timeout=None):
+        return _Slot(self, lane, timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['rejected'] = dict(self._rejected)
+            stats['active'] = self._active
+            stats['queued'] = {lane: len(queue) for lane, queue in self._queues.items()}
+            service = self._service_seconds
+        stats['workers'] = self.workers
+        stats['max_queue'] = self.max_queue
+        stats['service_ms'] = round(service * 1000.0, 2) if service is not None else None
+        stats['wait_ms'] = self.wait_ms.snapshot()
+        return stats
+
+
+class _Slot:
+    __slots__ = ('controller', 'lane', 'timeout', 'admitted_at')
+
+    def __init__(self, controller, lane, timeout):
+        self.controller = controller
+        self.lane = lane
+        self.timeout = timeout
+
+    def __enter__(self):
+        self.admitted_at = self.controller.acquire(self.lane, self.timeout)
+        return self
+
+    def __exit__(self, *exc):
+        self.controller.release(self.admitted_at)
+        return False
@@ -1,10 +1,44 @@
-from flask import Flask, request, jsonify, render_template
+from config.settings import SOCKETIO
+from realtime import patch_for_async_mode
+
+# Event-loop modes must patch the standard library before anything else loads
+patch_for_async_mode(SOCKETIO['async_mode'])
+
+from flask import Flask, Response, abort, g, request, jsonify, render_template, send_file, stream_with_context
 from flask_cors import CORS
 import socketio
 from datetime import datetime
-from transformers import pipeline
-import torch
+import base64
+import hmac
 import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import TimeoutError as InferenceTimeout
+from contextlib import nullcontext
+
+from admission import AdmissionController, Rejected, available_cores, plan_capacity
+from audio_ingest import AudioIngest, IngestBusy, build_recognizer, parse_wav_header
+from chunking import best_label, classify_long_texts, score_long_texts, tag_long_texts
+from config.settings import (
+    ADMIN, ADMISSION, AUDIO_INGEST, CHUNKING, INFERENCE_BACKEND, INFERENCE_BATCHING, MEMORY_DIAGNOSTICS, MESSAGE_STORE,
+    METRICS, MODEL_LOADING, MODEL_MANAGER, MODELS, NOTE_REVISIONS, RESPONSE_ENCODING, RESULT_CACHE, SPEECH_POOL, SPEECH_RECOGNITION
+)
+from encoding import NDJSON, choose_encoding, choose_format, compress, ndjson_chunks, serialize
+from inference_backends import build_pipeline
+from inference_batcher import InferenceBatcher
+from memory_diagnostics import MemoryDiagnostics, process_memory, rss_bytes
+from message_store import MessageStore, parse_since
+from metrics import REGISTRY, STAGE_BUCKETS_SECONDS, Trace, stage, tracing
+from model_manager import ModelManager, SwapError, read_replay_notes
+from model_registry import ModelRegistry
+from note_revisions import NoteRevisions
+from result_cache import ResultCache, make_key
+from realtime import LOBBY_ROOM, RoomBroadcaster, build_pubsub, encounter_room
+from soap_stream import SoapStreamSession
+from speech_pool import PoolExhausted, SpeechProcessorPool
+from vocabulary import shared_vocabulary
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,38 +47,434 @@ logger = logging.getLogger(__name__)
 # Initialize Flask and Socket.IO
 app = Flask(__name__)
 CORS(app)
-sio = socketio.Server(cors_allowed_origins='*', async_mode='threading')
+sio = socketio.Server(cors_allowed_origins='*', async_mode=SOCKETIO['async_mode'])
 app.wsgi_app = socketio.WSGIApp(sio, app.wsgi_app)
 
+# Size the inference slots and torch's thread pool to the cores together
+inference_workers, torch_threads = plan_capacity(
+    available_cores(),
+    ADMISSION['workers'],
+    ADMISSION['torch_threads'],
+    batching=INFERENCE_BATCHING['enabled']
+)
+
 # Initialize AI models
-logger.info("Loading AI models...")
-try:
-    # Medical text classification
-    classifier = pipeline(
+def inference_device():
+    """Use the first GPU when there is one"""
+    import torch
+    torch.set_num_threads(torch_threads)
+    return 0 if torch.cuda.is_available() else -1
+
+def load_classifier(model_id=None):
+    """Medical text classification"""
+    return build_pipeline(
         "text-classification",
-        model="emilyalsentzer/Bio_ClinicalBERT",
-        tokenizer="emilyalsentzer/Bio_ClinicalBERT",
-        device=0 if torch.cuda.is_available() else -1
+        model_id or MODELS['classifier'],
+        backend=INFERENCE_BACKEND['backend'],
+        cache_dir=INFERENCE_BACKEND['cache_dir'],
+        device=inference_device()
     )
-    
-    # Medical NER (Named Entity Recognition)
-    ner = pipeline(
+
+def load_ner(model_id=None):
+    """Medical NER (Named Entity Recognition)"""
+    return build_pipeline(
         "ner",
-        model="d4data/biomedical-ner-all",
-        tokenizer="d4data/biomedical-ner-all",
+        model_id or MODELS['ner'],
+        backend=INFERENCE_BACKEND['backend'],
+        cache_dir=INFERENCE_BACKEND['cache_dir'],
         aggregation_strategy="simple",
-        device=0 if torch.cuda.is_available() else -1
+        device=inference_device()
     )
-    
-    logger.info("AI models loaded successfully")
-except Exception as e:
-    logger.error(f"Error loading AI models: {e}")
-    classifier = None
-    ner = None
 
-# Store messages and transcriptions in memory
-messages = []
-transcriptions = []
+# Models load in the background (or on first use) so the server binds immediately
+models = ModelRegistry(mode=MODEL_LOADING['mode'])
+models.register('classifier', load_classifier, version=MODELS['classifier'])
+models.register('ner', load_ner, version=MODELS['ner'])
+
+def load_speech_processor():
+    """spaCy and zero-shot models for dictation"""
+    from speech_processor import SpeechProcessor
+    return SpeechProcessor()
+
+# Dictation models are only needed once somebody starts dictating
+speech_models = ModelRegistry(mode=MODEL_LOADING['speech_mode'])
+speech_models.register('speech_processor', load_speech_processor)
+
+def cascade_stats():
+    """Which tier classified the dictated sentences; None until the speech models load"""
+    processor = speech_models.get('speech_processor')
+    return processor.cascade_stats() if processor else None
+
+def group_entities(entities):
+    """Group NER output by entity type"""
+    grouped_entities = {}
+    for entity in entities:
+        entity_type = entity['entity_group']
+        if entity_type not in grouped_entities:
+            grouped_entities[entity_type] = []
+        grouped_entities[entity_type].append(entity['word'])
+    return grouped_entities
+
+def chunking_options(batch_size):
+    return {
+        'max_tokens': CHUNKING['max_tokens'],
+        'overlap_tokens': CHUNKING['overlap_tokens'],
+        'batch_size': max(batch_size, CHUNKING['batch_size'])
+    }
+
+def classify_with(classifier, texts):
+    return classify_long_texts(classifier, texts, **chunking_options(len(texts)))
+
+def tag_with(ner, texts):
+    return tag_long_texts(ner, texts, **chunking_options(len(texts)))
+
+def run_models(texts):
+    """Label scores and raw entities for each text; None for a model that is not loaded"""
+    classifier = models.get('classifier')
+    ner = models.get('ner')
+    scores = entities = None
+
+    if classifier:
+        # Classify medical conditions; long notes are scored window by window
+        started = time.perf_counter()
+        with stage('analyze.classifier'):
+            scores = score_long_texts(classifier, texts, **chunking_options(len(texts)))
+        model_manager.shadow('classifier', texts, [best_label(item) for item in scores],
+                             time.perf_counter() - started)
+
+    if ner:
+        # Extract medical entities across overlapping windows
+        started = time.perf_counter()
+        with stage('analyze.ner'):
+            entities = tag_with(ner, texts)
+        model_manager.shadow('ner', texts, entities, time.perf_counter() - started)
+
+    return scores, entities
+
+def inference_result(scores, entities):
+    """The analyze response fields for one text"""
+    result = {}
+    if scores is not None:
+        result['classification'] = [best_label(scores)]
+    if entities is not None:
+        result['entities'] = group_entities(entities)
+    return result
+
+def run_inference_batch(texts):
+    """Run the classifier and NER pipelines over a batch of texts"""
+    scores, entities = run_models(texts)
+    return [
+        inference_result(scores[index] if scores is not None else None,
+                         entities[index] if entities is not None else None)
+        for index in range(len(texts))
+    ]
+
+def run_inference_jobs(jobs):
+    """Batcher entry point: ('note', text) jobs get analyze results, ('sentences', texts) jobs (scores, entities)"""
+    texts = []
+    for kind, payload in jobs:
+        texts.extend([payload] if kind == 'note' else payload)
+    scores, entities = run_models(texts)
+
+    results = []
+    start = 0
+    for kind, payload in jobs:
+        end = start + (1 if kind == 'note' else len(payload))
+        job_scores = scores[start:end] if scores is not None else None
+        job_entities = entities[start:end] if entities is not None else None
+        if kind == 'note':
+            results.append(inference_result(job_scores[0] if job_scores else None,
+                                            job_entities[0] if job_entities else None))
+        else:
+            results.append((job_scores, job_entities))
+        start = end
+    return results
+
+# New model versions are loaded, warmed and shadowed next to the live ones before they replace them
+model_manager = ModelManager(
+    models,
+    loaders={'classifier': load_classifier, 'ner': load_ner},
+    runners={'classifier': classify_with, 'ner': tag_with},
+    replay_notes=read_replay_notes(MODEL_MANAGER['replay_path']) if MODEL_MANAGER['replay_path'] else (),
+    recent_notes=MODEL_MANAGER['recent_notes'],
+    warmup_passes=MODEL_MANAGER['warmup_passes'],
+    batch_size=INFERENCE_BATCHING['max_batch_size'],
+    shadow_fraction=MODEL_MANAGER['shadow_fraction'],
+    shadow_samples=MODEL_MANAGER['shadow_samples'],
+    shadow_timeout=MODEL_MANAGER['shadow_timeout'],
+    min_agreement=MODEL_MANAGER['min_agreement'],
+    max_latency_ratio=MODEL_MANAGER['max_latency_ratio'],
+    auto_promote=MODEL_MANAGER['auto_promote'],
+    memory_cap_bytes=MODEL_MANAGER['memory_cap_bytes']
+)
+
+# Collect concurrent analyze requests into batches
+batcher = None
+if INFERENCE_BATCHING['enabled']:
+    batcher = InferenceBatcher(
+        run_inference_jobs,
+        max_batch_size=INFERENCE_BATCHING['max_batch_size'],
+        max_wait_ms=INFERENCE_BATCHING['max_wait_ms']
+    )
+
+# Admit a bounded number of requests to inference; interactive ones go first
+admission = None
+if ADMISSION['enabled']:
+    admission = AdmissionController(
+        inference_workers,
+        max_queue=ADMISSION['max_queue'],
+        lane_limits={'bulk': ADMISSION['bulk_max_queue']},
+        default_timeout=ADMISSION['queue_timeout'],
+        min_retry_after=ADMISSION['min_retry_after']
+    )
+
+def request_lane():
+    priority = request.headers.get(ADMISSION['priority_header']) or request.args.get('priority') or ''
+    return 'bulk' if priority.lower() == 'bulk' else 'interactive'
+
+def request_timeout():
+    """Queue budget for this request: the client's deadline, capped at the configured timeout"""
+    try:
+        budget = float(request.headers[ADMISSION['deadline_header']]) / 1000.0
+    except (KeyError, ValueError):
+        return ADMISSION['queue_timeout']
+    return max(0.0, min(budget, ADMISSION['queue_timeout']))
+
+def admission_slot():
+    """Hold an inference slot for the block; raises Rejected when the request is shed"""
+    if admission is None:
+        return nullcontext()
+    return admission.slot(request_lane(), request_timeout())
+
+# Cache inference results so re-submitted notes skip the transformers
+result_cache = None
+if RESULT_CACHE['enabled']:
+    result_cache = ResultCache(
+        RESULT_CACHE['max_bytes'],
+        RESULT_CACHE['ttl_seconds'],
+        disk_path=RESULT_CACHE['disk_path'],
+        disk_max_bytes=RESULT_CACHE['disk_max_bytes'],
+        disk_prune_every=RESULT_CACHE['disk_prune_every']
+    )
+
+def model_identity():
+    """Describe the loaded models so cached results are never reused across them"""
+    return '|'.join(
+        f"{models.version(name)}@{INFERENCE_BACKEND['backend']}" if models.get(name) else '-'
+        for name in ('classifier', 'ner')
+    )
+
+def run_inference(text):
+    """Classify and tag a single text, consulting the result cache first"""
+    if not (models.get('classifier') or models.get('ner')):
+        return {}
+
+    key = make_key(text, model_identity()) if result_cache else None
+    if key:
+        with stage('analyze.cache_lookup'):
+            cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+
+    if batcher:
+        inference = batcher.submit(('note', text), timeout=INFERENCE_BATCHING['request_timeout'])
+    else:
+        inference = run_inference_batch([text])[0]
+
+    if key:
+        result_cache.put(key, inference)
+    return inference
+
+# SOAP keyword vocabulary, compiled once and shared with SpeechProcessor
+vocabulary = shared_vocabulary()
+
+def run_sentence_models(sentences):
+    """Label scores and raw entities for each sentence, on the batcher thread when batching is on"""
+    if batcher:
+        return batcher.submit(('sentences', list(sentences)), timeout=INFERENCE_BATCHING['request_timeout'])
+    return run_models(sentences)
+
+def analyze_revision(note_id, text):
+    """Analyze an edited note, re-running the models only on the sentences that changed"""
+    revision = revisions.analyze(note_id, text, model_identity(), vocabulary.current())
+    results = {}
+    if revision.scores:
+        results['classification'] = [best_label(revision.scores)]
+    if models.get('ner'):
+        results['entities'] = group_entities(revision.entities)
+    results['soap'] = revision.soap
+    results['revision'] = dict(revision.changes, note_id=note_id)
+    return results
+
+def wait_for_models():
+    """Apply the configured not-ready policy; True when the models can be used"""
+    if models.is_ready():
+        return True
+    if MODEL_LOADING['not_ready_policy'] == 'wait':
+        return models.wait_until_ready(MODEL_LOADING['wait_timeout'])
+    # Lazy registries still need a first caller to trigger loading
+    models.load_in_background()
+    return False
+
+def models_not_ready():
+    response = jsonify({'error': 'AI models are still loading', 'state': models.state})
+    response.headers['Retry-After'] = str(MODEL_LOADING['retry_after'])
+    return response, 503
+
+# Store messages and transcriptions in SQLite with retention limits
+store = MessageStore(
+    MESSAGE_STORE['path'],
+    max_rows=MESSAGE_STORE['max_rows'],
+    max_age_days=MESSAGE_STORE['max_age_days']
+)
+
+# Opt-in allocation tracing; /api/admin/memory reports process memory either way
+memory_diagnostics = None
+if MEMORY_DIAGNOSTICS['enabled']:
+    memory_diagnostics = MemoryDiagnostics(
+        interval=MEMORY_DIAGNOSTICS['interval'],
+        frames=MEMORY_DIAGNOSTICS['frames'],
+        top=MEMORY_DIAGNOSTICS['top'],
+        history=MEMORY_DIAGNOSTICS['history'],
+        key_type=MEMORY_DIAGNOSTICS['key_type']
+    )
+    memory_diagnostics.start()
+
+def after_fork():
+    """Give a forked worker its own database connections (see prefork_server.py)"""
+    store.after_fork()
+    if result_cache:
+        result_cache.after_fork()
+    if memory_diagnostics:
+        memory_diagnostics.after_fork()
+
+# Request latency for /metrics, plus an opt-in Server-Timing stage breakdown
+RESPONSE_BYTE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+compression_levels = {'gzip': RESPONSE_ENCODING['gzip_level'], 'br': RESPONSE_ENCODING['brotli_quality']}
+
+def respond(payload, status=200, stage_name=None):
+    """Serialize payload as JSON or MessagePack, whichever the client's Accept prefers"""
+    media_type = choose_format(request.accept_mimetypes)
+    with stage(stage_name or f'{request.endpoint}.serialize'):
+        body = serialize(payload, media_type)
+    response = Response(body, status=status, mimetype=media_type)
+    response.vary.add('Accept')
+    return response
+
+def wants_ndjson():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == NDJSON
+
+def stream_ndjson(records, flush_every=1):
+    """Stream records as NDJSON, compressed on the fly, counting the bytes sent"""
+    endpoint = request.endpoint
+    encoding = choose_encoding(request.accept_encodings)
+
+    def generate():
+        sent = 0
+        try:
+            for chunk in ndjson_chunks(records, encoding, compression_levels, flush_every):
+                sent += len(chunk)
+                yield chunk
+        finally:
+            response_bytes.labels(endpoint, encoding or 'identity').observe(sent)
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON)
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+request_seconds = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', STAGE_BUCKETS_SECONDS, ('endpoint',)
+)
+requests_total = REGISTRY.counter('http_requests_total', 'HTTP requests served', ('endpoint', 'status'))
+response_bytes = REGISTRY.histogram(
+    'http_response_bytes', 'Response body bytes on the wire', RESPONSE_BYTE_BUCKETS, ('endpoint', 'encoding')
+)
+
+# Existing /api/status counters, read at scrape time
+REGISTRY.gauge('process_resident_memory_bytes', 'Resident set size of this process', rss_bytes)
+REGISTRY.gauge('models_ready', 'Whether every model finished loading', lambda: int(models.is_ready()))
+REGISTRY.gauge('inference_queue_depth', 'Texts waiting for an inference batch',
+               lambda: batcher.stats()['queue_depth'] if batcher else None)
+REGISTRY.gauge('admission_active', 'Requests holding an inference slot',
+               lambda: admission.stats()['active'] if admission else None)
+REGISTRY.gauge('admission_queued', 'Requests waiting for an inference slot, by lane',
+               lambda: admission.stats()['queued'] if admission else None)
+REGISTRY.gauge('admission_rejected', 'Requests shed by admission control, by reason',
+               lambda: admission.stats()['rejected'] if admission else None)
+REGISTRY.gauge('result_cache', 'Result cache counters', lambda: result_cache.stats() if result_cache else None)
+REGISTRY.gauge('note_revisions', 'Sentence reuse across note revisions',
+               lambda: revisions.stats() if revisions else None)
+REGISTRY.gauge('soap_cascade_sentences', 'Dictated sentences classified by each tier',
+               lambda: (cascade_stats() or {}).get('tiers'))
+REGISTRY.gauge('speech_sessions', 'Dictation sessions holding a speech processor',
+               lambda: speech_pool.stats()['active'])
+REGISTRY.gauge('audio_ingest', 'Audio ingestion counters', lambda: audio_ingest.stats())
+REGISTRY.gauge('realtime', 'Room broadcaster counters', lambda: broadcaster.stats())
+
+@app.before_request
+def start_request_trace():
+    g.request_started = time.perf_counter()
+    sampled = METRICS['trace_sample_rate'] and random.random() < METRICS['trace_sample_rate']
+    if METRICS['trace_header'] in request.headers or sampled:
+        g.trace = Trace()
+        g.tracing = tracing([g.trace])
+        g.tracing.__enter__()
+
+def stop_request_trace():
+    active = g.pop('tracing', None)
+    if active is not None:
+        active.__exit__(None, None, None)
+
+@app.after_request
+def finish_request_trace(response):
+    endpoint = request.endpoint or 'unmatched'
+    request_seconds.labels(endpoint).observe(time.perf_counter() - g.request_started)
+    requests_total.labels(endpoint, str(response.status_code)).inc()
+    stop_request_trace()
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        if METRICS['trace_header'] not in request.headers:
+            logger.info(f'Trace {request.method} {request.path}: {trace.breakdown()}')
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress large bodies for clients that accept it and count the bytes sent"""
+    endpoint = request.endpoint or 'unmatched'
+    if response.is_streamed or response.direct_passthrough:
+        # Streams compress and count themselves (see stream_ndjson)
+        return response
+    encoding = response.headers.get('Content-Encoding')
+    if (encoding is None and response.status_code not in (204, 304)
+            and response.content_length is not None
+            and response.content_length >= RESPONSE_ENCODING['compress_min_bytes']):
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding:
+            with stage(f'{endpoint}.compress'):
+                response.set_data(compress(response.get_data(), encoding, compression_levels))
+            response.headers['Content-Encoding'] = encoding
+    response_bytes.labels(endpoint, encoding or 'identity').observe(response.content_length or 0)
+    return response
+
+@app.teardown_request
+def drop_request_trace(error=None):
+    # Never leave a trace active on a pooled thread, whatever happened
+    stop_request_trace()
+
+@app.errorhandler(Rejected)
+def shed_request(error):
+    response = jsonify({'error': str(error), 'reason': error.reason})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -54,23 +484,161 @@ def index():
 def handle_messages():
     if request.method == 'POST':
         data = request.get_json()
-        message = {
-            'message': data['message'],
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        messages.append(message)
+        store.add('message', {'message': data['message']})
         return jsonify({'status': 'success'})
-    return jsonify({'messages': messages})
+
+    # Page through history with ?after=<id> or ?since=<timestamp>; the
+    # default is the most recent page
+    try:
+        limit = min(int(request.args.get('limit', MESSAGE_STORE['page_size'])),
+                    MESSAGE_STORE['max_page_size'])
+        after = request.args.get('after')
+        if after is not None:
+            if not after.isdecimal():
+                raise ValueError('after must be a non-negative message id')
+            after = int(after)
+        since = request.args.get('since')
+        since = parse_since(since) if since else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if wants_ndjson():
+        # The whole history from the cursor on, read a page at a time
+        return stream_ndjson(
+            store.iterate('message', after=after, since=since, page_size=MESSAGE_STORE['max_page_size']),
+            flush_every=RESPONSE_ENCODING['ndjson_flush_records']
+        )
+
+    messages, next_cursor, has_more = store.page(
+        'message', after=after, since=since, limit=max(limit, 1)
+    )
+    return respond({
+        'messages': messages,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    })
 
 @app.route('/api/status')
 def get_status():
     return jsonify({
         'status': 'online',
         'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'messages_count': len(messages),
-        'ml_models_loaded': all(model is not None for model in [classifier, ner])
+        'messages_count': store.count('message'),
+        'live': True,
+        'ready': models.is_ready(),
+        'ml_models_loaded': models.all_loaded(),
+        'models': models.stats(),
+        'inference_batching': batcher.stats() if batcher else None,
+        'admission': admission.stats() if admission else None,
+        'result_cache': result_cache.stats() if result_cache else None,
+        'note_revisions': revisions.stats() if revisions else None,
+        'audio_ingest': audio_ingest.stats(),
+        'soap_cascade': cascade_stats(),
+        'speech_pool': speech_pool.stats(),
+        'vocabulary': vocabulary.stats(),
+        'realtime': broadcaster.stats()
     })
 
+@app.route('/api/revisions/<note_id>', methods=['DELETE'])
+def forget_revisions(note_id):
+    """Drop the sentence results kept for a note"""
+    if not revisions:
+        return jsonify({'error': 'Note revisions are disabled'}), 404
+    return jsonify({'note_id': note_id, 'forgotten': revisions.forget(note_id)})
+
+def require_admin():
+    """Abort with 403 unless the request carries the admin token (or, without one, comes from this host)"""
+    if ADMIN['token']:
+        if not hmac.compare_digest(request.headers.get(ADMIN['token_header'], ''), ADMIN['token']):
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+
+@app.route('/api/admin/memory')
+def memory_report():
+    require_admin()
+    report = process_memory()
+    report['diagnostics'] = memory_diagnostics.report() if memory_diagnostics else None
+    return jsonify(report)
+
+@app.route('/api/admin/memory/snapshot', methods=['GET', 'POST'])
+def memory_snapshot():
+    """POST diffs a snapshot against the previous one now; GET downloads a snapshot file"""
+    require_admin()
+    if not memory_diagnostics:
+        return jsonify({'error': 'Memory diagnostics are off; set MEMORY_DIAGNOSTICS=true'}), 404
+    if request.method == 'POST':
+        return jsonify(memory_diagnostics.sample())
+    path = memory_diagnostics.dump()
+    response = send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=os.path.basename(path))
+    response.call_on_close(lambda: os.remove(path))
+    return response
+
+@app.route('/api/admin/models')
+def model_versions():
+    require_admin()
+    return jsonify(model_manager.stats())
+
+@app.route('/api/admin/models/<name>', methods=['POST'])
+def stage_model(name):
+    """Load a new version of a model next to the live one; it replaces it once warmed (and shadowed)"""
+    require_admin()
+    data = request.get_json(silent=True) or {}
+    if not data.get('model'):
+        return jsonify({'error': 'No model provided'}), 400
+    if name not in model_manager.loaders:
+        return jsonify({'error': f"Unknown model '{name}'"}), 404
+    if not models.is_ready():
+        return models_not_ready()
+    try:
+        shadow_fraction = float(data['shadow_fraction']) if 'shadow_fraction' in data else None
+        candidate = model_manager.stage(name, data['model'], shadow_fraction, data.get('auto_promote'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except SwapError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(candidate.describe()), 202
+
+@app.route('/api/admin/models/<name>/promote', methods=['POST'])
+def promote_model(name):
+    require_admin()
+    try:
+        return jsonify(model_manager.promote(name).describe())
+    except SwapError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/admin/models/<name>/candidate', methods=['DELETE'])
+def discard_model(name):
+    require_admin()
+    try:
+        return jsonify(model_manager.discard(name).describe())
+    except SwapError as e:
+        return jsonify({'error': str(e)}), 409
+
+@app.route('/api/health/live')
+def liveness():
+    return jsonify({'live': True})
+
+@app.route('/api/health/ready')
+def readiness():
+    if not models.is_ready():
+        return models_not_ready()
+    return jsonify({'ready': True, 'ml_models_loaded': models.all_loaded()})
+
+def analyze_note(text, note_id=None):
+    """Classify, tag and SOAP-organize one note; the caller holds an inference slot"""
+    model_manager.record(text)
+    if note_id is not None and revisions:
+        return analyze_revision(str(note_id), text)
+    results = run_inference(text)
+
+    # Organize into SOAP format
+    with stage('analyze.soap'):
+        soap_analysis = analyze_soap(text, results.get('entities', {}))
+    results['soap'] = soap_analysis
+    return results
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_text():
     if not request.is_json:
@@ -82,41 +650,92 @@ def analyze_text():
     if not text:
         return jsonify({'error': 'No text provided'}), 400
 
-    try:
-        results = {}
-        
-        if classifier:
-            # Classify medical conditions
-            classification = classifier(text)
-            results['classification'] = classification
-
-        if ner:
-            # Extract medical entities
-            entities = ner(text)
-            # Group entities by type
-            grouped_entities = {}
-            for entity in entities:
-                entity_type = entity['entity_group']
-                if entity_type not in grouped_entities:
-                    grouped_entities[entity_type] = []
-                grouped_entities[entity_type].append(entity['word'])
-            results['entities'] = grouped_entities
-
-        # Organize into SOAP format
-        soap_analysis = analyze_soap(text, results.get('entities', {}))
-        results['soap'] = soap_analysis
+    if not wait_for_models():
+        return models_not_ready()
 
-        return jsonify({
-            'status': 'success',
-            'analysis': results
-        })
+    with admission_slot():
+        try:
+            results = analyze_note(text, data.get('note_id'))
+        except InferenceTimeout:
+            logger.error("Timed out waiting for inference batch")
+            return jsonify({'error': 'Inference timed out'}), 504
+        except Exception as e:
+            logger.error(f"Error processing text: {e}")
+            return jsonify({'error': str(e)}), 500
 
-    except Exception as e:
-        logger.error(f"Error processing text: {e}")
-        return jsonify({'error': str(e)}), 500
+    # Serialization does not need the slot
+    return respond({
+        'status': 'success',
+        'analysis': results
+    }, stage_name='analyze.serialize')
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many notes, streaming one NDJSON line per note as each finishes
+
+    Each note is admitted separately in the bulk lane, so a long batch never
+    holds a slot that interactive requests are waiting for.
+    """
+    if not request.is_json:
+        return jsonify({'error': 'Invalid request format'}), 400
+    notes = request.get_json().get('notes')
+    if not isinstance(notes, list) or not notes:
+        return jsonify({'error': 'Provide notes as a list of {"id", "text"} objects or strings'}), 400
+    if len(notes) > RESPONSE_ENCODING['batch_max_notes']:
+        return jsonify({'error': f"At most {RESPONSE_ENCODING['batch_max_notes']} notes per batch"}), 413
+    if not wait_for_models():
+        return models_not_ready()
+
+    def results():
+        for position, note in enumerate(notes):
+            if not isinstance(note, dict):
+                note = {'text': note}
+            note_id = note.get('id', position)
+            text = note.get('text')
+            if not text or not isinstance(text, str):
+                yield {'id': note_id, 'status': 'error', 'error': 'No text provided'}
+                continue
+            try:
+                slot = admission.slot('bulk', request_timeout()) if admission else nullcontext()
+                with slot:
+                    analysis = analyze_note(text, note.get('note_id'))
+            except Rejected as e:
+                yield {'id': note_id, 'status': 'rejected', 'error': str(e), 'retry_after': e.retry_after}
+                continue
+            except InferenceTimeout:
+                yield {'id': note_id, 'status': 'error', 'error': 'Inference timed out'}
+                continue
+            except Exception as e:
+                logger.error(f"Error processing batch note {note_id}: {e}")
+                yield {'id': note_id, 'status': 'error', 'error': str(e)}
+                continue
+            yield {'id': note_id, 'status': 'success', 'analysis': analysis}
+
+    return stream_ndjson(results())
 
-def analyze_soap(text, entities):
-    """Analyze text and organize into SOAP format using extracted entities"""
+def soap_lines(index, text):
+    """(section, line) for every sentence of text that the vocabulary places"""
+    lines = []
+    for sentence in text.split('.'):
+        sentence = sentence.lower().strip()
+        if not sentence:
+            continue
+
+        # One pass over the sentence scores every section and plan sub-category
+        match = index.classify(sentence)
+        if match.section is None:
+            continue
+        if match.subcategory:
+            lines.append((match.section, index.label(match.subcategory) + ': ' + sentence + '. '))
+        else:
+            lines.append((match.section, sentence + '. '))
+    return lines
+
+def analyze_soap(text, entities, lines=None):
+    """Analyze text and organize into SOAP format using extracted entities
+
+    Pass lines from soap_lines() when the sentences were already placed.
+    """
     soap = {
         'subjective': '',
         'objective': '',
@@ -124,36 +743,6 @@ def analyze_soap(text, entities):
         'plan': ''
     }
     
-    # Enhanced medical terminology keywords
-    subjective_keywords = [
-        'feel', 'pain', 'symptom', 'complaint', 'report', 'patient states', 
-        'patient reports', 'experiencing', 'suffering from', 'noticed', 
-        'concerned about', 'worried about', 'feeling'
-    ]
-    
-    objective_keywords = [
-        'observe', 'measure', 'test', 'exam', 'vital', 'blood pressure', 
-        'temperature', 'heart rate', 'pulse', 'respiratory rate', 'oxygen', 
-        'saturation', 'weight', 'height', 'bmi', 'lab results', 'imaging', 
-        'x-ray', 'mri', 'ct scan', 'ultrasound', 'physical examination'
-    ]
-    
-    assessment_keywords = [
-        'diagnose', 'condition', 'finding', 'result', 'assessment', 
-        'impression', 'conclusion', 'differential diagnosis', 'ruled out', 
-        'confirmed', 'consistent with', 'indicative of', 'suggestive of'
-    ]
-    
-    plan_keywords = [
-        'treat', 'prescribe', 'follow-up', 'recommend', 'plan', 'medication', 
-        'therapy', 'dose', 'schedule', 'frequency', 'duration', 'refer', 
-        'referral', 'consult', 'consultation', 'monitor', 'monitoring', 
-        'lifestyle', 'diet', 'exercise', 'activity', 'rest', 'avoid', 
-        'precautions', 'instructions', 'education', 'counseling', 'return', 
-        'revisit', 'appointment', 'surgery', 'procedure', 'test', 'imaging',
-        'blood work', 'lab work', 'vaccination', 'immunization'
-    ]
-
     # Add medical entities to appropriate sections
     if entities:
         if 'SYMPTOM' in entities:
@@ -170,31 +759,10 @@ def analyze_soap(text, entities):
             soap['plan'] += 'Tests: ' + ', '.join(entities['TEST']) + '. '
 
     # Process text by sentences with improved context
-    sentences = text.split('.')
-    for sentence in sentences:
-        sentence = sentence.lower().strip()
-        if not sentence:
-            continue
-
-        # Check for plan-related content first
-        if any(keyword in sentence for keyword in plan_keywords):
-            # Additional context for plan classification
-            if any(word in sentence for word in ['prescribe', 'medication', 'drug', 'pill', 'tablet', 'capsule']):
-                soap['plan'] += 'Medication Plan: ' + sentence + '. '
-            elif any(word in sentence for word in ['follow-up', 'return', 'revisit', 'appointment']):
-                soap['plan'] += 'Follow-up Plan: ' + sentence + '. '
-            elif any(word in sentence for word in ['test', 'lab', 'imaging', 'scan', 'x-ray']):
-                soap['plan'] += 'Testing Plan: ' + sentence + '. '
-            elif any(word in sentence for word in ['lifestyle', 'diet', 'exercise', 'activity']):
-                soap['plan'] += 'Lifestyle Plan: ' + sentence + '. '
-            else:
-                soap['plan'] += sentence + '. '
-        elif any(keyword in sentence for keyword in subjective_keywords):
-            soap['subjective'] += sentence + '. '
-        elif any(keyword in sentence for keyword in objective_keywords):
-            soap['objective'] += sentence + '. '
-        elif any(keyword in sentence for keyword in assessment_keywords):
-            soap['assessment'] += sentence + '. '
+    if lines is None:
+        lines = soap_lines(vocabulary.current(), text)
+    for section, line in lines:
+        soap[section] += line
 
     # Clean up and format the output
     for key in soap:
@@ -204,21 +772,395 @@ def analyze_soap(text, entities):
 
     return soap
 
+# Notes resubmitted with a note_id keep their per-sentence results
+def revision_soap(text, entities, lines):
+    """The SOAP note for a revision, from its raw entities and placed sentence lines"""
+    with stage('analyze.soap'):
+        return analyze_soap(text, group_entities(entities) if models.get('ner') else {}, lines)
+
+revisions = None
+if NOTE_REVISIONS['enabled']:
+    revisions = NoteRevisions(
+        run_sentence_models,
+        soap_lines,
+        revision_soap,
+        max_notes=NOTE_REVISIONS['max_notes'],
+        ttl_seconds=NOTE_REVISIONS['ttl_seconds']
+    )
+
+models.start()
+speech_models.start()
+
+# Live dictation sessions, keyed by Socket.IO sid
+dictation_sessions = {}
+dictation_lock = threading.Lock()
+
+def speech_resources():
+    """The shared speech models, waiting for them to load; None if they are unavailable"""
+    speech_models.wait_until_ready(MODEL_LOADING['wait_timeout'])
+    processor = speech_models.get('speech_processor')
+    return processor.resources if processor else None
+
+def forget_dictation(key):
+    """Drop the state of a session the pool reaped; the pool takes its processor back"""
+    close_audio_stream(key, finish=False)
+    with dictation_lock:
+        dictation_sessions.pop(key, None)
+
+# Each session gets its own recognizer state on top of the shared models
+speech_pool = SpeechProcessorPool(
+    speech_resources,
+    max_sessions=SPEECH_POOL['max_sessions'],
+    idle_timeout=SPEECH_POOL['idle_timeout'],
+    on_reap=forget_dictation
+)
+
+def get_dictation_session(sid):
+    """Return the streaming session for a client, creating it on first use
+
+    Returns None when the speech models are unavailable and raises
+    PoolExhausted when every session slot is taken.
+    """
+    with dictation_lock:
+        session = dictation_sessions.get(sid)
+    if session is not None:
+        speech_pool.touch(sid)
+        return session
+
+    processor = speech_pool.checkout(sid)
+    if processor is None:
+        return None
+    with dictation_lock:
+        return dictation_sessions.setdefault(sid, SoapStreamSession(processor, sid))
+
+def require_dictation_session(sid):
+    """The client's session, or None after telling the client why there is none"""
+    try:
+        session = get_dictation_session(sid)
+    except PoolExhausted as e:
+        emit_dictation_error(sid, str(e))
+        return None
+    if session is None:
+        emit_dictation_error(sid, 'Speech models are not available')
+    return session
+
+def end_dictation_session(key):
+    """Forget a client's session and return its processor to the pool"""
+    with dictation_lock:
+        session = dictation_sessions.pop(key, None)
+    speech_pool.checkin(key)
+    return session
+
+def emit_dictation_error(sid, error):
+    sio.emit('dictation_error', {'error': error}, room=sid)
+
+def emit_soap_delta(sid, delta):
+    """Send only the sections that changed to the dictating client"""
+    if delta:
+        sio.emit('soap_delta', delta, room=sid)
+
+# Chat fan-out: coalesced per room, with backpressure for slow clients
+broadcaster = RoomBroadcaster(
+    sio,
+    build_pubsub(SOCKETIO['message_queue']),
+    flush_ms=SOCKETIO['flush_ms'],
+    max_batch=SOCKETIO['max_batch'],
+    max_in_flight=SOCKETIO['max_in_flight'],
+    max_backlog=SOCKETIO['max_backlog'],
+    ack_timeout=SOCKETIO['ack_timeout']
+)
+
 # Socket.IO event handlers
 @sio.event
 def connect(sid, environ):
     logger.info(f'Client connected: {sid}')
+    broadcaster.start()
+    sio.enter_room(sid, LOBBY_ROOM)
     sio.emit('connection_status', {'status': 'connected'}, room=sid)
 
 @sio.event
 def disconnect(sid):
     logger.info(f'Client disconnected: {sid}')
+    broadcaster.forget(sid)
+    close_audio_stream(sid, finish=False)
+    end_dictation_session(sid)
+
+@sio.on('join_encounter')
+def handle_join_encounter(sid, data):
+    encounter_id = (data or {}).get('encounter_id')
+    if not encounter_id:
+        return {'error': 'encounter_id is required'}
+    sio.enter_room(sid, encounter_room(encounter_id))
+    return {'status': 'joined', 'encounter_id': encounter_id}
+
+@sio.on('leave_encounter')
+def handle_leave_encounter(sid, data):
+    encounter_id = (data or {}).get('encounter_id')
+    if encounter_id:
+        sio.leave_room(sid, encounter_room(encounter_id))
+    return {'status': 'left', 'encounter_id': encounter_id}
 
 @sio.on('message')
 def handle_message(sid, data):
-    logger.info(f'Received message from {sid}: {data}')
-    sio.emit('message', data, broadcast=True)
+    logger.debug(f'Received message from {sid}: {data}')
+    # Messages tagged with an encounter only reach that encounter's room
+    encounter_id = data.get('encounter_id') if isinstance(data, dict) else None
+    broadcaster.publish(encounter_room(encounter_id) if encounter_id else LOBBY_ROOM, data)
+
+@sio.on('dictation_start')
+def handle_dictation_start(sid, data=None):
+    end_dictation_session(sid)
+    if require_dictation_session(sid) is None:
+        return
+    sio.emit('dictation_status', {'status': 'started'}, room=sid)
+
+@sio.on('transcript_chunk')
+def handle_transcript_chunk(sid, data):
+    session = require_dictation_session(sid)
+    if session is None:
+        return
+    data = data or {}
+    emit_soap_delta(sid, session.feed(data.get('text', ''), final=bool(data.get('final'))))
+
+@sio.on('dictation_end')
+def handle_dictation_end(sid, data=None):
+    finish_dictation(sid)
+
+def finish_dictation(sid):
+    """Flush the client's session, store the note and send it back"""
+    session = end_dictation_session(sid)
+    if session is None:
+        return
+    emit_soap_delta(sid, session.flush())
+    soap_notes = session.snapshot()
+    store.add('transcription', {'sid': sid, 'soap': soap_notes})
+    sio.emit('soap_notes', soap_notes, room=sid)
+
+# Streaming audio: utterances found by the VAD are recognized on a bounded pool
+audio_ingest = AudioIngest(
+    build_recognizer(
+        AUDIO_INGEST['recognizer'],
+        language=AUDIO_INGEST['language'],
+        timeout=AUDIO_INGEST['recognizer_timeout']
+    ),
+    workers=AUDIO_INGEST['workers'],
+    max_pending=AUDIO_INGEST['max_pending'],
+    vad_options={
+        'frame_ms': AUDIO_INGEST['frame_ms'],
+        'energy_threshold': SPEECH_RECOGNITION['energy_threshold'],
+        'dynamic_energy_threshold': SPEECH_RECOGNITION['dynamic_energy_threshold'],
+        'dynamic_energy_ratio': SPEECH_RECOGNITION['dynamic_energy_ratio'],
+        'dynamic_energy_damping': SPEECH_RECOGNITION['dynamic_energy_damping'],
+        'pause_threshold': SPEECH_RECOGNITION['pause_threshold'],
+        'min_speech_seconds': AUDIO_INGEST['min_speech_seconds'],
+        'max_segment_seconds': AUDIO_INGEST['max_segment_seconds'],
+        'pre_roll_seconds': AUDIO_INGEST['pre_roll_seconds'],
+    }
+)
+
+# Open audio streams, keyed by Socket.IO sid or ('http', stream id)
+audio_streams = {}
+audio_lock = threading.Lock()
+
+def open_audio_stream(key, session, on_delta, on_finished=None, audio_format='pcm', sample_rate=None):
+    """Start an audio stream whose transcripts feed a dictation session"""
+    def on_transcript(stream, index, text):
+        text = session.processor.post_process_medical_terms(text)
+        on_delta(index, text, session.feed(text, final=True))
+
+    stream = audio_ingest.open_stream(
+        key, on_transcript, on_finished,
+        audio_format=audio_format,
+        sample_rate=sample_rate or AUDIO_INGEST['sample_rate']
+    )
+    with audio_lock:
+        previous = audio_streams.pop(key, None)
+        audio_streams[key] = (stream, session)
+    if previous:
+        previous[0].close()
+    return stream
+
+def close_audio_stream(key, finish=True):
+    with audio_lock:
+        entry = audio_streams.pop(key, None)
+    if entry:
+        if not finish:
+            entry[0].on_finished = None
+        entry[0].close()
+    return entry
+
+def drop_idle_audio_streams():
+    """Forget HTTP streams whose uploader went away without finishing"""
+    cutoff = time.monotonic() - AUDIO_INGEST['idle_timeout']
+    with audio_lock:
+        idle = [key for key, (stream, _) in audio_streams.items()
+                if isinstance(key, tuple) and stream.last_activity < cutoff]
+    for key in idle:
+        close_audio_stream(key)
+        speech_pool.checkin(key)
+
+def decode_audio_chunk(data):
+    """Socket.IO clients may send raw binary or base64 text"""
+    audio = data.get('audio') if isinstance(data, dict) else data
+    if isinstance(audio, str):
+        return base64.b64decode(audio)
+    return bytes(audio or b'')
+
+@sio.on('audio_start')
+def handle_audio_start(sid, data=None):
+    data = data or {}
+    session = require_dictation_session(sid)
+    if session is None:
+        return
+
+    def on_delta(index, text, delta):
+        sio.emit('transcript', {'segment': index, 'text': text}, room=sid)
+        emit_soap_delta(sid, delta)
+
+    try:
+        open_audio_stream(
+            sid, session, on_delta,
+            on_finished=lambda stream: finish_dictation(sid),
+            audio_format=data.get('format', 'pcm'),
+            sample_rate=data.get('sample_rate')
+        )
+    except ValueError as e:
+        emit_dictation_error(sid, str(e))
+        return
+    sio.emit('audio_status', {'status': 'started'}, room=sid)
+
+@sio.on('audio_data')
+def handle_audio_data(sid, data):
+    """A whole WAV recording, cut into utterances and recognized on the ingest pool"""
+    session = require_dictation_session(sid)
+    if session is None:
+        return
+
+    def on_transcript(stream, index, text):
+        text = session.processor.post_process_medical_terms(text)
+        sio.emit('transcript', {'segment': index, 'text': text}, room=sid)
+        emit_soap_delta(sid, session.feed(text, final=True))
+
+    try:
+        audio = base64.b64decode(data['audio'])
+        if parse_wav_header(audio) is None:
+            raise ValueError('Incomplete WAV header')
+    except Exception as e:
+        logger.error(f'Could not decode audio from {sid}: {e}')
+        emit_dictation_error(sid, 'Audio must be base64-encoded 16-bit PCM WAV')
+        return
+    # A stream of its own, so it does not disturb one opened with audio_start
+    stream = audio_ingest.open_stream(sid, on_transcript, audio_format='wav')
+    try:
+        stream.write(audio)
+    except IngestBusy:
+        emit_dictation_error(sid, 'Speech recognition is busy, audio was dropped')
+    except ValueError as e:
+        emit_dictation_error(sid, str(e))
+    finally:
+        # The transcripts arrive from the pool once the utterances are recognized
+        stream.close()
+
+@sio.on('audio_chunk')
+def handle_audio_chunk(sid, data):
+    with audio_lock:
+        entry = audio_streams.get(sid)
+    if entry is None:
+        emit_dictation_error(sid, 'Send audio_start before audio_chunk')
+        return
+    try:
+        entry[0].write(decode_audio_chunk(data), data.get('seq') if isinstance(data, dict) else None)
+    except IngestBusy:
+        emit_dictation_error(sid, 'Speech recognition is busy, audio was dropped')
+    except ValueError as e:
+        close_audio_stream(sid)
+        emit_dictation_error(sid, str(e))
+
+@sio.on('audio_end')
+def handle_audio_end(sid, data=None):
+    # The note is sent once the last utterance has been transcribed
+    if close_audio_stream(sid) is None:
+        finish_dictation(sid)
+
+@app.route('/api/audio/<stream_id>', methods=['POST'])
+def ingest_audio(stream_id):
+    """Chunked audio upload; ?final=1 ends the stream and returns the SOAP note"""
+    key = ('http', stream_id)
+    final = request.args.get('final', '').lower() in ('1', 'true')
+    with audio_lock:
+        entry = audio_streams.get(key)
+
+    if entry is None:
+        drop_idle_audio_streams()
+        try:
+            processor = speech_pool.checkout(key)
+        except PoolExhausted as e:
+            response = jsonify({'error': str(e), 'stream_id': stream_id})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        if processor is None:
+            return jsonify({'error': 'Speech models are not available'}), 503
+        session = SoapStreamSession(processor, stream_id)
+        try:
+            stream = open_audio_stream(
+                key, session, lambda index, text, delta: None,
+                audio_format=request.args.get('format', 'pcm'),
+                sample_rate=request.args.get('sample_rate', type=int)
+            )
+        except ValueError as e:
+            speech_pool.checkin(key)
+            return jsonify({'error': str(e)}), 400
+    else:
+        stream, session = entry
+        speech_pool.touch(key)
+
+    # Read the body as it arrives so recognition starts before the upload ends
+    try:
+        while True:
+            chunk = request.stream.read(AUDIO_INGEST['read_size'])
+            if not chunk:
+                break
+            stream.write(chunk)
+    except IngestBusy:
+        response = jsonify({'error': 'Speech recognition is busy', 'stream_id': stream_id})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    except ValueError as e:
+        close_audio_stream(key)
+        speech_pool.checkin(key)
+        return jsonify({'error': str(e)}), 400
+
+    if not final:
+        return jsonify({'stream_id': stream_id, 'transcripts': list(stream.transcripts)}), 202
+
+    close_audio_stream(key)
+    finished = stream.wait(AUDIO_INGEST['finish_timeout'])
+    speech_pool.checkin(key)
+    if not finished:
+        return jsonify({'error': 'Transcription timed out', 'stream_id': stream_id}), 504
+    session.flush()
+    soap_notes = session.snapshot()
+    store.add('transcription', {'stream_id': stream_id, 'soap': soap_notes})
+    return jsonify({'stream_id': stream_id, 'transcripts': stream.transcripts, 'soap': soap_notes})
+
+def serve_event_loop(host, port):
+    """Serve with the eventlet or gevent server that matches the async mode"""
+    if SOCKETIO['async_mode'] == 'eventlet':
+        import eventlet
+        import eventlet.wsgi
+        eventlet.wsgi.server(eventlet.listen((host, port)), app)
+    else:
+        from gevent import pywsgi
+        try:
+            from geventwebsocket.handler import WebSocketHandler
+        except ImportError:
+            WebSocketHandler = None  # long-polling only
+        server_options = {'handler_class': WebSocketHandler} if WebSocketHandler else {}
+        pywsgi.WSGIServer((host, port), app, **server_options).serve_forever()
 
 if __name__ == '__main__':
     logger.info("Server starting at http://127.0.0.1:5000")
-    app.run(host='127.0.0.1', port=5000, debug=True) 
\ No newline at end of file
+    if SOCKETIO['async_mode'] != 'threading':
+        serve_event_loop('127.0.0.1', 5000)
+    else:
+        app.run(host='127.0.0.1', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,431 @@
+"""
+Streaming audio ingestion for live dictation.
+
+Clients send 16-bit PCM (raw, or WAV with the header at the start of the
+stream) in chunks of any size. An energy-based voice activity detector cuts
+the stream into utterances at pauses, using the SPEECH_RECOGNITION
+thresholds, and every finished utterance is transcribed on a bounded thread
+pool while the speaker keeps talking. Transcripts are delivered to the
+stream's callback in utterance order, on a pool thread, so a slow recognizer
+never holds up the thread that received the audio.
+
+Writes to a stream are serialized, since a server may receive one client's
+chunks on several threads at once. A client that numbers its chunks (seq 0,
+1, 2, ...) gets them fed in order whatever order they arrive in.
+"""
+
+import logging
+import math
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import observe_stage, stage
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBusy(Exception):
+    """Raised when the recognition queue is full; the caller should retry later"""
+
+
+def frame_rms(frame):
+    """Root-mean-square energy of little-endian 16-bit samples (audioop.rms scale)"""
+    samples = array('h', frame)
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+def parse_wav_header(data):
+    """Return (sample_rate, channels, sample_width, data_offset), or None if more bytes are needed"""
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError('Not a WAV stream')
+    offset = 12
+    audio_format = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = struct.unpack('<I', data[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b'data':
+            # Streamed WAVs often carry a placeholder data size, so it is ignored
+            if audio_format is None:
+                raise ValueError('WAV data chunk before its fmt chunk')
+            return audio_format + (body,)
+        if body + size > len(data):
+            return None
+        if chunk_id == b'fmt ':
+            encoding, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', data[body:body + 16])
+            if encoding not in (1, 0xFFFE):
+                raise ValueError('Only PCM WAV audio is supported')
+            audio_format = (sample_rate, channels, bits // 8)
+        offset = body + size + (size & 1)
+    return None
+
+
+class EnergyVAD:
+    """Splits a PCM stream into utterances separated by pauses
+
+    Frames louder than the energy threshold are speech. As in
+    speech_recognition, the threshold can follow the background noise level
+    while nobody is speaking. An utterance ends after ``pause_threshold``
+    seconds of quiet, or after ``max_segment_seconds`` so long monologues
+    are transcribed while they are still going.
+    """
+
+    def __init__(self, sample_rate, frame_ms=30, energy_threshold=300, dynamic_energy_threshold=True,
+                 dynamic_energy_ratio=1.5, dynamic_energy_damping=0.15, pause_threshold=0.8,
+                 min_speech_seconds=0.25, max_segment_seconds=10, pre_roll_seconds=0.3):
+        self.sample_rate = sample_rate
+        self.frame_seconds = frame_ms / 1000.0
+        self.frame_bytes = max(1, int(sample_rate * self.frame_seconds)) * 2
+        self.energy_threshold = float(energy_threshold)
+        self.dynamic_energy_threshold = dynamic_energy_threshold
+        self.dynamic_energy_ratio = dynamic_energy_ratio
+        self.damping = dynamic_energy_damping ** self.frame_seconds
+        self.pause_frames = max(1, math.ceil(pause_threshold / self.frame_seconds))
+        self.min_speech_frames = math.ceil(min_speech_seconds / self.frame_seconds)
+        self.max_frames = max(1, int(max_segment_seconds / self.frame_seconds))
+        self._buffer = bytearray()
+        # Quiet frames just before speech starts keep the first syllable intact
+        self._pre_roll = deque(maxlen=max(0, int(pre_roll_seconds / self.frame_seconds)))
+        self._speech = []
+        self._voiced = 0
+        self._silent = 0
+
+    def feed(self, pcm):
+        """Add PCM bytes and return the utterances they completed"""
+        self._buffer.extend(pcm)
+        segments = []
+        frame_bytes = self.frame_bytes
+        while len(self._buffer) >= frame_bytes:
+            frame = bytes(self._buffer[:frame_bytes])
+            del self._buffer[:frame_bytes]
+            segment = self._frame(frame)
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        """Return the utterance in progress at the end of the stream, if any"""
+        if self._buffer and self._speech:
+            self._speech.append(bytes(self._buffer))
+        self._buffer.clear()
+        return self._cut() if self._speech else None
+
+    def _frame(self, frame):
+        energy = frame_rms(frame)
+        if not self._speech:
+            if energy > self.energy_threshold:
+                self._speech = list(self._pre_roll)
+                self._speech.append(frame)
+                self._pre_roll.clear()
+                self._voiced, self._silent = 1, 0
+                return None
+            self._pre_roll.append(frame)
+            if self.dynamic_energy_threshold:
+                target = energy * self.dynamic_energy_ratio
+                self.energy_threshold = self.energy_threshold * self.damping + target * (1 - self.damping)
+            return None
+
+        self._speech.append(frame)
+        if energy > self.energy_threshold:
+            self._voiced += 1
+            self._silent = 0
+        else:
+            self._silent += 1
+        if self._silent >= self.pause_frames or len(self._speech) >= self.max_frames:
+            return self._cut()
+        return None
+
+    def _cut(self):
+        frames, voiced = self._speech, self._voiced
+        self._speech = []
+        self._voiced = self._silent = 0
+        if voiced < self.min_speech_frames:
+            return None
+        return b''.join(frames)
+
+
+class GoogleRecognizer:
+    """Google Web Speech API through speech_recognition (a network call)"""
+
+    def __init__(self, language='en-US', timeout=10):
+        import speech_recognition as sr
+        self._sr = sr
+        self.language = language
+        self.recognizer = sr.Recognizer()
+        self.recognizer.operation_timeout = timeout
+
+    def __call__(self, pcm, sample_rate):
+        audio = self._sr.AudioData(pcm, sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio, language=self.language)
+        except self._sr.UnknownValueError:
+            return ''
+
+
+class SphinxRecognizer(GoogleRecognizer):
+    """CMU Sphinx through speech_recognition; offline, needs pocketsphinx"""
+
+    def __call__(self, pcm, sample_rate):
+        audio = self._sr.AudioData(pcm, sample_rate, 2)
+        try:
+            return self.recognizer.recognize_sphinx(audio, language=self.language)
+        except self._sr.UnknownValueError:
+            return ''
+
+
+class OfflineRecognizer:
+    """Deterministic stand-in for tests and load runs; needs no network or models
+
+    Returns the scripted phrases in turn, or a placeholder naming the
+    utterance length. ``delay`` simulates recognition latency.
+    """
+
+    def __init__(self, phrases=None, delay=0.0, **kwargs):
+        self.phrases = list(phrases or [])
+        self.delay = delay
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, pcm, sample_rate):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            index = self._count
+            self._count += 1
+        if self.phrases:
+            return self.phrases[index % len(self.phrases)]
+        return f'utterance {index + 1} of {len(pcm) / 2 / sample_rate:.1f} seconds.'
+
+
+RECOGNIZERS = {
+    'google': GoogleRecognizer,
+    'sphinx': SphinxRecognizer,
+    'offline': OfflineRecognizer,
+}
+
+
+def build_recognizer(name, **kwargs):
+    if name not in RECOGNIZERS:
+        raise ValueError(f"Unknown recognizer '{name}', expected one of {tuple(RECOGNIZERS)}")
+    return RECOGNIZERS[name](**kwargs)
+
+
+class AudioIngest:
+    """Recognition pool shared by every audio stream"""
+
+    def __init__(self, recognizer, workers=2, max_pending=32, vad_options=None):
+        self.recognizer = recognizer
+        self.max_pending = max_pending
+        self.vad_options = dict(vad_options or {})
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognizer')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {'segments': 0, 'recognized': 0, 'failed': 0, 'rejected': 0}
+
+    def open_stream(self, stream_id, on_transcript, on_finished=None, audio_format='pcm', sample_rate=16000):
+        """Start a stream; callbacks run on pool threads"""
+        return AudioStream(self, stream_id, on_transcript, on_finished, audio_format, sample_rate)
+
+    def submit(self, pcm, sample_rate, force=False):
+        """Queue an utterance for recognition; raises IngestBusy when the queue is full"""
+        with self._lock:
+            if self._pending >= self.max_pending and not force:
+                self._counters['rejected'] += 1
+                raise IngestBusy('Speech recognition is saturated')
+            self._pending += 1
+            self._counters['segments'] += 1
+        future = self._executor.submit(self._recognize, pcm, sample_rate, time.monotonic())
+        future.add_done_callback(self._done)
+        return future
+
+    def _recognize(self, pcm, sample_rate, queued_at):
+        observe_stage('audio.queue_wait', time.monotonic() - queued_at)
+        with stage('audio.recognize'):
+            return self.recognizer(pcm, sample_rate)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._counters['failed' if future.exception() else 'recognized'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = self._pending
+        stats['max_pending'] = self.max_pending
+        return stats
+
+
+class AudioStream:
+    """One client's audio: VAD segmentation and in-order transcript delivery"""
+
+    # Chunks held back waiting for an earlier one before the stream gives up
+    max_reorder = 64
+
+    def __init__(self, ingest, stream_id, on_transcript, on_finished, audio_format, sample_rate):
+        if audio_format not in ('pcm', 'wav'):
+            raise ValueError("Audio format must be 'pcm' or 'wav'")
+        self.ingest = ingest
+        self.stream_id = stream_id
+        self.on_transcript = on_transcript
+        self.on_finished = on_finished
+        self.sample_rate = int(sample_rate)
+        self.channels = 1
+        # Bytes of a multi-channel frame split across writes
+        self._partial = b''
+        self.transcripts = []
+        self.last_activity = time.monotonic()
+        self._header = bytearray() if audio_format == 'wav' else None
+        self._vad = None if audio_format == 'wav' else EnergyVAD(self.sample_rate, **ingest.vad_options)
+        self._lock = threading.Lock()
+        # Held for the whole of a write, and by close() while it flushes the VAD
+        self._write_lock = threading.Lock()
+        self._next_seq = 0
+        self._held = {}
+        self._futures = {}
+        self._submitted = 0
+        self._delivered = 0
+        self._closed = False
+        self._redeliver = False
+        self._delivery_lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def write(self, chunk, seq=None):
+        """Add audio bytes; finished utterances are queued for recognition
+
+        With seq, chunks arriving early wait for the missing ones and repeats
+        are ignored. Raises ValueError when a chunk stays missing for more
+        than max_reorder later ones.
+        """
+        if seq is not None and (isinstance(seq, bool) or not isinstance(seq, int) or seq < 0):
+            raise ValueError('seq must be a non-negative integer')
+        with self._write_lock:
+            if self._closed:
+                # Audio that arrives after the end has nowhere to go
+                return
+            self.last_activity = time.monotonic()
+            if seq is None:
+                self._feed(chunk)
+                return
+            if seq < self._next_seq or seq in self._held:
+                return
+            self._held[seq] = chunk
+            while self._next_seq in self._held:
+                chunk = self._held.pop(self._next_seq)
+                self._next_seq += 1
+                self._feed(chunk)
+            if len(self._held) > self.max_reorder:
+                raise ValueError(f'Audio chunk {self._next_seq} never arrived')
+
+    def _feed(self, chunk):
+        # Caller holds self._write_lock
+        if self._header is not None:
+            chunk = self._read_header(chunk)
+            if chunk is None:
+                return
+        if self.channels > 1:
+            # Keep the first channel; the recognizers expect mono
+            chunk = self._partial + chunk
+            whole = len(chunk) - len(chunk) % (2 * self.channels)
+            self._partial = chunk[whole:]
+            chunk = array('h', chunk[:whole])[::self.channels].tobytes()
+        for segment in self._vad.feed(chunk):
+            self._submit(segment)
+
+    def close(self):
+        """End the stream; ``finished`` is set once every transcript is delivered"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        with self._write_lock:
+            # Chunks still waiting for a gap to fill are fed as they are
+            for seq in sorted(self._held):
+                try:
+                    self._feed(self._held[seq])
+                except (IngestBusy, ValueError) as e:
+                    logger.warning(f'Dropped audio of stream {self.stream_id} at close: {e}')
+            self._held.clear()
+            if self._vad is not None:
+                segment = self._vad.flush()
+                if segment:
+                    # The last utterance of a closing stream is always accepted
+                    self._submit(segment, force=True)
+        self._deliver()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def _read_header(self, chunk):
+        self._header.extend(chunk)
+        parsed = parse_wav_header(bytes(self._header))
+        if parsed is None:
+            if len(self._header) > 65536:
+                raise ValueError('WAV header not found in the first 64 KiB')
+            return None
+        self.sample_rate, self.channels, sample_width, data_offset = parsed
+        if sample_width != 2:
+            raise ValueError('Only 16-bit WAV audio is supported')
+        remainder = bytes(self._header[data_offset:])
+        self._header = None
+        self._vad = EnergyVAD(self.sample_rate, **self.ingest.vad_options)
+        return remainder
+
+    def _submit(self, segment, force=False):
+        future = self.ingest.submit(segment, self.sample_rate, force=force)
+        with self._lock:
+            index = self._submitted
+            self._submitted += 1
+            self._futures[index] = future
+        future.add_done_callback(lambda _: self._deliver())
+
+    def _deliver(self):
+        # Only one thread delivers at a time; others leave a note to look again
+        self._redeliver = True
+        while self._redeliver and self._delivery_lock.acquire(blocking=False):
+            try:
+                self._redeliver = False
+                self._deliver_ready()
+            finally:
+                self._delivery_lock.release()
+
+    def _deliver_ready(self):
+        while True:
+            with self._lock:
+                future = self._futures.get(self._delivered)
+                if future is None or not future.done():
+                    finished = self._closed and self._delivered == self._submitted
+                    break
+                del self._futures[self._delivered]
+                index = self._delivered
+                self._delivered += 1
+            try:
+                text = future.result()
+            except Exception as e:
+                logger.error(f'Recognition failed for stream {self.stream_id}: {e}')
+                continue
+            if text:
+                self.transcripts.append(text)
+                try:
+                    self.on_transcript(self, index, text)
+                except Exception:
+                    logger.exception(f'Transcript handler failed for stream {self.stream_id}')
+
+        if finished and not self.finished.is_set():
+            self.finished.set()
+            if self.on_finished:
+                try:
+                    self.on_finished(self)
+                except Exception:
+                    logger.exception(f'Finish handler failed for stream {self.stream_id}')
@@ -0,0 +1,234 @@
+"""
+Offline batch analysis of clinical notes.
+
+Streams notes from a JSONL file (one {"id": ..., "text": ...} object per
+line) or a directory of .txt files, analyzes them on a process pool where
+each worker loads the models once, and writes one JSON result per line in
+input order. A checkpoint file next to the output lets an interrupted run
+pick up where it stopped.
+
+Usage (from the backend directory):
+    python batch_analyze.py notes.jsonl --output results.jsonl --workers 8
+    python batch_analyze.py notes_dir/ --output results.jsonl --speech --resume
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+logger = logging.getLogger('batch_analyze')
+
+# Populated in each worker process by init_worker
+_app = None
+_speech = None
+
+
+def iter_jsonl(path):
+    """Yield records from a JSONL file, using the line number when id is missing"""
+    with open(path, encoding='utf-8') as handle:
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            yield {'id': record.get('id', line_number), 'text': record.get('text', '')}
+
+
+def iter_directory(path):
+    """Yield a record per .txt file; names are sorted so resumes see the same order"""
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.txt'):
+            continue
+        with open(os.path.join(path, name), encoding='utf-8') as handle:
+            yield {'id': name, 'text': handle.read()}
+
+
+def iter_records(path):
+    if os.path.isdir(path):
+        return iter_directory(path)
+    return iter_jsonl(path)
+
+
+def iter_chunks(records, size):
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def init_worker(use_speech, threads):
+    """Load the models once per worker process"""
+    global _app, _speech
+    # Workers process whole chunks themselves, so skip the server-side helpers
+    os.environ['MODEL_LOADING_MODE'] = 'eager'
+    os.environ['INFERENCE_BATCHING'] = 'False'
+    os.environ['RESULT_CACHE'] = 'False'
+    # app applies TORCH_THREADS when it loads the models; without it the server's plan would win
+    os.environ['TORCH_THREADS'] = str(threads)
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    import app
+    _app = app
+    if use_speech:
+        app.speech_models.load_all()
+        _speech = app.speech_models.get('speech_processor')
+
+
+def _json_default(obj):
+    if hasattr(obj, 'item'):
+        return obj.item()
+    return str(obj)
+
+
+def analyze_chunk(records):
+    """Analyze a chunk of records and return serialized JSONL lines"""
+    try:
+        return _analyze(records)
+    except Exception as e:
+        if len(records) == 1:
+            return [json.dumps({'id': records[0]['id'], 'error': str(e)})]
+        # Retry one by one so a single bad note does not sink its chunk
+        return [line for record in records for line in analyze_chunk([record])]
+
+
+def _analyze(records):
+    texts = [record['text'] for record in records]
+    inferences = _app.run_inference_batch(texts)
+    soap_notes = list(_speech.organize_many(texts)) if _speech else [None] * len(texts)
+    return [
+        _serialize(record, inference, speech_soap)
+        for record, inference, speech_soap in zip(records, inferences, soap_notes)
+    ]
+
+
+def _serialize(record, inference, speech_soap):
+    analysis = dict(inference)
+    analysis['soap'] = _app.analyze_soap(record['text'], analysis.get('entities', {}))
+    result = {'id': record['id'], 'analysis': analysis}
+    if speech_soap is not None:
+        result['speech_soap'] = speech_soap
+    return json.dumps(result, default=_json_default)
+
+
+class Checkpoint:
+    """Records how many input records are safely written and where the output ends"""
+
+    def __init__(self, output_path):
+        self.path = output_path + '.checkpoint'
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {'records': 0, 'offset': 0}
+        with open(self.path, encoding='utf-8') as handle:
+            return json.load(handle)
+
+    def save(self, records, offset):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump({'records': records, 'offset': offset}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.path)
+
+
+def run(args):
+    checkpoint = Checkpoint(args.output)
+    if args.resume:
+        state = checkpoint.load()
+    else:
+        state = {'records': 0, 'offset': 0}
+        checkpoint.save(0, 0)
+
+    output = open(args.output, 'ab' if args.resume else 'wb')
+    # Drop anything written after the last checkpoint; it will be redone
+    output.truncate(state['offset'])
+    output.seek(state['offset'])
+
+    records = iter_records(args.input)
+    if state['records']:
+        logger.info(f"Resuming after {state['records']} records")
+        records = islice(records, state['records'], None)
+
+    workers = args.workers or os.cpu_count() or 1
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    done = state['records']
+    chunks_since_checkpoint = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(args.speech, threads)
+    ) as pool:
+        # Keep a bounded window of chunks in flight so memory stays flat
+        in_flight = deque()
+        chunks = iter_chunks(records, args.chunk_size)
+        for chunk in chunks:
+            in_flight.append((len(chunk), pool.submit(analyze_chunk, chunk)))
+            if len(in_flight) < workers * args.prefetch:
+                continue
+            done, chunks_since_checkpoint = _drain_one(
+                in_flight, output, checkpoint, done, chunks_since_checkpoint, args
+            )
+        while in_flight:
+            done, chunks_since_checkpoint = _drain_one(
+                in_flight, output, checkpoint, done, chunks_since_checkpoint, args
+            )
+
+    output.flush()
+    os.fsync(output.fileno())
+    checkpoint.save(done, output.tell())
+    output.close()
+
+    elapsed = time.monotonic() - started
+    processed = done - state['records']
+    logger.info(f"Analyzed {processed} notes in {elapsed:.1f}s "
+                f"({processed / elapsed if elapsed else 0:.1f} notes/s) with {workers} workers")
+
+
+def _drain_one(in_flight, output, checkpoint, done, chunks_since_checkpoint, args):
+    """Write the oldest chunk's results in input order and checkpoint periodically"""
+    count, future = in_flight.popleft()
+    for line in future.result():
+        output.write(line.encode('utf-8') + b'\n')
+    done += count
+    chunks_since_checkpoint += 1
+    if chunks_since_checkpoint >= args.checkpoint_every:
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.save(done, output.tell())
+        chunks_since_checkpoint = 0
+        logger.info(f'{done} notes written')
+    return done, chunks_since_checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyze a backlog of clinical notes offline')
+    parser.add_argument('input', help='JSONL file of {"id", "text"} records or a directory of .txt files')
+    parser.add_argument('--output', required=True, help='JSONL file to write results to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--threads', type=int, default=None, help='torch threads per worker')
+    parser.add_argument('--chunk-size', type=int, default=16, help='notes per model batch')
+    parser.add_argument('--prefetch', type=int, default=2, help='chunks queued per worker')
+    parser.add_argument('--checkpoint-every', type=int, default=10, help='chunks between checkpoints')
+    parser.add_argument('--speech', action='store_true', help='also run SpeechProcessor.organize_into_soap')
+    parser.add_argument('--resume', action='store_true', help='continue from the last checkpoint')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for transcript clean-up and vitals/plan extraction.
+
+Compares the original per-sentence code (nested str.replace per correction
+variant, uncompiled re.search/re.sub per pattern) against the compiled
+ExtractionEngine as the correction table grows.
+
+Usage (from the backend directory):
+    python benchmarks/bench_extraction.py --sizes 10 100 1000 --sentences 400
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import (  # noqa: E402
+    EXTRACTION_PATTERNS, TRANSCRIPTION_CORRECTIONS, UNIT_REWRITES
+)
+from extraction import ExtractionEngine  # noqa: E402
+
+SAMPLE_SENTENCES = [
+    'Blood presser 142 over 91 and heart rate 88 bpm',
+    'BP: 128/84 HR 76 T 98.6 RR 16 SpO2 97%',
+    'weight 82 kg height 178 cm BMI 25.9',
+    'prescribe 500 mg of metformin and 10 mg of lisinopril',
+    'follow up in 2 weeks to review the diabeties medicine',
+    'temp was 101 degrees overnight with high tension headache',
+    'she denies shortness of breath or palpitations',
+]
+
+
+def synthetic_corrections(size, seed=0):
+    """Grow the real correction table with made-up misheard variants"""
+    rng = random.Random(seed)
+    corrections = {correct: list(variants) for correct, variants in TRANSCRIPTION_CORRECTIONS.items()}
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    real = sum(len(variants) for variants in corrections.values())
+    for index in range(max(0, size - real)):
+        variant = ' '.join(''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 9)))
+                           for _ in range(rng.randint(1, 2)))
+        corrections.setdefault(f'term{index % 50}', []).append(variant)
+    return corrections
+
+
+def naive_process(sentence, corrections):
+    """The original post_process_medical_terms + extract_* code paths"""
+    text = sentence.lower()
+    for correct, variants in corrections.items():
+        for variant in variants:
+            text = text.replace(variant, correct)
+    for pattern, replacement in UNIT_REWRITES:
+        text = re.sub(pattern, replacement, text)
+    found = {}
+    for table in EXTRACTION_PATTERNS.values():
+        for name, pattern in table.items():
+            match = re.search(pattern, sentence)
+            if match:
+                found[name] = match.groupdict()
+    return text, found
+
+
+def engine_process(engine, sentence):
+    return engine.correct(sentence), engine.extract_all(sentence)
+
+
+def time_it(func, sentences, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for sentence in sentences:
+            func(sentence)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--sentences', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    sentences = [rng.choice(SAMPLE_SENTENCES) for _ in range(args.sentences)]
+
+    print(f"{'corrections':>12} {'naive ms':>10} {'engine ms':>10} {'speedup':>8} {'build ms':>9}")
+    for size in args.sizes:
+        corrections = synthetic_corrections(size)
+        started = time.perf_counter()
+        engine = ExtractionEngine(EXTRACTION_PATTERNS, corrections, UNIT_REWRITES)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        naive = time_it(lambda s: naive_process(s, corrections), sentences, args.repeat)
+        compiled = time_it(lambda s: engine_process(engine, s), sentences, args.repeat)
+        print(f'{size:>12} {naive * 1000:>10.2f} {compiled * 1000:>10.2f} '
+              f'{naive / compiled:>7.1f}x {build_ms:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Accuracy parity and latency/throughput for the CPU inference backends.
+
+Every backend runs the classifier and NER pipelines over the same fixed
+sample notes. Outputs are compared with the fp32 PyTorch reference, and the
+script exits non-zero if a backend falls below the agreement thresholds, so
+it can gate a backend change in CI. Each backend is loaded in its own
+process so resident memory can be compared fairly.
+
+Usage (from the backend directory):
+    python benchmarks/bench_inference_backends.py --backends pytorch quantized onnx
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SAMPLE_NOTES = [
+    'Patient reports chest pain radiating to the left arm for two hours.',
+    'Blood pressure 150/95, heart rate 102, oxygen saturation 94% on room air.',
+    'History of type 2 diabetes mellitus managed with metformin 500 mg twice daily.',
+    'Findings consistent with community acquired pneumonia of the right lower lobe.',
+    'Start amoxicillin 875 mg orally every 12 hours for 7 days.',
+    'She denies fever, chills, nausea or vomiting.',
+    'Lungs with scattered wheezes, no crackles. Abdomen soft and non tender.',
+    'Refer to cardiology and repeat troponin in six hours.',
+    'Hemoglobin A1c of 8.2 percent, up from 7.4 three months ago.',
+    'Follow up in 2 weeks to review blood glucose log and adjust insulin.',
+    'Complains of worsening shortness of breath on exertion and ankle swelling.',
+    'MRI of the lumbar spine shows mild disc bulge at L4-L5 without stenosis.',
+]
+
+
+def rss_mb():
+    """Current resident set size of this process"""
+    with open('/proc/self/statm') as handle:
+        pages = int(handle.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def measure(backend, repeat):
+    """Load one backend and return its outputs and timings (runs in a child process)"""
+    from config.settings import INFERENCE_BACKEND, MODELS
+    from inference_backends import build_pipeline
+
+    baseline = rss_mb()
+    started = time.perf_counter()
+    classifier = build_pipeline('text-classification', MODELS['classifier'], backend=backend,
+                                cache_dir=INFERENCE_BACKEND['cache_dir'])
+    ner = build_pipeline('ner', MODELS['ner'], backend=backend,
+                         cache_dir=INFERENCE_BACKEND['cache_dir'], aggregation_strategy='simple')
+    load_seconds = time.perf_counter() - started
+
+    # Warm up kernels and allocator before timing
+    classifier(SAMPLE_NOTES[:2])
+    ner(SAMPLE_NOTES[:2])
+
+    latencies = []
+    for _ in range(repeat):
+        for note in SAMPLE_NOTES:
+            started = time.perf_counter()
+            classifier(note)
+            ner(note)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        classifications = classifier(SAMPLE_NOTES, batch_size=len(SAMPLE_NOTES))
+        entities = ner(SAMPLE_NOTES, batch_size=len(SAMPLE_NOTES))
+    batch_seconds = (time.perf_counter() - started) / repeat
+
+    latencies.sort()
+    return {
+        'backend': backend,
+        'load_seconds': round(load_seconds, 2),
+        'rss_mb': round(rss_mb() - baseline, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        'notes_per_second': round(len(SAMPLE_NOTES) / batch_seconds, 1),
+        'classifications': [[c['label'], float(c['score'])] for c in classifications],
+        'entities': [sorted([e['entity_group'], e['word']] for e in note) for note in entities],
+    }
+
+
+def run_in_child(backend, repeat):
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', backend, '--repeat', str(repeat)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def entity_f1(reference, candidate):
+    matched = reference_total = candidate_total = 0
+    for expected, actual in zip(reference, candidate):
+        expected = [tuple(e) for e in expected]
+        actual = [tuple(e) for e in actual]
+        matched += len(set(expected) & set(actual))
+        reference_total += len(set(expected))
+        candidate_total += len(set(actual))
+    if not reference_total and not candidate_total:
+        return 1.0
+    return 2 * matched / (reference_total + candidate_total)
+
+
+def parity(reference, candidate):
+    labels = [c[0] for c in reference['classifications']]
+    other_labels = [c[0] for c in candidate['classifications']]
+    label_agreement = sum(a == b for a, b in zip(labels, other_labels)) / len(labels)
+    score_drift = max(abs(a[1] - b[1]) for a, b in
+                      zip(reference['classifications'], candidate['classifications']))
+    return label_agreement, score_drift, entity_f1(reference['entities'], candidate['entities'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--backends', nargs='+', default=['pytorch', 'quantized', 'onnx', 'onnx-int8'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-label-agreement', type=float, default=0.9)
+    parser.add_argument('--min-entity-f1', type=float, default=0.9)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.repeat)))
+        return 0
+
+    backends = ['pytorch'] + [b for b in args.backends if b != 'pytorch']
+    results = [run_in_child(backend, args.repeat) for backend in backends]
+    reference = results[0]
+
+    failed = False
+    print(f"{'backend':>10} {'load s':>7} {'rss MB':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'notes/s':>8} {'labels':>7} {'drift':>7} {'ent F1':>7}")
+    for result in results:
+        agreement, drift, f1 = parity(reference, result)
+        ok = agreement >= args.min_label_agreement and f1 >= args.min_entity_f1
+        failed = failed or not ok
+        print(f"{result['backend']:>10} {result['load_seconds']:>7.1f} {result['rss_mb']:>8.0f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['notes_per_second']:>8.1f} "
+              f"{agreement:>7.0%} {drift:>7.3f} {f1:>7.2f}{'' if ok else '  PARITY FAIL'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
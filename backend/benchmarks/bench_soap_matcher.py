@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for SOAP keyword matching as the vocabulary grows.
+
+Compares the original per-keyword substring scan (`any(keyword in sentence)`
+for every section) against the compiled, scored vocabulary index.
+
+Usage (from the backend directory):
+    python benchmarks/bench_soap_matcher.py --sizes 50 500 5000 --sentences 400
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import VOCABULARY  # noqa: E402
+from vocabulary import VocabularyIndex  # noqa: E402
+
+with open(VOCABULARY['path'], encoding='utf-8') as handle:
+    BASE_VOCABULARY = json.load(handle)
+
+SAMPLE_SENTENCES = [
+    'patient reports intermittent chest pain for three days',
+    'blood pressure 142 over 91 and heart rate 88',
+    'findings are consistent with stable angina',
+    'prescribe aspirin 81 mg daily and follow-up in two weeks',
+    'she denies shortness of breath or palpitations',
+    'lab results show elevated ldl cholesterol',
+    'recommend lifestyle changes including diet and exercise',
+    'no acute distress noted during the visit',
+]
+
+
+def synthetic_vocabulary(size, seed=0):
+    """Grow the real keyword tables with made-up clinical-looking phrases"""
+    rng = random.Random(seed)
+    sections = {section: list(keywords) for section, keywords in BASE_VOCABULARY['sections'].items()}
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    real = sum(len(keywords) for keywords in sections.values())
+    names = list(sections)
+    for _ in range(max(0, size - real)):
+        words = [''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 9)))
+                 for _ in range(rng.randint(1, 3))]
+        sections[rng.choice(names)].append(' '.join(words))
+    return sections
+
+
+def naive_match(sentence, sections):
+    """The original analyze_soap routing: one substring scan per keyword"""
+    if any(keyword in sentence for keyword in sections['plan']):
+        for subcategory, details in BASE_VOCABULARY['plan_subcategories'].items():
+            if any(word in sentence for word in details['keywords']):
+                return 'plan', subcategory
+        return 'plan', None
+    for section in ('subjective', 'objective', 'assessment'):
+        if any(keyword in sentence for keyword in sections[section]):
+            return section, None
+    return None, None
+
+
+def time_it(func, sentences, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for sentence in sentences:
+            func(sentence)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 2000, 5000])
+    parser.add_argument('--sentences', type=int, default=400)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    sentences = [rng.choice(SAMPLE_SENTENCES) for _ in range(args.sentences)]
+
+    print(f"{'vocab':>8} {'naive ms':>10} {'index ms':>13} {'speedup':>8} {'build ms':>9}")
+    for size in args.sizes:
+        sections = synthetic_vocabulary(size)
+        started = time.perf_counter()
+        matcher = VocabularyIndex(dict(BASE_VOCABULARY, sections=sections))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        naive = time_it(lambda s: naive_match(s, sections), sentences, args.repeat)
+        compiled = time_it(matcher.classify, sentences, args.repeat)
+        print(f'{size:>8} {naive * 1000:>10.2f} {compiled * 1000:>13.2f} '
+              f'{naive / compiled:>7.1f}x {build_ms:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measure import time and time-to-ready of app.py for each model loading mode.
+
+Each mode runs in a fresh interpreter so module caches do not skew results.
+
+Usage (from the backend directory):
+    python benchmarks/bench_startup.py --modes eager background lazy --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.models.wait_until_ready()
+ready = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - started,
+    'ready_seconds': ready - started,
+    'ml_models_loaded': app.models.all_loaded()
+}))
+"""
+
+
+def run_probe(mode):
+    env = dict(os.environ, MODEL_LOADING_MODE=mode)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--modes', nargs='+', default=['eager', 'background', 'lazy'])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'import s':>10} {'ready s':>10} {'models':>8}")
+    for mode in args.modes:
+        samples = [run_probe(mode) for _ in range(args.runs)]
+        import_s = statistics.median(sample['import_seconds'] for sample in samples)
+        ready_s = statistics.median(sample['ready_seconds'] for sample in samples)
+        loaded = all(sample['ml_models_loaded'] for sample in samples)
+        print(f'{mode:>12} {import_s:>10.2f} {ready_s:>10.2f} {str(loaded):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks for the analysis code paths, with the models faked.
+
+Runs analyze_soap, the /api/analyze pipeline (chunking, the fake classifier
+and NER, then analyze_soap), SpeechProcessor.organize_into_soap and the
+extraction helpers over synthetic notes of every length profile at a low
+and a high keyword density. Each case times one call per note and reports
+latency percentiles and calls per second. Write the results with --output
+and diff two runs with compare.py.
+
+Usage (from the backend directory):
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --output after.json --only extraction
+    python benchmarks/compare.py before.json after.json
+"""
+
+import argparse
+import gc
+import time
+
+# Must run before anything imports config.settings
+from fakes import import_app  # noqa: I100
+
+app = import_app()
+
+from corpus import PROFILES, generate_corpus  # noqa: E402
+from results import latency_summary, write_results  # noqa: E402
+
+DENSITIES = (0.2, 0.8)
+
+
+def sentences_of(note):
+    return [sentence for sentence in note.split('. ') if sentence]
+
+
+def build_cases(processor):
+    """name -> function taking one note"""
+    engine = processor.extractor
+
+    def analyze_soap(note, entities):
+        return app.analyze_soap(note, entities)
+
+    def analyze_pipeline(note, entities):
+        results = app.run_inference_batch([note])[0]
+        return app.analyze_soap(note, results.get('entities', {}))
+
+    def organize_into_soap(note, entities):
+        return processor.organize_into_soap(note)
+
+    def extraction(note, entities):
+        for sentence in sentences_of(note):
+            engine.correct(sentence)
+            engine.extract_all(sentence)
+
+    return {
+        'analyze_soap': analyze_soap,
+        'analyze_pipeline': analyze_pipeline,
+        'organize_into_soap': organize_into_soap,
+        'extraction': extraction,
+    }
+
+
+def run_case(func, notes, entities, rounds, reset=None):
+    # One untimed pass warms caches that live for the whole process
+    for note, note_entities in zip(notes, entities):
+        func(note, note_entities)
+
+    durations = []
+    gc.collect()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        if reset:
+            reset()
+        for note, note_entities in zip(notes, entities):
+            call_started = time.perf_counter()
+            func(note, note_entities)
+            durations.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    summary = latency_summary(durations)
+    summary['calls_per_sec'] = round(len(durations) / elapsed, 2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--notes', type=int, default=30, help='notes per profile and density')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=list(PROFILES))
+    parser.add_argument('--only', nargs='+', help='run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+
+    processor = app.speech_models.get('speech_processor')
+    cases = build_cases(processor)
+    selected = args.only or list(cases)
+    unknown = set(selected) - set(cases)
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}; expected some of {sorted(cases)}")
+
+    ner = app.models.get('ner')
+    results = {}
+    print(f"{'case':<36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls/s':>10}")
+    for profile in args.profiles:
+        for density in DENSITIES:
+            notes = generate_corpus(args.notes, profile, density, args.seed)
+            entities = [app.group_entities(found) for found in ner(notes)]
+            for name in selected:
+                # Dictation would otherwise answer repeated sentences from its cache
+                reset = processor.resources.clear_cache if name == 'organize_into_soap' else None
+                summary = run_case(cases[name], notes, entities, args.rounds, reset)
+                case = f'{name}/{profile}/d{density}'
+                results[case] = summary
+                print(f"{case:<36} {summary['p50_ms']:>9.3f} {summary['p95_ms']:>9.3f} "
+                      f"{summary['p99_ms']:>9.3f} {summary['calls_per_sec']:>10.1f}")
+
+    if args.output:
+        write_results(args.output, 'bench_suite', args, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Compare per-sentence and batched zero-shot SOAP classification.
+
+Loads the real SpeechProcessor (spaCy + zero-shot pipeline) and classifies a
+dictation of sentences that mostly miss the keyword lists, once by calling
+the pipeline sentence by sentence (the previous behaviour) and once through
+classify_sentences, which sends all misses as a single batch.
+
+Usage (from the backend directory):
+    python benchmarks/bench_zero_shot.py --sentences 40 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from speech_processor import CANDIDATE_LABELS, SpeechProcessor  # noqa: E402
+
+DICTATION = [
+    'Mild tenderness over the right lower quadrant',
+    'She has been waking up at night twice this week',
+    'Lungs clear bilaterally with no wheeze',
+    'Likely viral upper respiratory infection',
+    'Continue current inhaler and increase fluids',
+    'Reflexes symmetric and two plus throughout',
+    'Started after a long flight last month',
+    'Probably musculoskeletal in origin',
+    'Return if fever persists beyond three days',
+    'Abdomen soft and non distended',
+]
+
+
+def per_sentence(processor, sentences):
+    labels = list(CANDIDATE_LABELS)
+    return [processor.classifier(sentence, labels)['labels'][0] for sentence in sentences]
+
+
+def batched(processor, sentences):
+    processor.resources.clear_cache()
+    return processor.classify_sentences(sentences)
+
+
+def best_of(func, processor, sentences, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(processor, sentences)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sentences', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Suffix each sentence so repeats are not answered from the result cache
+    sentences = [f'{DICTATION[i % len(DICTATION)]} ({i})' for i in range(args.sentences)]
+    processor = SpeechProcessor()
+    misses = sum(1 for sentence in sentences if processor.keyword_category(sentence) is None)
+
+    # Warm up tokenizer and kernels before timing
+    batched(processor, sentences[:2])
+
+    single = best_of(per_sentence, processor, sentences, args.repeat)
+    batch = best_of(batched, processor, sentences, args.repeat)
+    print(f'{len(sentences)} sentences, {misses} keyword misses')
+    print(f'per-sentence: {single * 1000:.0f} ms')
+    print(f'batched:      {batch * 1000:.0f} ms ({single / batch:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
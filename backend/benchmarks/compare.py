@@ -0,0 +1,76 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Matches cases by name and compares every metric they share. For metrics
+ending in _ms a rise counts as a regression; for those ending in _per_sec a
+fall does. The script exits with status 1 when any change is worse than
+--threshold, so CI can run it after the benchmarks.
+
+Usage (from the backend directory):
+    python benchmarks/compare.py before.json after.json --threshold 0.10 --metrics p50_ms p95_ms
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def worse_by(metric, before, after):
+    """Relative change in the bad direction; negative means an improvement"""
+    if not before:
+        return 0.0
+    change = (after - before) / before
+    return -change if metric.endswith('_per_sec') else change
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, 0.10 is 10%%')
+    parser.add_argument('--metrics', nargs='+', default=['p50_ms', 'p95_ms'],
+                        help="metrics to check; 'all' checks every shared metric")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"before: {before['meta'].get('git')} {before['meta'].get('time')}")
+    print(f"after:  {after['meta'].get('git')} {after['meta'].get('time')}")
+
+    regressions = []
+    print(f"{'case':<40} {'metric':<16} {'before':>12} {'after':>12} {'change':>9}")
+    for case, old in sorted(before['results'].items()):
+        new = after['results'].get(case)
+        if new is None:
+            print(f'{case:<40} missing from {args.after}')
+            continue
+        metrics = [m for m in old if m.endswith(('_ms', '_per_sec'))] if args.metrics == ['all'] \
+            else args.metrics
+        for metric in metrics:
+            if not isinstance(old.get(metric), (int, float)) or not isinstance(new.get(metric), (int, float)):
+                continue
+            change = worse_by(metric, old[metric], new[metric])
+            flag = ''
+            if change > args.threshold:
+                flag = '  REGRESSION'
+                regressions.append((case, metric, change))
+            sign = '+' if change > 0 else ''
+            print(f'{case:<40} {metric:<16} {old[metric]:>12.3f} {new[metric]:>12.3f} '
+                  f'{sign}{change * 100:>7.1f}%{flag}')
+
+    for case in sorted(set(after['results']) - set(before['results'])):
+        print(f'{case:<40} new in {args.after}')
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+        return 1
+    print(f'\nNo regressions beyond {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
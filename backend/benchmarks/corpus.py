@@ -0,0 +1,120 @@
+"""
+Synthetic clinical notes for the benchmarks.
+
+Notes are assembled from sentence templates. With probability ``density`` a
+sentence carries a SOAP keyword drawn from the live vocabulary; the others
+are clinical-sounding filler that no keyword matches, which is the path that
+falls through to zero-shot in dictation. Vitals, doses and follow-ups are
+filled with random numbers so the extraction patterns have work to do. The
+same seed always gives the same corpus.
+
+Usage (from the backend directory):
+    python benchmarks/corpus.py --profile long --density 0.5 --count 100 > notes.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import VOCABULARY  # noqa: E402
+
+# Sentences per note; long notes run past one 512-token model window
+PROFILES = {
+    'short': (3, 6),
+    'medium': (15, 30),
+    'long': (80, 140),
+}
+
+KEYWORD_TEMPLATES = {
+    'subjective': [
+        'The patient {kw} on and off since {when}',
+        'She mentions {kw} that gets worse at night',
+        '{kw} started after {when} and has not settled',
+    ],
+    'objective': [
+        'On examination {kw} was within expected limits',
+        'BP {bp} HR {hr} and {kw} recorded at triage',
+        '{kw} repeated after rest with weight {kg} kg',
+    ],
+    'assessment': [
+        'The {kw} points to {condition}',
+        'Working {kw} is {condition} with no red flags',
+        '{kw} is consistent with {condition}',
+    ],
+    'plan': [
+        'We will {kw} {dose} mg of {drug} and follow up in {n} weeks',
+        'Plan to {kw} with {drug} and review in clinic',
+        '{kw} discussed along with {dose} mg of {drug} daily',
+    ],
+}
+
+FILLER = [
+    'Accompanied by a family member who helped with the history',
+    'Lives alone on the second floor and walks with a cane',
+    'Works night shifts at a warehouse',
+    'No recent travel outside the state',
+    'Had a similar episode about {n} years ago',
+    'Sleeping poorly and drinking more coffee lately',
+    'Brought a written list of questions to the visit',
+    'Denies any change in appetite or weight',
+    'Was seen at urgent care {n} days ago',
+    'Ate breakfast this morning before arriving',
+]
+
+WHEN = ['last week', 'the weekend', 'two days ago', 'a long flight', 'starting a new job']
+CONDITIONS = ['viral pharyngitis', 'type 2 diabetes', 'essential hypertension', 'tension headache',
+              'community acquired pneumonia', 'iron deficiency anemia']
+DRUGS = ['metformin', 'lisinopril', 'amoxicillin', 'atorvastatin', 'ibuprofen', 'omeprazole']
+
+
+def load_keywords():
+    with open(VOCABULARY['path'], encoding='utf-8') as handle:
+        return json.load(handle)['sections']
+
+
+def _fill(template, rng, keyword=''):
+    sentence = template.format(
+        kw=keyword, when=rng.choice(WHEN), condition=rng.choice(CONDITIONS), drug=rng.choice(DRUGS),
+        bp=f'{rng.randint(105, 165)}/{rng.randint(60, 100)}', hr=rng.randint(55, 110),
+        kg=rng.randint(50, 120), dose=rng.choice([5, 10, 20, 250, 500, 850]), n=rng.randint(1, 8)
+    )
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def generate_note(rng, sentences, density, keywords):
+    parts = []
+    for _ in range(sentences):
+        if rng.random() < density:
+            section = rng.choice(list(KEYWORD_TEMPLATES))
+            parts.append(_fill(rng.choice(KEYWORD_TEMPLATES[section]), rng, rng.choice(keywords[section])))
+        else:
+            parts.append(_fill(rng.choice(FILLER), rng))
+    return ' '.join(parts)
+
+
+def generate_corpus(count, profile='medium', density=0.5, seed=0):
+    """count notes whose length follows profile and keyword share follows density"""
+    rng = random.Random(f'{seed}:{profile}:{density}')
+    keywords = load_keywords()
+    low, high = PROFILES[profile]
+    return [generate_note(rng, rng.randint(low, high), density, keywords) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='medium')
+    parser.add_argument('--density', type=float, default=0.5, help='share of sentences with a SOAP keyword')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for note in generate_corpus(args.count, args.profile, args.density, args.seed):
+        print(json.dumps({'text': note}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Deterministic stand-ins for the models, so the benchmarks run offline.
+
+The fakes answer in the shapes the transformers pipelines use: a tokenizer
+with offsets for chunking, top_k=None label lists for the classifier and
+aggregated entity dicts for NER. Scores come from a hash of the input, so
+every run gives the same answers. ``latency_ms`` adds a fixed sleep per
+window, which stands in for model time in load tests. It is off for
+micro-benchmarks so they measure only the code around the models.
+
+Only the models are faked. spaCy, transformers and speech_recognition must
+still be installed because the modules under test import them.
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+CLASSIFIER_LABELS = ['diabetes', 'hypertension', 'respiratory', 'cardiac', 'other']
+
+NER_TERMS = {
+    'SYMPTOM': ['pain', 'headache', 'fever', 'cough', 'nausea', 'fatigue'],
+    'DIAGNOSIS': ['pharyngitis', 'diabetes', 'hypertension', 'pneumonia', 'anemia'],
+    'MEDICATION': ['metformin', 'lisinopril', 'amoxicillin', 'atorvastatin', 'ibuprofen', 'omeprazole'],
+    'TEST': ['blood pressure', 'lab values', 'x-ray', 'a1c'],
+}
+NER_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(term) for terms in NER_TERMS.values() for term in terms) + r')\b',
+    re.IGNORECASE
+)
+NER_GROUPS = {term: group for group, terms in NER_TERMS.items() for term in terms}
+
+
+def _scores(text, labels):
+    """Hash-derived scores that sum to one, in label order"""
+    raw = [(zlib.crc32(f'{label}|{text}'.encode()) % 1000) + 1 for label in labels]
+    total = float(sum(raw))
+    return [value / total for value in raw]
+
+
+class FakeTokenizer:
+    model_max_length = 512
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, **kwargs):
+        offsets = [match.span() for match in TOKEN_PATTERN.finditer(text)]
+        encoding = {'input_ids': list(range(len(offsets)))}
+        if return_offsets_mapping:
+            encoding['offset_mapping'] = offsets
+        return encoding
+
+
+class _FakePipeline:
+    def __init__(self, latency_ms=0.0):
+        self.tokenizer = FakeTokenizer()
+        self.latency = latency_ms / 1000.0
+
+    def _run(self, inputs, answer):
+        single = isinstance(inputs, str)
+        texts = [inputs] if single else list(inputs)
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        outputs = [answer(text) for text in texts]
+        return outputs[0] if single else outputs
+
+
+class FakeClassifier(_FakePipeline):
+    """text-classification pipeline returning every label (top_k=None)"""
+
+    def __call__(self, inputs, batch_size=None, top_k=1, **kwargs):
+        def answer(text):
+            ranked = sorted(zip(CLASSIFIER_LABELS, _scores(text, CLASSIFIER_LABELS)),
+                            key=lambda item: item[1], reverse=True)
+            return [{'label': label, 'score': score} for label, score in ranked[:top_k or None]]
+        return self._run(inputs, answer)
+
+
+class FakeNER(_FakePipeline):
+    """ner pipeline with aggregation_strategy='simple'"""
+
+    def __call__(self, inputs, batch_size=None, **kwargs):
+        def answer(text):
+            return [{
+                'entity_group': NER_GROUPS[match.group().lower()],
+                'word': match.group(),
+                'start': match.start(),
+                'end': match.end(),
+                'score': 0.5 + (zlib.crc32(match.group().lower().encode()) % 500) / 1000.0
+            } for match in NER_PATTERN.finditer(text)]
+        return self._run(inputs, answer)
+
+
+class FakeZeroShot(_FakePipeline):
+    """zero-shot-classification pipeline; labels come back best first"""
+
+    def __call__(self, sequences, candidate_labels, batch_size=None, **kwargs):
+        def answer(text):
+            ranked = sorted(zip(candidate_labels, _scores(text, candidate_labels)),
+                            key=lambda item: item[1], reverse=True)
+            return {'sequence': text, 'labels': [label for label, _ in ranked],
+                    'scores': [score for _, score in ranked]}
+        return self._run(sequences, answer)
+
+
+def blank_nlp(*args, **kwargs):
+    """A real spaCy pipeline with only a rule-based sentencizer; needs no download"""
+    import spacy
+    nlp = spacy.blank('en')
+    nlp.add_pipe('sentencizer')
+    return nlp
+
+
+def fake_speech_processor(latency_ms=0.0):
+    """SpeechProcessor with a blank spaCy pipeline and the fake zero-shot model"""
+    import speech_processor
+    with mock.patch.object(speech_processor.spacy, 'load', blank_nlp), \
+            mock.patch.object(speech_processor, 'pipeline',
+                              lambda *args, **kwargs: FakeZeroShot(latency_ms)):
+        return speech_processor.SpeechProcessor()
+
+
+def import_app(latency_ms=0.0, result_cache=False, data_dir=None):
+    """Import app.py with the fake models (speech ones included) loaded and its state in a scratch directory
+
+    The result cache is off by default so repeated notes still run the
+    (fake) models. Call before anything else imports app or config.settings.
+    """
+    data_dir = data_dir or tempfile.mkdtemp(prefix='diabuddy-bench-')
+    os.environ.setdefault('MODEL_LOADING_MODE', 'lazy')
+    os.environ.setdefault('SPEECH_RECOGNIZER', 'offline')
+    os.environ.setdefault('MESSAGE_STORE_PATH', os.path.join(data_dir, 'messages.db'))
+    os.environ.setdefault('RESULT_CACHE', str(result_cache))
+
+    import app
+    app.models.register('classifier', lambda: FakeClassifier(latency_ms), version=app.MODELS['classifier'])
+    app.models.register('ner', lambda: FakeNER(latency_ms), version=app.MODELS['ner'])
+    app.speech_models.register('speech_processor', lambda: fake_speech_processor(latency_ms))
+    app.models.load_all()
+    app.speech_models.load_all()
+    return app
@@ -0,0 +1,187 @@
+"""
+HTTP load generator for /api/analyze.
+
+Closed loop: --concurrency clients each send their next note as soon as
+the previous answer arrives. This shows the throughput the server sustains.
+Open loop: requests arrive at --rate per second with Poisson spacing,
+whether or not earlier ones have finished. This shows the latency users
+would see at that traffic. Open-loop latency is measured from each request's
+scheduled start, so time spent waiting for a free client counts too.
+
+Notes come from the synthetic corpus. Each one gets a unique closing
+sentence so the server's result cache cannot answer it; pass --allow-cache
+to measure the cached path. --serve-fakes starts the app in this process
+with the fake models (see fakes.py), so the whole run works offline.
+
+Usage (from the backend directory):
+    python benchmarks/load_analyze.py --serve-fakes --model-latency-ms 20 --mode closed --concurrency 8
+    python benchmarks/load_analyze.py --url http://localhost:5000 --mode open --rate 50 --output load.json
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_client import SERVER_URL  # noqa: E402
+
+
+class NoteSource:
+    """Thread-safe endless supply of corpus notes"""
+
+    def __init__(self, corpus, unique):
+        self.corpus = itertools.cycle(corpus)
+        self.sent = itertools.count()
+        self.unique = unique
+        self.lock = threading.Lock()
+
+    def __next__(self):
+        with self.lock:
+            note, index = next(self.corpus), next(self.sent)
+        return f'{note} Visit reference {index}.' if self.unique else note
+
+
+class Recorder:
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+
+    def record(self, started, latency, status):
+        # Requests started during the warm-up are not counted
+        if started < self.measure_from:
+            return
+        with self.lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200:
+                self.latencies.append(latency)
+
+
+def send(session, url, note, timeout, headers=None):
+    try:
+        response = session.post(f'{url}/api/analyze', json={'text': note}, headers=headers, timeout=timeout)
+        return response.status_code
+    except requests.RequestException as e:
+        return type(e).__name__
+
+
+def closed_loop(url, notes, args, recorder, end):
+    def client():
+        session = requests.Session()
+        while True:
+            started = time.perf_counter()
+            if started >= end:
+                return
+            status = send(session, url, next(notes), args.timeout, args.headers)
+            recorder.record(started, time.perf_counter() - started, status)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(url, notes, args, recorder, end):
+    local = threading.local()
+    rng = random.Random(args.seed)
+
+    def fire(scheduled, note):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        status = send(session, url, note, args.timeout, args.headers)
+        recorder.record(scheduled, time.perf_counter() - scheduled, status)
+
+    with ThreadPoolExecutor(max_workers=args.max_inflight) as pool:
+        scheduled = time.perf_counter()
+        while True:
+            scheduled += rng.expovariate(args.rate)
+            if scheduled >= end:
+                break
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            pool.submit(fire, scheduled, next(notes))
+
+
+def serve_fakes(latency_ms):
+    """Start the app on a free local port with the fake models; returns its URL"""
+    from fakes import import_app
+    from werkzeug.serving import make_server
+
+    app = import_app(latency_ms)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default=SERVER_URL)
+    parser.add_argument('--serve-fakes', action='store_true', help='run the app in-process with fake models')
+    parser.add_argument('--model-latency-ms', type=float, default=20,
+                        help='simulated model time per window with --serve-fakes')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', type=int, default=8, help='clients in closed-loop mode')
+    parser.add_argument('--rate', type=float, default=20, help='requests per second in open-loop mode')
+    parser.add_argument('--max-inflight', type=int, default=256, help='open-loop client threads')
+    parser.add_argument('--duration', type=float, default=30, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds run before measuring')
+    parser.add_argument('--profile', choices=['short', 'medium', 'long'], default='medium')
+    parser.add_argument('--density', type=float, default=0.5)
+    parser.add_argument('--notes', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--allow-cache', action='store_true', help='resend identical notes')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--priority', choices=['interactive', 'bulk'], default='interactive',
+                        help='admission lane to request')
+    parser.add_argument('--output', help="write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+    args.headers = {'X-Priority': args.priority}
+
+    # The fake server has to configure settings before the corpus imports them
+    url = serve_fakes(args.model_latency_ms) if args.serve_fakes else args.url.rstrip('/')
+
+    from corpus import generate_corpus
+    from results import latency_summary, write_results
+
+    notes = NoteSource(generate_corpus(args.notes, args.profile, args.density, args.seed),
+                       unique=not args.allow_cache)
+    started = time.perf_counter()
+    recorder = Recorder(started + args.warmup)
+    end = started + args.warmup + args.duration
+    load = f'c{args.concurrency}' if args.mode == 'closed' else f'r{args.rate:g}'
+    print(f'{args.mode}-loop load ({load}) on {url}/api/analyze for {args.warmup:g}s warm-up '
+          f'+ {args.duration:g}s, {args.profile} notes')
+    if args.mode == 'closed':
+        closed_loop(url, notes, args, recorder, end)
+    else:
+        open_loop(url, notes, args, recorder, end)
+    measured = time.perf_counter() - recorder.measure_from
+
+    summary = latency_summary(recorder.latencies)
+    summary['requests_per_sec'] = round(len(recorder.latencies) / measured, 2)
+    summary['errors'] = {str(status): count for status, count in recorder.statuses.items() if status != 200}
+    case = f'analyze/{args.mode}-{load}/{args.profile}'
+    if args.priority != 'interactive':
+        case += f'/{args.priority}'
+    print(f"{case}: {summary['requests_per_sec']} req/s, p50 {summary.get('p50_ms')} ms, "
+          f"p95 {summary.get('p95_ms')} ms, p99 {summary.get('p99_ms')} ms, errors {summary['errors']}")
+
+    if args.output:
+        write_results(args.output, 'load_analyze', args, {case: summary})
+    return 1 if summary['errors'] and not recorder.latencies else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
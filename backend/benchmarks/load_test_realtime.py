@@ -0,0 +1,216 @@
+"""
+Load test for the room broadcaster: delivery latency with many connected clients.
+
+Connects --clients Socket.IO clients (the same client test_client.py uses),
+spreads them over --rooms encounter rooms and publishes --messages messages
+to every room from one extra client. Each message carries its send time, so
+every delivery gives a publish-to-receive latency. The receivers acknowledge
+each 'message_batch' like the frontends do. Timestamps come from this
+machine's clock, so run it on the server host.
+
+Usage (from the backend directory, with the server running):
+    python benchmarks/load_test_realtime.py --clients 1000 --rooms 20 --messages 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from test_client import SERVER_URL  # noqa: E402
+
+
+class Receiver:
+    """One simulated client in one encounter room"""
+
+    def __init__(self, url, encounter_id, run_id, transports, results):
+        self.url = url
+        self.encounter_id = encounter_id
+        self.run_id = run_id
+        self.transports = transports
+        self.results = results
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('message_batch', self.on_batch)
+
+    def connect(self):
+        self.sio.connect(self.url, transports=self.transports, wait_timeout=30)
+        ack = self.sio.call('join_encounter', {'encounter_id': self.encounter_id}, timeout=30)
+        if not ack or ack.get('status') != 'joined':
+            raise RuntimeError(f'join_encounter refused: {ack}')
+
+    def on_batch(self, batch):
+        received = time.time()
+        latencies = [received - message['sent_at'] for message in batch.get('messages', [])
+                     if isinstance(message, dict) and message.get('load_test') == self.run_id]
+        self.results.record(len(latencies), latencies)
+        # Returning acknowledges the batch
+
+    def disconnect(self):
+        try:
+            self.sio.disconnect()
+        except Exception:
+            pass
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.batches = 0
+        self.delivered = 0
+
+    def record(self, count, latencies):
+        with self.lock:
+            self.batches += 1
+            self.delivered += count
+            self.latencies.extend(latencies)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def connect_all(receivers, concurrency, ramp_seconds):
+    """Connect the receivers, spreading connection attempts over ramp_seconds"""
+    delay = ramp_seconds / max(1, len(receivers))
+    failures = []
+    started = time.perf_counter()
+
+    def connect(index):
+        time.sleep(max(0.0, started + index * delay - time.perf_counter()))
+        try:
+            receivers[index].connect()
+            return True
+        except Exception as e:
+            failures.append(str(e))
+            return False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        connected = [r for r, ok in zip(receivers, pool.map(connect, range(len(receivers)))) if ok]
+    return connected, failures, time.perf_counter() - started
+
+
+def publish(url, rooms, run_id, messages, rate, transports):
+    """Send messages to every room at rate messages per second in total"""
+    publisher = socketio.Client(reconnection=False)
+    publisher.connect(url, transports=transports, wait_timeout=30)
+    interval = 1.0 / rate if rate else 0.0
+    started = time.perf_counter()
+    sent = 0
+    try:
+        for seq in range(messages):
+            for room in rooms:
+                time.sleep(max(0.0, started + sent * interval - time.perf_counter()))
+                publisher.emit('message', {
+                    'encounter_id': room,
+                    'text': f'load test message {seq}',
+                    'seq': seq,
+                    'sent_at': time.time(),
+                    'load_test': run_id
+                })
+                sent += 1
+        # Give the last emits time to leave before closing the connection
+        time.sleep(0.5)
+    finally:
+        publisher.disconnect()
+    return sent, time.perf_counter() - started
+
+
+def server_stats(url):
+    try:
+        return requests.get(f'{url}/api/status', timeout=10).json().get('realtime')
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default=SERVER_URL)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=50, help='messages published to each room')
+    parser.add_argument('--rate', type=float, default=200, help='messages per second over all rooms')
+    parser.add_argument('--concurrency', type=int, default=50, help='connections opened in parallel')
+    parser.add_argument('--ramp', type=float, default=10, help='seconds over which clients connect')
+    parser.add_argument('--drain', type=float, default=15, help='seconds to wait for late deliveries')
+    parser.add_argument('--transport', choices=['websocket', 'polling'], default='websocket')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex
+    transports = [args.transport]
+    rooms = [f'load-{run_id[:8]}-{index}' for index in range(args.rooms)]
+    results = Results()
+    receivers = [Receiver(args.url, rooms[index % len(rooms)], run_id, transports, results)
+                 for index in range(args.clients)]
+
+    print(f'Connecting {args.clients} clients to {args.url} over {args.ramp:.0f}s...')
+    connected, failures, connect_seconds = connect_all(receivers, args.concurrency, args.ramp)
+    print(f'Connected {len(connected)} clients in {connect_seconds:.1f}s ({len(failures)} failed)')
+    if failures:
+        print(f'  first failure: {failures[0]}')
+
+    members = {}
+    for receiver in connected:
+        members[receiver.encounter_id] = members.get(receiver.encounter_id, 0) + 1
+    expected = args.messages * sum(members.values())
+
+    print(f'Publishing {args.messages} messages to each of {len(rooms)} rooms at {args.rate:.0f}/s...')
+    sent, publish_seconds = publish(args.url, rooms, run_id, args.messages, args.rate, transports)
+
+    deadline = time.monotonic() + args.drain
+    while time.monotonic() < deadline and results.delivered < expected:
+        time.sleep(0.2)
+
+    stats = server_stats(args.url)
+    latencies_ms = [latency * 1000 for latency in results.latencies]
+    report = {
+        'clients': args.clients,
+        'connected': len(connected),
+        'connect_failures': len(failures),
+        'connect_seconds': round(connect_seconds, 2),
+        'rooms': len(rooms),
+        'published': sent,
+        'publish_seconds': round(publish_seconds, 2),
+        'expected_deliveries': expected,
+        'delivered': results.delivered,
+        'delivery_ratio': round(results.delivered / expected, 4) if expected else None,
+        'batches': results.batches,
+        'messages_per_batch': round(results.delivered / results.batches, 2) if results.batches else None,
+        'latency_ms': {
+            name: round(percentile(latencies_ms, fraction), 2) if latencies_ms else None
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+        },
+        'server': stats
+    }
+
+    print(f"Delivered {report['delivered']}/{expected} messages in {report['batches']} batches "
+          f"({report['messages_per_batch']} per batch)")
+    print('Latency ms: ' + ', '.join(f'{name} {value}' for name, value in report['latency_ms'].items()))
+    if stats:
+        print(f'Server: {stats}')
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f'Wrote {args.json}')
+
+    # Closing handshakes can be slow under load, so close the clients in parallel
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(Receiver.disconnect, connected))
+    return 0 if expected and results.delivered == expected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
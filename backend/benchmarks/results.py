@@ -0,0 +1,71 @@
+"""
+Shared result format for bench_suite.py and load_analyze.py.
+
+A results file is {"meta": {...}, "results": {case: {metric: value}}}.
+Latency metrics end in _ms (lower is better) and rates end in _per_sec
+(higher is better), which is all compare.py needs to know.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean in milliseconds for a list of durations"""
+    values = sorted(seconds)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values) * 1000, 4),
+        'p50_ms': round(percentile(values, 0.50) * 1000, 4),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 4),
+        'max_ms': round(values[-1] * 1000, 4),
+    }
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                  capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return f'{revision}-dirty' if revision and dirty else revision or None
+
+
+def metadata(tool, args):
+    return {
+        'tool': tool,
+        'git': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': vars(args),
+    }
+
+
+def write_results(path, tool, args, results):
+    payload = {'meta': metadata(tool, args), 'results': results}
+    if path == '-':
+        json.dump(payload, sys.stdout, indent=2)
+        print()
+        return
+    with open(path, 'w') as handle:
+        json.dump(payload, handle, indent=2)
+    print(f'Wrote {path}')
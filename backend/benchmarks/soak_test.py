@@ -0,0 +1,274 @@
+"""
+Soak test: run the server for hours under mixed load and fail on memory growth.
+
+Starts the app in a child process with the fake models (see fakes.py) and
+memory diagnostics on. While it runs, the child calls organize_into_soap on
+corpus notes at --organize-rate. This process drives three kinds of load:
+
+- --concurrency clients posting unique notes to /api/analyze;
+- --socket-clients Socket.IO clients in encounter rooms, receiving chat
+  messages at --message-rate and reconnecting every --reconnect-every
+  seconds, so session setup and teardown is exercised too;
+- the organize loop in the child.
+
+The server's RSS is read from /api/admin/memory every --sample-interval
+seconds. The baseline is the first sample after --warmup. This matters
+because caches, pools and allocator arenas fill up early, and that is not
+a leak. The run fails (exit 1) when RSS grows more than --budget-mb over
+the baseline. The report lists the allocation sites that grew most, from
+the server's tracemalloc diff.
+
+Usage (from the backend directory):
+    python benchmarks/soak_test.py --duration 14400 --budget-mb 50
+    python benchmarks/soak_test.py --duration 300 --warmup 60 --budget-mb 20 --output soak.json
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+import socketio
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+MB = 1024 * 1024
+
+
+def serve(args):
+    """Child process: the app with fake models, plus an organize_into_soap loop"""
+    os.environ.setdefault('MEMORY_DIAGNOSTICS', 'true')
+    os.environ.setdefault('MEMORY_DIAGNOSTICS_INTERVAL', str(args.sample_interval))
+    from load_analyze import serve_fakes
+
+    url = serve_fakes(args.model_latency_ms)
+    import app
+    from corpus import generate_corpus
+
+    processor = app.speech_models.get('speech_processor')
+    notes = generate_corpus(args.notes, args.profile, 0.5, args.seed)
+    print(f'SERVING {url}', flush=True)
+
+    interval = 1.0 / args.organize_rate if args.organize_rate > 0 else None
+    index = 0
+    while True:
+        if interval is None:
+            time.sleep(3600)
+            continue
+        processor.organize_into_soap(f'{notes[index % len(notes)]} Visit reference {index}.')
+        index += 1
+        time.sleep(interval)
+
+
+def start_server(args):
+    command = [sys.executable, os.path.abspath(__file__), '--serve',
+               '--model-latency-ms', str(args.model_latency_ms),
+               '--organize-rate', str(args.organize_rate),
+               '--sample-interval', str(args.sample_interval),
+               '--notes', str(args.notes), '--profile', args.profile, '--seed', str(args.seed)]
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, text=True,
+                             cwd=os.path.dirname(BENCHMARKS_DIR))
+    for line in child.stdout:
+        if line.startswith('SERVING '):
+            # Keep draining the child's output so it never blocks on a full pipe
+            threading.Thread(target=child.stdout.read, daemon=True).start()
+            return child, line.split()[1]
+    raise RuntimeError(f'The server exited with status {child.wait()} before it started')
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {'analyze_ok': 0, 'analyze_errors': 0, 'messages_sent': 0,
+                       'batches_received': 0, 'reconnects': 0, 'socket_errors': 0}
+
+    def add(self, name, count=1):
+        with self.lock:
+            self.values[name] += count
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+def analyze_load(url, notes, args, counters, stop):
+    from load_analyze import send
+
+    def client():
+        session = requests.Session()
+        while not stop.is_set():
+            status = send(session, url, next(notes), args.timeout)
+            counters.add('analyze_ok' if status == 200 else 'analyze_errors')
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def socket_client(url, encounter_id, args, counters, stop):
+    """Join a room, receive batches, and reconnect every --reconnect-every seconds"""
+    while not stop.is_set():
+        client = socketio.Client(reconnection=False)
+        client.on('message_batch', lambda batch: counters.add('batches_received'))
+        try:
+            client.connect(url, wait_timeout=30)
+            client.call('join_encounter', {'encounter_id': encounter_id}, timeout=30)
+            stop.wait(args.reconnect_every)
+        except Exception:
+            counters.add('socket_errors')
+            stop.wait(1)
+        finally:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        counters.add('reconnects')
+
+
+def publish_messages(url, args, counters, stop):
+    publisher = socketio.Client(reconnection=True)
+    publisher.connect(url, wait_timeout=30)
+    index = 0
+    try:
+        while not stop.wait(1.0 / args.message_rate):
+            room = f'soak-{index % args.rooms}'
+            publisher.emit('message', {'encounter_id': room, 'text': f'Soak message {index}', 'sent_at': time.time()})
+            counters.add('messages_sent')
+            index += 1
+    finally:
+        publisher.disconnect()
+
+
+def memory_report(url, token):
+    headers = {'X-Admin-Token': token} if token else None
+    return requests.get(f'{url}/api/admin/memory', headers=headers, timeout=30).json()
+
+
+def growth_slope(samples):
+    """Least-squares RSS growth in MB per hour over (seconds, bytes) samples"""
+    if len(samples) < 2:
+        return 0.0
+    mean_t = sum(t for t, _ in samples) / len(samples)
+    mean_r = sum(r for _, r in samples) / len(samples)
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if not variance:
+        return 0.0
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in samples) / variance
+    return slope * 3600 / MB
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help='soak a running server instead (it needs MEMORY_DIAGNOSTICS=true '
+                                      'for allocation sites; organize_into_soap is not driven)')
+    parser.add_argument('--admin-token', default=os.getenv('ADMIN_TOKEN'))
+    parser.add_argument('--duration', type=float, default=3600, help='seconds, warm-up included')
+    parser.add_argument('--warmup', type=float, default=300, help='seconds before the baseline sample')
+    parser.add_argument('--budget-mb', type=float, default=50, help='allowed RSS growth over the baseline')
+    parser.add_argument('--sample-interval', type=float, default=30)
+    parser.add_argument('--model-latency-ms', type=float, default=5)
+    parser.add_argument('--concurrency', type=int, default=4, help='/api/analyze clients')
+    parser.add_argument('--socket-clients', type=int, default=20)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--message-rate', type=float, default=20, help='chat messages per second')
+    parser.add_argument('--reconnect-every', type=float, default=60, help='seconds each socket stays connected')
+    parser.add_argument('--organize-rate', type=float, default=5, help='organize_into_soap calls per second')
+    parser.add_argument('--profile', choices=['short', 'medium', 'long'], default='medium')
+    parser.add_argument('--notes', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help="write JSON results here ('-' for stdout)")
+    args = parser.parse_args()
+    if not args.serve and args.warmup >= args.duration:
+        parser.error('--warmup must be shorter than --duration')
+
+    if args.serve:
+        serve(args)
+        return 0
+
+    child = None
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        child, url = start_server(args)
+
+    from corpus import generate_corpus
+    from load_analyze import NoteSource
+    from results import write_results
+
+    counters = Counters()
+    stop = threading.Event()
+    notes = NoteSource(generate_corpus(args.notes, args.profile, 0.5, args.seed), unique=True)
+    workers = analyze_load(url, notes, args, counters, stop)
+    for index in range(args.socket_clients):
+        thread = threading.Thread(target=socket_client, args=(url, f'soak-{index % args.rooms}', args, counters, stop),
+                                  daemon=True)
+        thread.start()
+        workers.append(thread)
+    publisher = threading.Thread(target=publish_messages, args=(url, args, counters, stop), daemon=True)
+    publisher.start()
+    workers.append(publisher)
+
+    print(f'Soaking {url} for {args.duration:g}s ({args.warmup:g}s warm-up), budget {args.budget_mb:g} MB')
+    started = time.monotonic()
+    baseline = None
+    samples = []
+    try:
+        while True:
+            elapsed = time.monotonic() - started
+            rss = memory_report(url, args.admin_token)['rss_bytes']
+            if elapsed >= args.warmup:
+                if baseline is None:
+                    baseline = rss
+                samples.append((elapsed, rss))
+            growth = (rss - baseline) / MB if baseline is not None else 0.0
+            print(f'{elapsed:8.0f}s  rss {rss / MB:8.1f} MB  growth {growth:+7.1f} MB  {counters.snapshot()}',
+                  flush=True)
+            if elapsed >= args.duration:
+                break
+            time.sleep(min(args.sample_interval, max(0.0, args.duration - elapsed)))
+    finally:
+        stop.set()
+
+    headers = {'X-Admin-Token': args.admin_token} if args.admin_token else None
+    try:
+        diff = requests.post(f'{url}/api/admin/memory/snapshot', headers=headers, timeout=60)
+        top_growth = diff.json().get('top_growth', []) if diff.status_code == 200 else []
+    except requests.RequestException:
+        top_growth = []
+    if child is not None:
+        child.terminate()
+        child.wait()
+
+    final = samples[-1][1] if samples else None
+    summary = {
+        'rss_baseline_mb': round(baseline / MB, 2) if baseline else None,
+        'rss_final_mb': round(final / MB, 2) if final else None,
+        'growth_mb': round((final - baseline) / MB, 2) if samples else None,
+        'growth_mb_per_hour': round(growth_slope(samples), 2),
+        'budget_mb': args.budget_mb,
+    }
+    summary.update(counters.snapshot())
+    failed = summary['growth_mb'] is not None and summary['growth_mb'] > args.budget_mb
+
+    print(f"\nRSS {summary['rss_baseline_mb']} -> {summary['rss_final_mb']} MB "
+          f"({summary['growth_mb']:+} MB, {summary['growth_mb_per_hour']:+} MB/h), budget {args.budget_mb:g} MB")
+    if top_growth:
+        print('Largest allocation growth since the previous snapshot:')
+        for site in top_growth[:10]:
+            print(f"  {site['size_diff_bytes'] / 1024:+10.1f} KiB  {site['count_diff']:+7d} blocks  {site['site']}")
+    print('FAILED: memory grew beyond the budget' if failed else 'PASSED')
+
+    if args.output:
+        write_results(args.output, 'soak_test', args, {'soak': summary})
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
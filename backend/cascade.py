@@ -0,0 +1,391 @@
+"""
+A small local model between the SOAP keywords and zero-shot NLI.
+
+SpeechProcessor classifies a sentence in tiers. The keyword index answers
+first. A sentence it cannot place goes to NgramClassifier: hashed word and
+character n-grams feeding a linear softmax layer. That costs microseconds
+where the NLI model costs tens of milliseconds. Zero-shot only runs when the
+local model's confidence is below the configured threshold.
+
+The local model is trained offline from labels the zero-shot model has
+already produced. Set SOAP_CASCADE_LABEL_LOG and SpeechProcessor appends
+every zero-shot decision to a JSONL file. `label` produces the same records
+from a file of sentences. `train` fits the model and writes a versioned
+artifact. `evaluate` reports, for each threshold, the share of sentences the
+local model keeps off zero-shot and how often the cascade agrees with
+zero-shot alone.
+
+Usage (from the backend directory):
+    python cascade.py label sentences.txt --output labels.jsonl
+    python cascade.py train labels.jsonl --output model_artifacts/soap_cascade.json
+    python cascade.py evaluate labels.jsonl --model model_artifacts/soap_cascade.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout or the feature extraction changes
+FORMAT_VERSION = 1
+
+SECTIONS = ('subjective', 'objective', 'assessment', 'plan')
+
+TIERS = ('keyword', 'cache', 'local', 'zero_shot')
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+(?:[./][0-9]+)?')
+
+
+def features(sentence, n_buckets):
+    """Hashed word unigrams, bigrams and character trigrams, L2-normalized
+
+    Returns {bucket: value}. crc32 keeps the hashing stable across processes
+    and Python versions, which the built-in hash() does not.
+    """
+    words = WORD_PATTERN.findall(sentence.lower())
+    grams = [f'w:{word}' for word in words]
+    grams += [f'b:{first} {second}' for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f' {word} '
+        grams += [f'c:{padded[i:i + 3]}' for i in range(len(padded) - 2)]
+
+    counts = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode('utf-8')) % n_buckets
+        counts[bucket] = counts.get(bucket, 0) + 1
+    norm = math.sqrt(sum(count * count for count in counts.values())) or 1.0
+    return {bucket: count / norm for bucket, count in counts.items()}
+
+
+def softmax(logits):
+    top = max(logits)
+    exps = [math.exp(logit - top) for logit in logits]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+
+class NgramClassifier:
+    """Linear classifier over hashed n-grams; weights are {bucket: [weight per label]}"""
+
+    def __init__(self, labels, weights, bias, n_buckets, version=None, meta=None):
+        self.labels = list(labels)
+        self.weights = weights
+        self.bias = list(bias)
+        self.n_buckets = n_buckets
+        self.meta = dict(meta or {})
+        self.version = version or self._content_version()
+
+    def _content_version(self):
+        digest = hashlib.blake2b(digest_size=6)
+        digest.update(json.dumps([self.labels, self.bias, self.n_buckets]).encode('utf-8'))
+        for bucket in sorted(self.weights):
+            digest.update(json.dumps([bucket, self.weights[bucket]]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _logits(self, vector):
+        logits = list(self.bias)
+        for bucket, value in vector.items():
+            row = self.weights.get(bucket)
+            if row is not None:
+                for index, weight in enumerate(row):
+                    logits[index] += weight * value
+        return logits
+
+    def probabilities(self, sentence):
+        """{label: probability} for one sentence"""
+        return dict(zip(self.labels, softmax(self._logits(features(sentence, self.n_buckets)))))
+
+    def predict(self, sentence):
+        """(label, confidence) for one sentence"""
+        probabilities = softmax(self._logits(features(sentence, self.n_buckets)))
+        best = max(range(len(probabilities)), key=probabilities.__getitem__)
+        return self.labels[best], probabilities[best]
+
+    @classmethod
+    def train(cls, examples, labels=SECTIONS, n_buckets=2 ** 18, epochs=8, learning_rate=0.5, seed=0):
+        """Fit softmax regression with SGD on (sentence, label) examples"""
+        labels = list(labels)
+        label_index = {label: index for index, label in enumerate(labels)}
+        data = [(features(text, n_buckets), label_index[label]) for text, label in examples if label in label_index]
+        if not data:
+            raise ValueError('No training examples with a known label')
+
+        weights = {}
+        bias = [0.0] * len(labels)
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            for vector, target in data:
+                logits = list(bias)
+                for bucket, value in vector.items():
+                    row = weights.get(bucket)
+                    if row is not None:
+                        for index, weight in enumerate(row):
+                            logits[index] += weight * value
+                probabilities = softmax(logits)
+                # Gradient of the cross-entropy: predicted minus one-hot target
+                gradient = [probability - (index == target) for index, probability in enumerate(probabilities)]
+                for index, step in enumerate(gradient):
+                    bias[index] -= rate * step
+                for bucket, value in vector.items():
+                    row = weights.setdefault(bucket, [0.0] * len(labels))
+                    for index, step in enumerate(gradient):
+                        row[index] -= rate * step * value
+
+        meta = {
+            'trained_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'examples': len(data),
+            'epochs': epochs,
+            'learning_rate': learning_rate
+        }
+        return cls(labels, weights, bias, n_buckets, meta=meta)
+
+    def prune(self, min_weight):
+        """Drop buckets whose weights are all below min_weight; returns how many went"""
+        small = [bucket for bucket, row in self.weights.items() if max(abs(w) for w in row) < min_weight]
+        for bucket in small:
+            del self.weights[bucket]
+        self.version = self._content_version()
+        return len(small)
+
+    def to_dict(self):
+        return {
+            'format_version': FORMAT_VERSION,
+            'model_version': self.version,
+            'labels': self.labels,
+            'n_buckets': self.n_buckets,
+            'bias': self.bias,
+            'weights': {str(bucket): [round(w, 6) for w in row] for bucket, row in self.weights.items()},
+            'meta': self.meta
+        }
+
+    def save(self, path):
+        """Write the artifact atomically, so a running server never reads half a file"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(self.to_dict(), handle, separators=(',', ':'))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as handle:
+            data = json.load(handle)
+        if data.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has format version {data.get('format_version')}, expected {FORMAT_VERSION}; retrain it"
+            )
+        weights = {int(bucket): row for bucket, row in data['weights'].items()}
+        return cls(data['labels'], weights, data['bias'], data['n_buckets'],
+                   version=data['model_version'], meta=data.get('meta'))
+
+
+def load_local_model(path):
+    """The trained artifact at path, or None (logged) when it is missing or unreadable"""
+    if not path or not os.path.exists(path):
+        logger.info("No cascade model at %s; keyword misses go straight to zero-shot", path)
+        return None
+    try:
+        model = NgramClassifier.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Could not load cascade model {path}: {e}")
+        return None
+    logger.info("Loaded cascade model %s (version %s)", path, model.version)
+    return model
+
+
+class TierStats:
+    """How many sentences each tier of the cascade answered"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {tier: 0 for tier in TIERS}
+
+    def record(self, tier, count=1):
+        if count:
+            with self._lock:
+                self._counts[tier] += count
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        return {
+            'sentences': total,
+            'tiers': counts,
+            'share': {tier: round(count / total, 4) if total else 0.0 for tier, count in counts.items()}
+        }
+
+
+class LabelLog:
+    """Appends zero-shot decisions to a JSONL file as training data"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, records):
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        try:
+            with self._lock, open(self.path, 'a') as handle:
+                handle.write(lines)
+        except OSError as e:
+            logger.error(f"Could not append to label log {self.path}: {e}")
+
+
+def read_examples(path):
+    """(text, label) pairs from a JSONL label file, without duplicate texts"""
+    examples = {}
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                examples[record['text']] = record['label']
+    return list(examples.items())
+
+
+def split_holdout(examples, fraction, seed):
+    shuffled = list(examples)
+    random.Random(seed).shuffle(shuffled)
+    cut = int(len(shuffled) * fraction)
+    return shuffled[cut:], shuffled[:cut]
+
+
+def evaluate(model, examples, thresholds):
+    """Per threshold: share kept off zero-shot, local accuracy there, and cascade agreement
+
+    The labels are zero-shot's own answers. Sentences below the threshold go
+    to zero-shot, so they agree by definition. Agreement is therefore the
+    share of all sentences the cascade labels exactly as zero-shot alone
+    would.
+    """
+    predictions = [(model.predict(text), label) for text, label in examples]
+    report = {}
+    for threshold in thresholds:
+        kept = [(predicted, label) for (predicted, confidence), label in predictions if confidence >= threshold]
+        correct = sum(predicted == label for predicted, label in kept)
+        total = len(predictions) or 1
+        report[threshold] = {
+            'local_share': round(len(kept) / total, 4),
+            'local_accuracy': round(correct / len(kept), 4) if kept else None,
+            'agreement': round((total - len(kept) + correct) / total, 4)
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'threshold':>9} {'local share':>12} {'local acc':>10} {'agreement':>10}")
+    for threshold, row in report.items():
+        accuracy = '-' if row['local_accuracy'] is None else f"{row['local_accuracy']:.3f}"
+        print(f"{threshold:>9.2f} {row['local_share']:>12.3f} {accuracy:>10} {row['agreement']:>10.3f}")
+
+
+def label_command(args):
+    """Label sentences with the zero-shot model, as SpeechProcessor's label log would"""
+    from transformers import pipeline
+
+    from speech_processor import CANDIDATE_LABELS
+    from vocabulary import shared_vocabulary
+
+    with open(args.sentences) as handle:
+        sentences = list(dict.fromkeys(line.strip() for line in handle if line.strip()))
+    if not args.include_keyword_hits:
+        # Only keyword misses ever reach the later tiers
+        index = shared_vocabulary().current()
+        sentences = [sentence for sentence in sentences if index.classify(sentence).section is None]
+
+    classifier = pipeline('zero-shot-classification')
+    with open(args.output, 'a') as handle:
+        for start in range(0, len(sentences), args.batch_size):
+            batch = sentences[start:start + args.batch_size]
+            results = classifier(batch, list(CANDIDATE_LABELS), batch_size=args.batch_size)
+            if isinstance(results, dict):
+                results = [results]
+            for sentence, result in zip(batch, results):
+                handle.write(json.dumps({
+                    'text': sentence,
+                    'label': CANDIDATE_LABELS[result['labels'][0]],
+                    'score': round(result['scores'][0], 4)
+                }) + '\n')
+    print(f'Labelled {len(sentences)} sentences into {args.output}')
+    return 0
+
+
+def train_command(args):
+    examples = read_examples(args.labels)
+    train, holdout = split_holdout(examples, args.holdout, args.seed)
+    started = time.perf_counter()
+    model = NgramClassifier.train(train, n_buckets=args.buckets, epochs=args.epochs,
+                                  learning_rate=args.learning_rate, seed=args.seed)
+    pruned = model.prune(args.min_weight)
+    model.meta['source'] = os.path.basename(args.labels)
+    model.meta['holdout'] = len(holdout)
+    print(f'Trained on {len(train)} sentences in {time.perf_counter() - started:.1f}s; '
+          f'{len(model.weights)} buckets kept, {pruned} pruned')
+    if holdout:
+        report = evaluate(model, holdout, args.thresholds)
+        model.meta['holdout_report'] = {str(threshold): row for threshold, row in report.items()}
+        print_report(report)
+    model.save(args.output)
+    print(f'Wrote {args.output} (version {model.version})')
+    return 0
+
+
+def evaluate_command(args):
+    model = NgramClassifier.load(args.model)
+    print(f"Model version {model.version}, trained {model.meta.get('trained_at')}")
+    print_report(evaluate(model, read_examples(args.labels), args.thresholds))
+    return 0
+
+
+def main():
+    from config.settings import CASCADE
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+    thresholds = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95]
+
+    label = commands.add_parser('label', help='label sentences with the zero-shot model')
+    label.add_argument('sentences', help='text file, one sentence per line')
+    label.add_argument('--output', required=True, help='JSONL file to append to')
+    label.add_argument('--batch-size', type=int, default=16)
+    label.add_argument('--include-keyword-hits', action='store_true',
+                       help='also label sentences the keyword index already places')
+    label.set_defaults(run=label_command)
+
+    train = commands.add_parser('train', help='train and export the local model')
+    train.add_argument('labels', help='JSONL of {"text", "label"} records')
+    train.add_argument('--output', default=CASCADE['model_path'])
+    train.add_argument('--buckets', type=int, default=2 ** 18)
+    train.add_argument('--epochs', type=int, default=8)
+    train.add_argument('--learning-rate', type=float, default=0.5)
+    train.add_argument('--min-weight', type=float, default=1e-3, help='prune buckets with smaller weights')
+    train.add_argument('--holdout', type=float, default=0.1, help='fraction kept back for the report')
+    train.add_argument('--seed', type=int, default=0)
+    train.add_argument('--thresholds', type=float, nargs='+', default=thresholds)
+    train.set_defaults(run=train_command)
+
+    check = commands.add_parser('evaluate', help='report coverage and agreement per threshold')
+    check.add_argument('labels', help='JSONL of {"text", "label"} records')
+    check.add_argument('--model', default=CASCADE['model_path'])
+    check.add_argument('--thresholds', type=float, nargs='+', default=thresholds)
+    check.set_defaults(run=evaluate_command)
+
+    args = parser.parse_args()
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Long-document support for the classifier and NER pipelines.
+
+Notes longer than the model's token limit are split on sentence boundaries
+into overlapping token windows. All windows of a batch run through the
+pipeline together; NER offsets are mapped back onto the original text and
+duplicates from the overlaps are dropped, while classification scores are
+averaged across windows weighted by window length. The note is tokenized
+once to place the windows, so the cost grows linearly with its length.
+"""
+
+import re
+from bisect import bisect_left
+
+SENTENCE_PATTERN = re.compile(r'[^.!?\n]*(?:[.!?]+|\n+|$)')
+
+
+def sentence_spans(text):
+    """Character spans of the sentences (or lines) in text"""
+    return [
+        (match.start(), match.end())
+        for match in SENTENCE_PATTERN.finditer(text)
+        if match.group().strip()
+    ]
+
+
+def window_limit(tokenizer, max_tokens):
+    """Largest window the model accepts once its special tokens are added"""
+    model_limit = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+    return max(1, min(max_tokens, model_limit))
+
+
+def token_windows(text, tokenizer, max_tokens, overlap_tokens):
+    """Return (start, end) character spans of windows of at most max_tokens tokens
+
+    Windows break between sentences where possible and overlap their
+    neighbour by up to overlap_tokens. Text that fits returns one window.
+    """
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)['offset_mapping']
+    if len(offsets) <= max_tokens:
+        return [(0, len(text))]
+
+    # Sentences as token ranges; sentences longer than a window are cut hard
+    token_starts = [start for start, _ in offsets]
+    units = []
+    for span_start, span_end in sentence_spans(text):
+        first = bisect_left(token_starts, span_start)
+        last = bisect_left(token_starts, span_end)
+        for piece in range(first, last, max_tokens):
+            units.append((piece, min(piece + max_tokens, last)))
+
+    windows = []
+    first = end = 0
+    while first < len(units):
+        # Units only get shorter relative to a later first unit, so end never moves back
+        end = max(end, first + 1)
+        while end < len(units) and units[end][1] - units[first][0] <= max_tokens:
+            end += 1
+        windows.append((offsets[units[first][0]][0], offsets[units[end - 1][1] - 1][1]))
+        if end == len(units):
+            break
+        # Step back so the next window repeats up to overlap_tokens of this one
+        next_first = end
+        while next_first - 1 > first and units[end - 1][1] - units[next_first - 1][0] <= overlap_tokens:
+            next_first -= 1
+        first = next_first
+    return windows
+
+
+def _windowed(pipe, texts, max_tokens, overlap_tokens):
+    limit = window_limit(pipe.tokenizer, max_tokens)
+    windows = [token_windows(text, pipe.tokenizer, limit, overlap_tokens) for text in texts]
+    pieces = [text[start:end] for text, spans in zip(texts, windows) for start, end in spans]
+    return windows, pieces
+
+
+def _regroup(windows, outputs):
+    outputs = iter(outputs)
+    return [[next(outputs) for _ in spans] for spans in windows]
+
+
+def score_long_texts(classifier, texts, max_tokens=510, overlap_tokens=64, batch_size=16):
+    """Score every label for texts of any length; returns one {label: score} per text"""
+    windows, pieces = _windowed(classifier, texts, max_tokens, overlap_tokens)
+    outputs = classifier(pieces, batch_size=min(batch_size, len(pieces)), top_k=None)
+
+    results = []
+    for spans, window_outputs in zip(windows, _regroup(windows, outputs)):
+        totals = {}
+        weights = [end - start for start, end in spans]
+        for scores, weight in zip(window_outputs, weights):
+            for item in scores:
+                totals[item['label']] = totals.get(item['label'], 0.0) + float(item['score']) * weight
+        total_weight = sum(weights) or 1
+        results.append({label: total / total_weight for label, total in totals.items()})
+    return results
+
+
+def best_label(scores):
+    label, score = max(scores.items(), key=lambda item: item[1])
+    return {'label': label, 'score': score}
+
+
+def classify_long_texts(classifier, texts, max_tokens=510, overlap_tokens=64, batch_size=16):
+    """Classify texts of any length; returns one {'label', 'score'} per text"""
+    return [best_label(scores)
+            for scores in score_long_texts(classifier, texts, max_tokens, overlap_tokens, batch_size)]
+
+
+def merge_entities(entities):
+    """Drop entities that overlap an earlier one, keeping the higher score"""
+    merged = []
+    for entity in sorted(entities, key=lambda e: (e['start'], -e['score'])):
+        if merged and entity['start'] < merged[-1]['end']:
+            if entity['score'] > merged[-1]['score']:
+                merged[-1] = entity
+            continue
+        merged.append(entity)
+    return merged
+
+
+def tag_long_texts(ner, texts, max_tokens=510, overlap_tokens=64, batch_size=16):
+    """Run NER over texts of any length; offsets refer to the original text"""
+    windows, pieces = _windowed(ner, texts, max_tokens, overlap_tokens)
+    outputs = ner(pieces, batch_size=min(batch_size, len(pieces)))
+
+    results = []
+    for text, spans, window_outputs in zip(texts, windows, _regroup(windows, outputs)):
+        if len(spans) == 1:
+            results.append(window_outputs[0])
+            continue
+        entities = []
+        for (window_start, _), window_entities in zip(spans, window_outputs):
+            for entity in window_entities:
+                entity = dict(entity)
+                entity['start'] += window_start
+                entity['end'] += window_start
+                entities.append(entity)
+        results.append(merge_entities(entities))
+    return results
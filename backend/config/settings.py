@@ -13,53 +13,299 @@ PORT = int(os.getenv('PORT', 5000))
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 HOST = os.getenv('HOST', '127.0.0.1')
 
+# Socket.IO real-time layer (realtime.py)
+SOCKETIO = {
+    # threading: one OS thread per connection; eventlet or gevent: an event loop
+    # that holds thousands of idle connections cheaply. Model inference blocks an
+    # event loop, so pair those modes with a separate analysis server.
+    'async_mode': os.getenv('SOCKETIO_ASYNC_MODE', 'threading'),
+    # Pub/sub shared by several server processes (redis://host:6379/0); empty
+    # keeps room broadcasts inside this process
+    'message_queue': os.getenv('SOCKETIO_MESSAGE_QUEUE', ''),
+    # Messages to a room within this window go out as one batch
+    'flush_ms': float(os.getenv('SOCKETIO_FLUSH_MS', 25)),
+    'max_batch': int(os.getenv('SOCKETIO_MAX_BATCH', 100)),
+    # Unacknowledged batches before a client counts as slow, and how many
+    # messages are then held for it
+    'max_in_flight': int(os.getenv('SOCKETIO_MAX_IN_FLIGHT', 4)),
+    'max_backlog': int(os.getenv('SOCKETIO_MAX_BACKLOG', 500)),
+    'ack_timeout': float(os.getenv('SOCKETIO_ACK_TIMEOUT', 10)),
+}
+
+# Hugging Face models used by /api/analyze
+MODELS = {
+    'classifier': os.getenv('CLASSIFIER_MODEL', 'emilyalsentzer/Bio_ClinicalBERT'),
+    'ner': os.getenv('NER_MODEL', 'd4data/biomedical-ner-all'),
+}
+
+# CPU inference backend for the models above: pytorch, quantized (dynamic
+# int8), onnx or onnx-int8. Converted models are cached in cache_dir.
+INFERENCE_BACKEND = {
+    'backend': os.getenv('INFERENCE_BACKEND', 'pytorch'),
+    'cache_dir': os.getenv(
+        'MODEL_ARTIFACT_DIR',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_artifacts')
+    ),
+}
+
+# Pre-forking server (prefork_server.py): models load once in the parent and
+# the forked workers share them copy-on-write
+PREFORK = {
+    'workers': int(os.getenv('PREFORK_WORKERS', os.cpu_count() or 1)),
+    # torch intra-op threads per worker; workers x threads should not exceed the cores
+    'threads_per_worker': int(os.getenv('PREFORK_THREADS', 1)),
+    'preload_speech': os.getenv('PREFORK_PRELOAD_SPEECH', 'True').lower() == 'true',
+}
+
+# Long notes are split into overlapping token windows for the models
+CHUNKING = {
+    'max_tokens': int(os.getenv('CHUNK_MAX_TOKENS', 510)),
+    'overlap_tokens': int(os.getenv('CHUNK_OVERLAP_TOKENS', 64)),
+    'batch_size': int(os.getenv('CHUNK_BATCH_SIZE', 16)),
+}
+
+# Model loading settings
+MODEL_LOADING = {
+    # eager: load before serving, background: load on a thread at startup,
+    # lazy: load when the first request needs the models
+    'mode': os.getenv('MODEL_LOADING_MODE', 'background'),
+    # wait: hold requests until the models are ready, reject: answer 503
+    'not_ready_policy': os.getenv('MODEL_NOT_READY_POLICY', 'wait'),
+    'wait_timeout': float(os.getenv('MODEL_WAIT_TIMEOUT', 60)),
+    'retry_after': int(os.getenv('MODEL_RETRY_AFTER', 5)),
+    # The dictation models (spaCy, zero-shot) load when dictation first starts
+    'speech_mode': os.getenv('SPEECH_MODEL_LOADING_MODE', 'lazy'),
+}
+
+# Replacing the classifier or NER model at runtime (/api/admin/models)
+MODEL_MANAGER = {
+    # Warm-up replays the last recent_notes analyzed notes plus replay_path
+    # (one note per line) through the candidate warmup_passes times
+    'recent_notes': int(os.getenv('MODEL_REPLAY_RECENT', 50)),
+    'replay_path': os.getenv('MODEL_REPLAY_PATH') or None,
+    'warmup_passes': int(os.getenv('MODEL_WARMUP_PASSES', 2)),
+    # Fraction of live batches also run on the candidate (0 skips shadowing)
+    'shadow_fraction': float(os.getenv('MODEL_SHADOW_FRACTION', 0)),
+    'shadow_samples': int(os.getenv('MODEL_SHADOW_SAMPLES', 200)),
+    'shadow_timeout': float(os.getenv('MODEL_SHADOW_TIMEOUT', 600)),
+    # A shadowed candidate is promoted only within these limits
+    'min_agreement': float(os.getenv('MODEL_MIN_AGREEMENT', 0.95)),
+    'max_latency_ratio': float(os.getenv('MODEL_MAX_LATENCY_RATIO', 1.5)),
+    'auto_promote': os.getenv('MODEL_AUTO_PROMOTE', 'True').lower() == 'true',
+    # Process RSS allowed while old and new models are both loaded (0: no cap)
+    'memory_cap_bytes': int(float(os.getenv('MODEL_MEMORY_CAP_MB', 0)) * 1024 * 1024),
+}
+
+# Message and transcription storage
+MESSAGE_STORE = {
+    'path': os.getenv('MESSAGE_STORE_PATH', 'messages.db'),
+    # Oldest records beyond these limits are pruned; 0 disables a limit
+    'max_rows': int(os.getenv('MESSAGE_STORE_MAX_ROWS', 10000)),
+    'max_age_days': float(os.getenv('MESSAGE_STORE_MAX_AGE_DAYS', 30)),
+    'page_size': int(os.getenv('MESSAGE_PAGE_SIZE', 100)),
+    'max_page_size': int(os.getenv('MESSAGE_MAX_PAGE_SIZE', 1000)),
+}
+
 # Speech recognition settings
 SPEECH_RECOGNITION = {
     'energy_threshold': 300,
     'dynamic_energy_threshold': True,
+    'dynamic_energy_ratio': 1.5,
+    'dynamic_energy_damping': 0.15,
     'pause_threshold': 0.8,
+    # Each dictation session measures ambient noise once, from the quietest
+    # frames at the start of its first chunk
+    'calibration_seconds': float(os.getenv('SPEECH_CALIBRATION_SECONDS', 1.0)),
+    # Chunks that never rise above the session's threshold skip recognition
+    'skip_silence': os.getenv('SPEECH_SKIP_SILENCE', 'True').lower() == 'true',
+}
+
+# Per-session speech processors (speech_pool.py); they share one set of models
+SPEECH_POOL = {
+    'max_sessions': int(os.getenv('SPEECH_POOL_MAX_SESSIONS', 64)),
+    # Sessions with no activity for this long are closed and their processor reused
+    'idle_timeout': float(os.getenv('SPEECH_POOL_IDLE_TIMEOUT', 300)),
+}
+
+# Streaming audio ingestion (audio_ingest.py)
+AUDIO_INGEST = {
+    # google (network), sphinx (offline, needs pocketsphinx) or offline (test stand-in)
+    'recognizer': os.getenv('SPEECH_RECOGNIZER', 'google'),
+    'language': os.getenv('SPEECH_LANGUAGE', 'en-US'),
+    'recognizer_timeout': float(os.getenv('SPEECH_RECOGNIZER_TIMEOUT', 10)),
+    'workers': int(os.getenv('AUDIO_INGEST_WORKERS', 4)),
+    # Utterances waiting for a recognizer across all streams before uploads get 429
+    'max_pending': int(os.getenv('AUDIO_INGEST_MAX_PENDING', 32)),
+    'sample_rate': 16000,
+    'frame_ms': 30,
+    'min_speech_seconds': 0.25,
+    'max_segment_seconds': 10,
+    'pre_roll_seconds': 0.3,
+    'read_size': 65536,
+    'finish_timeout': 30,
+    # HTTP streams with no upload for this long are dropped
+    'idle_timeout': 300,
+}
+
+# spaCy settings used by SpeechProcessor
+SPACY = {
+    'model': os.getenv('SPACY_MODEL', 'en_core_web_sm'),
+    # Only sentence boundaries (parser) and entities (ner) are used
+    'exclude': ['tagger', 'attribute_ruler', 'lemmatizer'],
+    'batch_size': int(os.getenv('SPACY_BATCH_SIZE', 32)),
+    'n_process': int(os.getenv('SPACY_N_PROCESS', 1)),
+}
+
+# Transcription clean-up: misheard variant -> correct term. Matched as whole
+# words in a single pass, so the table can grow without slowing each sentence.
+TRANSCRIPTION_CORRECTIONS = {
+    'blood pressure': ['blood fresher', 'blood presser'],
+    'hypertension': ['high pertension', 'high tension'],
+    'diabetes': ['diabetics', 'diabeties'],
+    'medication': ['medications', 'medicine'],
+    'temperature': ['temp'],
 }
 
-# SOAP note settings
-SOAP_CATEGORIES = {
-    'subjective': [
-        'patient reports', 'complains of', 'states', 'describes', 'feels',
-        'denies', 'admits', 'history', 'symptoms', 'pain scale'
-    ],
-    'objective': [
-        'vital signs', 'examination reveals', 'observed', 'auscultation',
-        'palpation', 'measured', 'test results', 'lab values', 'findings'
-    ],
-    'assessment': [
-        'diagnosis', 'impression', 'likely', 'suspected', 'differential',
-        'consistent with', 'suggests', 'indicates', 'assessment'
-    ],
-    'plan': [
-        'recommend', 'prescribe', 'plan', 'treatment', 'follow up',
-        'refer', 'order', 'schedule', 'instructions', 'education'
-    ]
-}
-
-# Medical terms dictionary
-MEDICAL_TERMS = {
-    'vitals': [
-        'BP', 'HR', 'RR', 'T', 'SpO2',
-        'blood pressure', 'heart rate', 'respiratory rate',
-        'temperature', 'oxygen saturation'
-    ],
-    'measurements': [
-        'kg', 'cm', 'mm Hg', 'bpm', 'celsius', 'fahrenheit'
-    ],
-    'assessments': [
-        'diagnosis', 'differential', 'impression',
-        'assessment', 'suspected'
-    ],
-    'medications': [
-        'mg', 'mcg', 'ml', 'tablet', 'capsule',
-        'injection', 'oral', 'IV', 'IM'
-    ],
-    'timing': [
-        'bid', 'tid', 'qid', 'prn', 'daily', 'weekly',
-        'q4h', 'q6h', 'q8h', 'q12h'
-    ]
-} 
\ No newline at end of file
+# Spoken measurement formats rewritten after corrections (pattern, replacement)
+UNIT_REWRITES = [
+    (r'(\d+)\s*over\s*(\d+)', r'\1/\2'),  # Blood pressure format
+    (r'(\d+)\s*bpm', r'\1 BPM'),  # Heart rate
+    (r'(\d+)\s*degrees?', r'\1°'),  # Temperature
+]
+
+# Extraction patterns; every pattern names the groups it reports
+EXTRACTION_PATTERNS = {
+    'vitals': {
+        'blood_pressure': r'\bBP[:\s]*(?P<value>\d+/\d+)',
+        'heart_rate': r'\bHR[:\s]*(?P<value>\d+)',
+        'temperature': r'\bT[:\s]*(?P<value>\d+\.?\d*)',
+        'respiratory_rate': r'\bRR[:\s]*(?P<value>\d+)',
+        'oxygen_saturation': r'\bSpO2[:\s]*(?P<value>\d+%?)',
+    },
+    'measurements': {
+        'weight': r'(?P<value>\d+\.?\d*)\s*(?P<unit>kg|pounds|lbs)\b',
+        'height': r'(?P<value>\d+\.?\d*)\s*(?P<unit>cm|meters|m)\b',
+        'bmi': r'\bBMI[:\s]*(?P<value>\d+\.?\d*)',
+    },
+    'medications': {
+        'medication': r'(?P<dosage>\d+\s*(?:mg/ml|mcg/ml|mg|mcg|ml|g))\s*of\s*(?P<medication>[A-Za-z]+)',
+    },
+    'follow_up': {
+        'follow_up': r'(?i:follow\s*(?:up|-up)\s*in\s*(?P<duration>\d+)\s*(?P<unit>days|weeks|months))',
+    },
+}
+
+# Zero-shot SOAP sentence classification used by SpeechProcessor
+ZERO_SHOT = {
+    'batch_size': int(os.getenv('ZERO_SHOT_BATCH_SIZE', 16)),
+    # Recently classified sentences are answered without calling the model
+    'cache_size': int(os.getenv('ZERO_SHOT_CACHE_SIZE', 4096)),
+}
+
+# Local model tried between the keywords and zero-shot (cascade.py)
+CASCADE = {
+    'enabled': os.getenv('SOAP_CASCADE', 'True').lower() == 'true',
+    'model_path': os.getenv(
+        'SOAP_CASCADE_MODEL',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_artifacts', 'soap_cascade.json')
+    ),
+    # Sentences the local model is less sure about than this still go to zero-shot
+    'threshold': float(os.getenv('SOAP_CASCADE_THRESHOLD', 0.8)),
+    # Append zero-shot decisions to this JSONL file to collect training data
+    'label_log': os.getenv('SOAP_CASCADE_LABEL_LOG') or None,
+}
+
+# SOAP section keywords, plan sub-categories and medical terms; the file is
+# reloaded when it changes (checked at most every reload_interval seconds)
+VOCABULARY = {
+    'path': os.getenv(
+        'VOCABULARY_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vocabulary.json')
+    ),
+    'reload_interval': float(os.getenv('VOCABULARY_RELOAD_INTERVAL', 5)),
+}
+
+# Inference batching settings
+INFERENCE_BATCHING = {
+    'enabled': os.getenv('INFERENCE_BATCHING', 'True').lower() == 'true',
+    'max_batch_size': int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8)),
+    'max_wait_ms': float(os.getenv('INFERENCE_MAX_WAIT_MS', 10)),
+    'request_timeout': float(os.getenv('INFERENCE_REQUEST_TIMEOUT', 30)),
+}
+
+# Admission control for inference routes (admission.py)
+ADMISSION = {
+    'enabled': os.getenv('ADMISSION_CONTROL', 'True').lower() == 'true',
+    # Requests running inference at once, and torch intra-op threads; 0 sizes
+    # both from the CPU cores
+    'workers': int(os.getenv('ADMISSION_WORKERS', 0)),
+    'torch_threads': int(os.getenv('TORCH_THREADS', 0)),
+    # Waiting requests across both lanes, and how many of them may be bulk
+    'max_queue': int(os.getenv('ADMISSION_MAX_QUEUE', 64)),
+    'bulk_max_queue': int(os.getenv('ADMISSION_BULK_MAX_QUEUE', 16)),
+    # Longest a request waits for a slot; clients may ask for less with the deadline header
+    'queue_timeout': float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10)),
+    'min_retry_after': int(os.getenv('ADMISSION_MIN_RETRY_AFTER', 1)),
+    # 'X-Priority: bulk' (or ?priority=bulk) puts a request behind interactive ones
+    'priority_header': 'X-Priority',
+    'deadline_header': 'X-Deadline-Ms',
+}
+
+# Analysis result cache settings
+RESULT_CACHE = {
+    'enabled': os.getenv('RESULT_CACHE', 'True').lower() == 'true',
+    'max_bytes': int(os.getenv('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    'ttl_seconds': float(os.getenv('RESULT_CACHE_TTL', 24 * 60 * 60)),
+    # Set to a file path to keep results across restarts
+    'disk_path': os.getenv('RESULT_CACHE_DISK_PATH') or None,
+    'disk_max_bytes': int(os.getenv('RESULT_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024)),
+    # Expired disk rows are swept every this many writes
+    'disk_prune_every': int(os.getenv('RESULT_CACHE_DISK_PRUNE_EVERY', 100)),
+}
+
+# Sentence-level re-analysis of notes resubmitted with a note_id (note_revisions.py)
+NOTE_REVISIONS = {
+    'enabled': os.getenv('NOTE_REVISIONS', 'True').lower() == 'true',
+    # Notes whose sentence results are kept; the least recently edited go first
+    'max_notes': int(os.getenv('NOTE_REVISIONS_MAX_NOTES', 1000)),
+    'ttl_seconds': float(os.getenv('NOTE_REVISIONS_TTL', 60 * 60)),
+}
+
+# Response serialization and compression (encoding.py)
+RESPONSE_ENCODING = {
+    # Smaller bodies are sent uncompressed; compressing them costs more than it saves
+    'compress_min_bytes': int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 1024)),
+    'gzip_level': int(os.getenv('RESPONSE_GZIP_LEVEL', 6)),
+    'brotli_quality': int(os.getenv('RESPONSE_BROTLI_QUALITY', 5)),
+    # Compressed NDJSON history is flushed to the client every this many records
+    'ndjson_flush_records': int(os.getenv('RESPONSE_NDJSON_FLUSH_RECORDS', 64)),
+    # Notes accepted by one /api/analyze/batch request
+    'batch_max_notes': int(os.getenv('ANALYZE_BATCH_MAX_NOTES', 500)),
+}
+
+# Opt-in tracemalloc sampling (memory_diagnostics.py); costs memory and CPU while on
+MEMORY_DIAGNOSTICS = {
+    'enabled': os.getenv('MEMORY_DIAGNOSTICS', 'False').lower() == 'true',
+    # Seconds between snapshot diffs, and how many of them keep an RSS sample
+    'interval': float(os.getenv('MEMORY_DIAGNOSTICS_INTERVAL', 300)),
+    'history': int(os.getenv('MEMORY_DIAGNOSTICS_HISTORY', 288)),
+    # Stack depth recorded per allocation, and the growing sites reported
+    'frames': int(os.getenv('MEMORY_DIAGNOSTICS_FRAMES', 8)),
+    'top': int(os.getenv('MEMORY_DIAGNOSTICS_TOP', 20)),
+    # Group growth by 'lineno' (allocation line) or 'traceback' (whole stack)
+    'key_type': os.getenv('MEMORY_DIAGNOSTICS_KEY', 'lineno'),
+}
+
+# /api/admin endpoints; without a token they only answer requests from this host
+ADMIN = {
+    'token': os.getenv('ADMIN_TOKEN') or None,
+    'token_header': 'X-Admin-Token',
+}
+
+# Stage timing and the /metrics endpoint
+METRICS = {
+    # Requests sending this header (any value) get a Server-Timing stage breakdown
+    'trace_header': os.getenv('METRICS_TRACE_HEADER', 'X-Diabuddy-Trace'),
+    # Fraction of other requests traced as well; sampled breakdowns are logged
+    'trace_sample_rate': float(os.getenv('METRICS_TRACE_SAMPLE_RATE', 0)),
+}
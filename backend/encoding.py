@@ -0,0 +1,152 @@
+"""
+Response encoding with content negotiation.
+
+Payloads are serialized with orjson when it is installed, and fall back to
+the standard json module otherwise. A client that sends
+`Accept: application/msgpack` gets MessagePack instead, if msgpack is
+installed. Bodies of at least min_bytes are compressed with brotli or gzip,
+whichever the client accepts, preferring brotli. numpy scalars and arrays,
+sets and datetimes are converted on the way out, so model output can be
+returned as it is.
+
+Bulk results and history are streamed as NDJSON: one JSON document per
+line, encoded and compressed as the records are produced. The whole payload
+is never built in memory. Compressed streams are flushed every few records,
+so the client can decode each line as soon as it arrives.
+"""
+
+import gzip
+import json
+import zlib
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+NDJSON = 'application/x-ndjson'
+
+# Older clients ask for MessagePack under this name
+MSGPACK_ALIASES = ('application/x-msgpack',)
+
+
+def _default(value):
+    """Convert what the encoders cannot serialize themselves"""
+    if hasattr(value, 'tolist'):
+        # numpy scalars and arrays
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+def dumps_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_msgpack(payload):
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+def available_formats():
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def choose_format(accept):
+    """The media type to answer with for an Accept header (werkzeug MIMEAccept)"""
+    if msgpack is not None and any(accept[alias] for alias in MSGPACK_ALIASES) and not accept[MSGPACK]:
+        return MSGPACK
+    return accept.best_match(available_formats(), default=JSON) or JSON
+
+
+def choose_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header (werkzeug Accept)"""
+    for encoding in available_encodings():
+        if accept_encoding[encoding]:
+            return encoding
+    return None
+
+
+def serialize(payload, media_type):
+    return dumps_msgpack(payload) if media_type == MSGPACK else dumps_json(payload)
+
+
+def compress(body, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(body, quality=level['br'])
+    return gzip.compress(body, compresslevel=level['gzip'], mtime=0)
+
+
+class _StreamCompressor:
+    """Incremental gzip or brotli whose flush() emits everything written so far"""
+
+    def __init__(self, encoding, level):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=level['br'])
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self._zlib = zlib.compressobj(level['gzip'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def write(self, data):
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        if self._brotli is not None:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def ndjson_chunks(records, encoding=None, level=None, flush_every=16):
+    """Yield records as NDJSON lines, compressed incrementally when encoding is set
+
+    Compressed output is flushed every flush_every records; pass 1 when
+    records are slow to produce and each should reach the client at once.
+    """
+    if encoding is None:
+        for record in records:
+            yield dumps_json(record) + b'\n'
+        return
+
+    compressor = _StreamCompressor(encoding, level)
+    pending = 0
+    for record in records:
+        chunk = compressor.write(dumps_json(record) + b'\n')
+        pending += 1
+        if pending >= flush_every:
+            chunk += compressor.flush()
+            pending = 0
+        if chunk:
+            yield chunk
+    tail = compressor.flush() + compressor.finish()
+    if tail:
+        yield tail
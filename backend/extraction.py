@@ -0,0 +1,134 @@
+"""
+Compiled extraction of vitals, measurements, medications and follow-up
+timing, plus clean-up of transcribed medical terms.
+
+Every pattern table in config/settings.py is compiled once into a single
+alternation whose branches are named after the patterns, so one scan of a
+sentence reports every match of every pattern together with its character
+offsets. Corrections are folded into a trie-shaped alternation of whole
+words and resolved through a lookup table, so adding hundreds of them still
+costs a single pass per sentence.
+"""
+
+import re
+from collections import namedtuple
+
+from config.settings import EXTRACTION_PATTERNS, TRANSCRIPTION_CORRECTIONS, UNIT_REWRITES
+
+Extraction = namedtuple('Extraction', ['name', 'groups', 'start', 'end'])
+
+_NAMED_GROUP = re.compile(r'\(\?P<(\w+)>')
+_BACKREFERENCE = re.compile(r'\(\?P=(\w+)\)')
+_TEMPLATE_GROUP = re.compile(r'\\(?:g<(\d+)>|(\d+))')
+
+
+def trie_pattern(words):
+    """Regex matching any of words, with shared prefixes factored out
+
+    Branches at each level start with different characters, so the regex
+    engine never retries a prefix it has already matched.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # A word ends here; the longer continuation is still tried first
+            return f'(?:{body})?'
+        return body
+
+    return build(trie)
+
+
+def combine_patterns(patterns):
+    """Compile {name: pattern} into one regex with a named branch per pattern
+
+    Named groups inside a pattern are renamed ``<name>__<group>`` so patterns
+    can reuse group names. Patterns should not overlap: at any position the
+    first listed pattern that matches wins.
+    """
+    branches = []
+    for name, pattern in patterns.items():
+        pattern = _NAMED_GROUP.sub(lambda m: f'(?P<{name}__{m.group(1)}>', pattern)
+        pattern = _BACKREFERENCE.sub(lambda m: f'(?P={name}__{m.group(1)})', pattern)
+        branches.append(f'(?P<{name}>{pattern})')
+    return re.compile('|'.join(branches))
+
+
+class ExtractionEngine:
+    """Extraction patterns, corrections and unit rewrites compiled once"""
+
+    def __init__(self, patterns, corrections, unit_rewrites):
+        self._scanners = {}
+        self._group_names = {}
+        for kind, table in patterns.items():
+            scanner = combine_patterns(table)
+            self._scanners[kind] = scanner
+            self._group_names[kind] = {
+                name: [(group, group[len(name) + 2:]) for group in scanner.groupindex
+                       if group.startswith(name + '__')]
+                for name in table
+            }
+
+        self._corrections = {
+            variant.lower(): correct for correct, variants in corrections.items() for variant in variants
+        }
+        self._correction_pattern = None
+        if self._corrections:
+            self._correction_pattern = re.compile(
+                r'(?<!\w)' + trie_pattern(self._corrections) + r'(?!\w)'
+            )
+
+        self._rewrite_pattern = None
+        self._rewrite_templates = {}
+        if unit_rewrites:
+            self._rewrite_pattern = combine_patterns(
+                {f'rewrite_{index}': pattern for index, (pattern, _) in enumerate(unit_rewrites)}
+            )
+            for index, (_, template) in enumerate(unit_rewrites):
+                offset = self._rewrite_pattern.groupindex[f'rewrite_{index}']
+                # Group numbers in the template are relative to its own pattern
+                self._rewrite_templates[f'rewrite_{index}'] = _TEMPLATE_GROUP.sub(
+                    lambda m, offset=offset: f'\\g<{offset + int(m.group(1) or m.group(2))}>', template
+                )
+
+    @classmethod
+    def from_settings(cls):
+        return cls(EXTRACTION_PATTERNS, TRANSCRIPTION_CORRECTIONS, UNIT_REWRITES)
+
+    @property
+    def kinds(self):
+        return list(self._scanners)
+
+    def find(self, kind, text):
+        """Every match of one kind of pattern in text, in order of position"""
+        group_names = self._group_names[kind]
+        results = []
+        for match in self._scanners[kind].finditer(text):
+            name = match.lastgroup
+            groups = {short: match.group(full) for full, short in group_names[name]}
+            results.append(Extraction(name, groups, match.start(), match.end()))
+        return results
+
+    def extract_all(self, text):
+        """Every match of every kind, as {kind: [Extraction, ...]}"""
+        return {kind: self.find(kind, text) for kind in self._scanners}
+
+    def correct(self, text):
+        """Lowercase text, fix misheard medical terms and normalize spoken units"""
+        text = text.lower()
+        if self._correction_pattern is not None:
+            text = self._correction_pattern.sub(lambda m: self._corrections[m.group()], text)
+        if self._rewrite_pattern is not None:
+            text = self._rewrite_pattern.sub(
+                lambda m: m.expand(self._rewrite_templates[m.lastgroup]), text
+            )
+        return text
@@ -0,0 +1,180 @@
+"""
+Pluggable CPU inference backends for the Hugging Face pipelines.
+
+    pytorch    full-precision PyTorch (the original behaviour)
+    mmap       full-precision PyTorch with the weights memory-mapped from a
+               safetensors export, so processes share them via the page cache
+    quantized  PyTorch with dynamic int8 quantization of the Linear layers
+    onnx       ONNX Runtime on an exported graph
+    onnx-int8  ONNX Runtime on a dynamically int8-quantized export
+
+Exported and quantized artifacts are cached on disk under the configured
+artifact directory, so the conversion cost is only paid once per model.
+The ONNX backends need the optional ``optimum[onnxruntime]`` package.
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import warnings
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('pytorch', 'mmap', 'quantized', 'onnx', 'onnx-int8')
+
+# Pipeline task -> (transformers auto class, optimum ORT class)
+TASK_MODEL_CLASSES = {
+    'text-classification': ('AutoModelForSequenceClassification', 'ORTModelForSequenceClassification'),
+    'ner': ('AutoModelForTokenClassification', 'ORTModelForTokenClassification'),
+}
+
+# safetensors dtype codes -> torch dtype names
+SAFETENSORS_DTYPES = {
+    'F64': 'float64', 'F32': 'float32', 'F16': 'float16', 'BF16': 'bfloat16',
+    'I64': 'int64', 'I32': 'int32', 'I16': 'int16', 'I8': 'int8', 'U8': 'uint8', 'BOOL': 'bool',
+}
+
+
+def artifact_dir(cache_dir, model_id, backend):
+    """Directory holding the cached artifact for one model and backend"""
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '--', model_id)
+    return os.path.join(cache_dir, safe_name, backend)
+
+
+def build_pipeline(task, model_id, backend='pytorch', cache_dir='model_artifacts', device=-1, **kwargs):
+    """Create a transformers pipeline for ``task`` on the requested backend"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+    from transformers import AutoTokenizer, pipeline
+
+    if backend == 'pytorch':
+        return pipeline(task, model=model_id, tokenizer=model_id, device=device, **kwargs)
+
+    # The optimized backends are CPU-only
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    if backend == 'mmap':
+        model = load_mmap(task, model_id, cache_dir)
+    elif backend == 'quantized':
+        model = load_quantized(task, model_id, cache_dir)
+    else:
+        model = load_onnx(task, model_id, cache_dir, quantize=backend == 'onnx-int8')
+    return pipeline(task, model=model, tokenizer=tokenizer, device=-1, **kwargs)
+
+
+def mmap_state_dict(path):
+    """Tensors of a safetensors file as read-only views of a memory map
+
+    Nothing is copied: the weights stay in the page cache, where every
+    process that maps the same file shares one physical copy.
+    """
+    import torch
+
+    with open(path, 'rb') as handle:
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    header_size = struct.unpack('<Q', mapped[:8])[0]
+    header = json.loads(mapped[8:8 + header_size])
+    header.pop('__metadata__', None)
+    data_start = 8 + header_size
+
+    state_dict = {}
+    with warnings.catch_warnings():
+        # torch warns that the buffer is read-only; inference never writes weights
+        warnings.simplefilter('ignore', UserWarning)
+        for name, info in header.items():
+            dtype = getattr(torch, SAFETENSORS_DTYPES[info['dtype']])
+            start, end = info['data_offsets']
+            if start == end:
+                state_dict[name] = torch.empty(info['shape'], dtype=dtype)
+                continue
+            count = (end - start) // torch.empty((), dtype=dtype).element_size()
+            tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=data_start + start)
+            state_dict[name] = tensor.reshape(info['shape'])
+    return state_dict
+
+
+def load_mmap(task, model_id, cache_dir):
+    """Load a model whose weights are memory-mapped, exporting safetensors on first use"""
+    import transformers
+
+    auto_class = getattr(transformers, TASK_MODEL_CLASSES[task][0])
+    path = artifact_dir(cache_dir, model_id, 'mmap')
+    weights = os.path.join(path, 'model.safetensors')
+
+    if not os.path.exists(weights):
+        model = auto_class.from_pretrained(model_id)
+        # One unsharded file keeps the mapping simple; these models are well under the limit
+        model.save_pretrained(path, safe_serialization=True, max_shard_size='100GB')
+        logger.info(f"Exported {model_id} to safetensors in {path}")
+        del model
+
+    # Build the module skeleton, then swap its parameters for the mapped tensors
+    config = transformers.AutoConfig.from_pretrained(path)
+    model = auto_class.from_config(config)
+    missing, unexpected = model.load_state_dict(mmap_state_dict(weights), strict=False, assign=True)
+    if unexpected:
+        logger.warning(f"Ignored unexpected weights for {model_id}: {unexpected}")
+    if missing:
+        logger.info(f"Weights not in the export for {model_id} keep their defaults: {missing}")
+    model.eval()
+    return model
+
+
+def load_quantized(task, model_id, cache_dir):
+    """Load a dynamically int8-quantized PyTorch model, quantizing on first use"""
+    import torch
+    import transformers
+
+    auto_class = getattr(transformers, TASK_MODEL_CLASSES[task][0])
+    path = artifact_dir(cache_dir, model_id, 'quantized')
+    weights = os.path.join(path, 'quantized_state_dict.pt')
+
+    if os.path.exists(weights):
+        # Build the module skeleton from the config, then fill in the int8 weights,
+        # so the fp32 checkpoint never has to be read
+        config = transformers.AutoConfig.from_pretrained(model_id)
+        model = auto_class.from_config(config)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.load_state_dict(torch.load(weights))
+        logger.info(f"Loaded cached int8 weights for {model_id}")
+    else:
+        model = auto_class.from_pretrained(model_id)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        os.makedirs(path, exist_ok=True)
+        torch.save(model.state_dict(), weights)
+        logger.info(f"Quantized {model_id} to int8 and cached it in {path}")
+
+    model.eval()
+    return model
+
+
+def load_onnx(task, model_id, cache_dir, quantize=False):
+    """Load an ONNX Runtime model, exporting (and optionally quantizing) on first use"""
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The ONNX backends need 'optimum[onnxruntime]' installed") from e
+
+    ort_class = getattr(ort, TASK_MODEL_CLASSES[task][1])
+    export_path = artifact_dir(cache_dir, model_id, 'onnx')
+    if not os.path.exists(os.path.join(export_path, 'model.onnx')):
+        model = ort_class.from_pretrained(model_id, export=True)
+        model.save_pretrained(export_path)
+        logger.info(f"Exported {model_id} to ONNX in {export_path}")
+    if not quantize:
+        return ort_class.from_pretrained(export_path)
+
+    quantized_path = artifact_dir(cache_dir, model_id, 'onnx-int8')
+    if not os.path.exists(quantized_path):
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        quantizer = ort.ORTQuantizer.from_pretrained(export_path)
+        # AVX2 kernels are the lowest common denominator on x86 servers
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=quantized_path, quantization_config=config)
+        logger.info(f"Quantized the ONNX export of {model_id} in {quantized_path}")
+    onnx_files = [name for name in os.listdir(quantized_path) if name.endswith('.onnx')]
+    return ort_class.from_pretrained(quantized_path, file_name=onnx_files[0])
@@ -0,0 +1,123 @@
+"""
+Dynamic micro-batching for the transformer pipelines.
+
+Concurrent requests are collected for a short window and handed to the
+pipelines as one padded batch, then the results are fanned back out to
+the waiting request handlers.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram, active_traces, observe_stage, tracing
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+QUEUE_WAIT_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000]
+
+
+class InferenceBatcher:
+    """Runs submitted items through a batch function on a single worker thread"""
+
+    def __init__(self, infer_batch, max_batch_size=8, max_wait_ms=10, name='inference'):
+        self.infer_batch = infer_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.batches_run = 0
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_BUCKETS_MS)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f'{self.name}-batcher', daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Queue an item and block until its result is available"""
+        future = Future()
+        self.start()
+        # The caller's traces follow the item so batch stages show up in them
+        self._queue.put((item, time.monotonic(), future, active_traces()))
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            future.cancel()
+            raise
+
+    def stats(self):
+        """Return batch-size and queue-wait histograms for /api/status"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches_run': self.batches_run,
+            'queue_depth': self._queue.qsize(),
+            'batch_size': self.batch_size.snapshot(),
+            'queue_wait_ms': self.queue_wait_ms.snapshot()
+        }
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = batch[0][1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Drop requests whose callers already gave up
+            batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        traces = []
+        for _, enqueued, _, item_traces in batch:
+            self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+            observe_stage(f'{self.name}.queue_wait', started - enqueued, item_traces)
+            traces.extend(item_traces)
+        self.batch_size.observe(len(batch))
+        self.batches_run += 1
+
+        with tracing(traces):
+            self._infer(batch)
+
+    def _infer(self, batch):
+        try:
+            results = self.infer_batch([item for item, _, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][2].set_exception(e)
+                return
+            # One bad input should not fail its neighbours, so retry one by one
+            logger.warning(f'{self.name} batch of {len(batch)} failed, retrying individually: {e}')
+            for item, _, future, _ in batch:
+                try:
+                    future.set_result(self.infer_batch([item])[0])
+                except Exception as item_error:
+                    future.set_exception(item_error)
+            return
+
+        for (_, _, future, _), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,191 @@
+"""
+Opt-in memory diagnostics for long-running servers.
+
+rss_bytes() and torch_memory() are cheap and always available; /metrics
+reports the resident set size. MemoryDiagnostics adds tracemalloc. It
+starts tracing Python allocations and, every interval seconds, takes a
+snapshot and diffs it against the previous one, grouped by allocation site
+(file and line, or the whole traceback). It keeps the largest growers and
+an RSS history, so a slow leak shows up as the same site climbing
+interval after interval. Tracing costs memory and CPU, so it is off unless
+MEMORY_DIAGNOSTICS is set.
+
+Snapshots can be written to a file with Snapshot.dump() and read back
+offline with tracemalloc.Snapshot.load().
+"""
+
+import gc
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Allocations made by the diagnostics themselves are not interesting
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>',
+                 '<unknown>')
+
+
+def rss_bytes():
+    """Current resident set size of this process, or the peak where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def torch_memory():
+    """torch allocator figures, or None when torch was never imported"""
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return None
+    stats = {'threads': torch.get_num_threads()}
+    if torch.cuda.is_available():
+        stats['cuda_allocated_bytes'] = torch.cuda.memory_allocated()
+        stats['cuda_reserved_bytes'] = torch.cuda.memory_reserved()
+        stats['cuda_max_allocated_bytes'] = torch.cuda.max_memory_allocated()
+    return stats
+
+
+def _site(statistic, key_type):
+    frames = statistic.traceback
+    if key_type == 'traceback':
+        return [f'{frame.filename}:{frame.lineno}' for frame in frames]
+    return f'{frames[0].filename}:{frames[0].lineno}'
+
+
+class MemoryDiagnostics:
+    """Periodic tracemalloc snapshot diffs and an RSS history"""
+
+    def __init__(self, interval=300, frames=8, top=20, history=288, key_type='lineno'):
+        self.interval = interval
+        self.frames = frames
+        self.top = top
+        self.key_type = key_type
+        self.history = deque(maxlen=history)
+        self.started_at = None
+        self.start_rss = None
+        self.last_diff = []
+        self.last_snapshot_at = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start tracing and the background sampler; safe to call more than once"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self.started_at = time.time()
+            self.start_rss = rss_bytes()
+            self._previous = self._take()
+            self._thread = threading.Thread(target=self._run, name='memory-diagnostics', daemon=True)
+            self._thread.start()
+        logger.info(f'Memory diagnostics started: tracemalloc with {self.frames} frames, '
+                    f'snapshot every {self.interval}s')
+
+    def after_fork(self):
+        """Restart sampling in a forked worker; the sampler thread does not survive fork()"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous = None
+        self.history.clear()
+        self.last_diff = []
+        self.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        tracemalloc.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f'Memory diagnostics sample failed: {e}')
+
+    def _take(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, name) for name in IGNORED_FILES])
+
+    def sample(self):
+        """Snapshot now and diff against the previous snapshot; returns the report"""
+        snapshot = self._take()
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+            if previous is not None:
+                statistics = snapshot.compare_to(previous, self.key_type)
+                self.last_diff = [
+                    {
+                        'site': _site(statistic, self.key_type),
+                        'size_bytes': statistic.size,
+                        'size_diff_bytes': statistic.size_diff,
+                        'count': statistic.count,
+                        'count_diff': statistic.count_diff
+                    }
+                    for statistic in statistics[:self.top]
+                ]
+            self.last_snapshot_at = time.time()
+            self.history.append((self.last_snapshot_at, rss_bytes(), tracemalloc.get_traced_memory()[0]))
+        return self.report()
+
+    def dump(self, directory=None):
+        """Write a fresh snapshot to a file and return its path"""
+        snapshot = self._take()
+        handle, path = tempfile.mkstemp(prefix='diabuddy-memory-', suffix='.tracemalloc', dir=directory)
+        os.close(handle)
+        snapshot.dump(path)
+        return path
+
+    def report(self):
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            return {
+                'tracing': tracemalloc.is_tracing(),
+                'started_at': self.started_at,
+                'interval': self.interval,
+                'traced_bytes': current,
+                'traced_peak_bytes': peak,
+                'rss_growth_bytes': rss_bytes() - self.start_rss if self.start_rss is not None else None,
+                'last_snapshot_at': self.last_snapshot_at,
+                'top_growth': list(self.last_diff),
+                'history': [
+                    {'time': at, 'rss_bytes': rss, 'traced_bytes': traced}
+                    for at, rss, traced in self.history
+                ]
+            }
+
+
+def process_memory():
+    """What every memory report starts with, diagnostics enabled or not"""
+    collections = gc.get_stats()
+    return {
+        'rss_bytes': rss_bytes(),
+        'peak_rss_bytes': peak_rss_bytes(),
+        'threads': threading.active_count(),
+        'gc': {
+            'counts': list(gc.get_count()),
+            'collections': [generation['collections'] for generation in collections],
+            'uncollectable': sum(generation['uncollectable'] for generation in collections)
+        },
+        'torch': torch_memory()
+    }
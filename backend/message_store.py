@@ -0,0 +1,199 @@
+"""
+Bounded, persistent storage for chat messages and transcriptions.
+
+Records live in SQLite (WAL mode, so polling readers never block the
+writer) and are read back in pages by cursor or timestamp. Retention limits
+keep the table, and therefore memory and response sizes, bounded.
+"""
+
+import itertools
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_memory_ids = itertools.count()
+
+
+def parse_since(value):
+    """Accept epoch seconds, ISO 8601 or the API's own timestamp format"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for parse in (lambda v: datetime.strptime(v, TIMESTAMP_FORMAT), datetime.fromisoformat):
+        try:
+            return parse(value).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized timestamp '{value}'")
+
+
+class MessageStore:
+    """Append-only SQLite store with cursor pagination and retention"""
+
+    def __init__(self, path, max_rows=None, max_age_days=None, prune_every=100, pool_size=4):
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.prune_every = prune_every
+        self._in_memory = path == ':memory:'
+        if self._in_memory:
+            # A named shared-cache database lets every connection see the same data
+            self._target = f'file:message-store-{next(_memory_ids)}?mode=memory&cache=shared'
+        else:
+            self._target = path
+        self._pool_size = pool_size
+        self._inherited = []
+        self._write_lock = threading.Lock()
+        self._writes = 0
+        self._readers = queue.LifoQueue(maxsize=pool_size)
+        self._writer = self._connect()
+        self._writer.executescript(
+            'CREATE TABLE IF NOT EXISTS records ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' kind TEXT NOT NULL,'
+            ' created_at REAL NOT NULL,'
+            ' payload TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS records_kind_id ON records (kind, id);'
+            'CREATE INDEX IF NOT EXISTS records_kind_created ON records (kind, created_at);'
+        )
+        self._writer.commit()
+
+    def _connect(self):
+        connection = sqlite3.connect(self._target, uri=self._in_memory, check_same_thread=False)
+        if not self._in_memory:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def after_fork(self):
+        """Open fresh connections in a forked worker
+
+        SQLite connections must not be used across fork(), and closing them
+        here could disturb the parent's, so the inherited ones are kept unused.
+        """
+        self._inherited.append(self._writer)
+        while True:
+            try:
+                self._inherited.append(self._readers.get_nowait())
+            except queue.Empty:
+                break
+        self._write_lock = threading.Lock()
+        self._readers = queue.LifoQueue(maxsize=self._pool_size)
+        self._writer = self._connect()
+
+    @contextmanager
+    def _reader(self):
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            try:
+                self._readers.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+
+    def add(self, kind, payload):
+        """Append a record and return it with its id and timestamp"""
+        created_at = time.time()
+        with self._write_lock:
+            cursor = self._writer.execute(
+                'INSERT INTO records (kind, created_at, payload) VALUES (?, ?, ?)',
+                (kind, created_at, json.dumps(payload))
+            )
+            self._writer.commit()
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+        return self._record(cursor.lastrowid, created_at, payload)
+
+    def page(self, kind, after=None, since=None, limit=100):
+        """Return up to ``limit`` records, oldest first, plus the cursor to continue from
+
+        With no cursor or timestamp the most recent ``limit`` records are returned.
+        """
+        with self._reader() as connection:
+            if after is not None:
+                rows = connection.execute(
+                    'SELECT id, created_at, payload FROM records '
+                    'WHERE kind = ? AND id > ? ORDER BY id LIMIT ?',
+                    (kind, int(after), limit + 1)
+                ).fetchall()
+            elif since is not None:
+                rows = connection.execute(
+                    'SELECT id, created_at, payload FROM records '
+                    'WHERE kind = ? AND created_at > ? ORDER BY id LIMIT ?',
+                    (kind, since, limit + 1)
+                ).fetchall()
+            else:
+                rows = connection.execute(
+                    'SELECT id, created_at, payload FROM records '
+                    'WHERE kind = ? ORDER BY id DESC LIMIT ?',
+                    (kind, limit)
+                ).fetchall()
+                rows.reverse()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        records = [self._record(row[0], row[1], json.loads(row[2])) for row in rows]
+        next_cursor = rows[-1][0] if rows else after
+        return records, next_cursor, has_more
+
+    def iterate(self, kind, after=None, since=None, page_size=500):
+        """Yield every record after the cursor (or since the timestamp; from the start without either)"""
+        if after is None and since is None:
+            after = 0
+        while True:
+            records, after, has_more = self.page(kind, after=after, since=since, limit=page_size)
+            yield from records
+            if not has_more:
+                return
+            since = None
+
+    def count(self, kind):
+        with self._reader() as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM records WHERE kind = ?', (kind,)
+            ).fetchone()[0]
+
+    def prune(self):
+        """Apply the retention limits now"""
+        with self._write_lock:
+            self._prune()
+
+    def _prune(self):
+        # Caller holds self._write_lock
+        removed = 0
+        if self.max_age_seconds:
+            removed += self._writer.execute(
+                'DELETE FROM records WHERE created_at < ?', (time.time() - self.max_age_seconds,)
+            ).rowcount
+        if self.max_rows:
+            kinds = [row[0] for row in self._writer.execute('SELECT DISTINCT kind FROM records')]
+            for kind in kinds:
+                removed += self._writer.execute(
+                    'DELETE FROM records WHERE kind = ? AND id <= '
+                    '(SELECT id FROM records WHERE kind = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                    (kind, kind, self.max_rows)
+                ).rowcount
+        self._writer.commit()
+        if removed:
+            logger.info(f'Pruned {removed} stored records')
+
+    @staticmethod
+    def _record(record_id, created_at, payload):
+        record = {'id': record_id}
+        record.update(payload)
+        record['timestamp'] = datetime.fromtimestamp(created_at).strftime(TIMESTAMP_FORMAT)
+        return record
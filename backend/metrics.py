@@ -0,0 +1,301 @@
+"""
+Lightweight metrics primitives for the Diabuddy backend.
+
+Pipeline stages are wrapped in ``with stage('name'):``. Every stage feeds a
+histogram in the process-wide REGISTRY, which /metrics renders in the
+Prometheus text format. A request can also carry a Trace. Stages that run
+while it is active are added to it, and the breakdown goes back to the
+client as a Server-Timing header. Without an active trace a stage costs two
+clock reads and one histogram update.
+"""
+
+import bisect
+import threading
+import time
+
+
+class Histogram:
+    """Fixed-bucket histogram that can be updated from many threads"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record a single observation"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket that holds it"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + [float('inf')], counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def cumulative(self):
+        """Return (cumulative count per bucket bound, count, sum)"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, total, total_sum
+
+    def snapshot(self):
+        """Return cumulative bucket counts plus count and sum"""
+        buckets, total, total_sum = self.cumulative()
+        cumulative = {str(bound): running for bound, running in buckets}
+        cumulative['+Inf'] = total
+        return {
+            'count': total,
+            'sum': round(total_sum, 3),
+            'buckets': cumulative,
+            'p50': _format_bound(self.quantile(0.5)),
+            'p99': _format_bound(self.quantile(0.99))
+        }
+
+
+def _format_bound(bound):
+    """Make bucket bounds JSON friendly"""
+    if bound == float('inf'):
+        return '+Inf'
+    return bound
+
+
+class Counter:
+    """Monotonic counter that can be incremented from many threads"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+class _Family:
+    """One metric name with a child per combination of label values"""
+
+    def __init__(self, kind, name, help_text, labels, factory):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}')
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def children(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Named counters, histograms and gauges rendered in the Prometheus text format"""
+
+    def __init__(self, prefix='diabuddy'):
+        self.prefix = prefix
+        self._families = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def _family(self, kind, name, help_text, labels, factory):
+        name = f'{self.prefix}_{name}'
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(kind, name, help_text, labels, factory)
+            elif family.kind != kind:
+                raise ValueError(f'{name} is already registered as a {family.kind}')
+        return family
+
+    def counter(self, name, help_text, labels=()):
+        return self._family('counter', name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        return self._family('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, help_text, read):
+        """Report read() at scrape time; read returns a number or a {name: number} dict"""
+        with self._lock:
+            self._gauges[f'{self.prefix}_{name}'] = (help_text, read)
+
+    def render(self):
+        """The registry in the Prometheus text exposition format"""
+        with self._lock:
+            families = sorted(self._families.items())
+            gauges = sorted(self._gauges.items())
+
+        lines = []
+        for name, family in families:
+            lines.append(f'# HELP {name} {family.help}')
+            lines.append(f'# TYPE {name} {family.kind}')
+            for values, child in family.children():
+                if family.kind == 'counter':
+                    lines.append(f'{name}{_label_text(family.label_names, values)} {_number(child.value)}')
+                    continue
+                buckets, total, total_sum = child.cumulative()
+                for bound, running in buckets + [(float('inf'), total)]:
+                    labels = _label_text(family.label_names, values, ('le', _number(bound)))
+                    lines.append(f'{name}_bucket{labels} {running}')
+                labels = _label_text(family.label_names, values)
+                lines.append(f'{name}_sum{labels} {_number(total_sum)}')
+                lines.append(f'{name}_count{labels} {total}')
+
+        for name, (help_text, read) in gauges:
+            try:
+                value = read()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            if isinstance(value, dict):
+                for label, number in sorted(value.items()):
+                    # Stats dicts mix counters with settings and nested details
+                    if isinstance(number, bool):
+                        number = int(number)
+                    elif not isinstance(number, (int, float)):
+                        continue
+                    lines.append(f'{name}{_label_text(("name",), (label,))} {_number(number)}')
+            else:
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_BUCKETS_SECONDS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                         1, 2.5, 5, 10, 30]
+
+_stage_seconds = REGISTRY.histogram(
+    'stage_duration_seconds', 'Time spent in each pipeline stage', STAGE_BUCKETS_SECONDS, ('stage',)
+)
+
+_local = threading.local()
+
+
+class Trace:
+    """Stage timings collected for one request, possibly from several threads"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = []
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def breakdown(self):
+        """Milliseconds per stage in first-seen order; repeated stages are summed"""
+        totals = {}
+        for name, seconds in list(self.stages):
+            totals[name] = totals.get(name, 0.0) + seconds * 1000.0
+        totals['total'] = (time.perf_counter() - self.started) * 1000.0
+        return {name: round(ms, 3) for name, ms in totals.items()}
+
+    def server_timing(self):
+        """The breakdown as a Server-Timing header value"""
+        return ', '.join(f'{name.replace(".", "-")};dur={ms}' for name, ms in self.breakdown().items())
+
+
+def active_traces():
+    """The traces that stages on this thread are reported to"""
+    return getattr(_local, 'traces', ())
+
+
+class tracing:
+    """Report stages on this thread to the given traces until the block ends"""
+
+    __slots__ = ('traces', 'previous')
+
+    def __init__(self, traces):
+        self.traces = tuple(trace for trace in traces if trace is not None)
+
+    def __enter__(self):
+        self.previous = active_traces()
+        _local.traces = self.traces
+        return self
+
+    def __exit__(self, *exc):
+        _local.traces = self.previous
+        return False
+
+
+def observe_stage(name, seconds, traces=None):
+    """Record a stage that was timed elsewhere, e.g. a queue wait"""
+    _stage_seconds.labels(name).observe(seconds)
+    for trace in active_traces() if traces is None else traces:
+        trace.add(name, seconds)
+
+
+class stage:
+    """Time a block as a pipeline stage: ``with stage('ner'): ...``"""
+
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        _stage_seconds.labels(self.name).observe(elapsed)
+        traces = getattr(_local, 'traces', None)
+        if traces:
+            for trace in traces:
+                trace.add(self.name, elapsed)
+        return False
@@ -0,0 +1,385 @@
+"""
+Zero-downtime model upgrades for the classifier and NER pipelines.
+
+A candidate model is loaded next to the live one on a background thread.
+It is first warmed up: the replay set runs through it once per warm-up
+pass, at batch size one and at the full batch size. The replay set holds
+recently analyzed notes plus any sample notes configured, so kernels,
+allocator pools and tokenizer caches are hot before real traffic arrives.
+
+With shadowing on, a fraction of live batches is then re-run on the
+candidate, on its own thread, one batch at a time; batches arriving while
+one is in flight are not shadowed. The results are compared with what the
+live model returned: same top label for the classifier, entity overlap
+(Jaccard) for NER. Latency is compared too. When enough samples are in,
+the candidate is promoted if agreement and latency pass the gates.
+Otherwise it is rejected and unloaded. Without shadowing a warmed
+candidate is promoted straight away, or waits for a manual promote.
+
+Promotion replaces the registry entry in one assignment. Requests already
+running keep the model object they fetched and finish on it, and the next
+batch picks up the new one. The version goes into model_identity(), so
+cached results from the old model are never served for the new one.
+
+Two models of the same kind are resident during the overlap. A candidate
+is refused when the current RSS plus the live model's size would pass the
+memory cap. It is unloaded when the RSS passes the cap after loading.
+"""
+
+import gc
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from memory_diagnostics import rss_bytes
+
+logger = logging.getLogger(__name__)
+
+# Used for warm-up when no notes have been analyzed yet and no replay file is set
+SAMPLE_NOTES = [
+    "Patient reports intermittent chest pain for two days, worse on exertion. Denies shortness of breath.",
+    "BP 142/90, heart rate 88 bpm, temperature 37.1 C. Lungs clear to auscultation bilaterally.",
+    "Assessment: type 2 diabetes mellitus, poorly controlled. HbA1c 8.9%.",
+    "Plan: start metformin 500 mg twice daily, recheck HbA1c in 3 months, follow up in 2 weeks.",
+    "Mild tenderness over the right lower quadrant. Abdomen soft and non distended.",
+    "Likely viral upper respiratory infection. Continue fluids and rest, return if fever persists.",
+]
+
+
+class SwapError(Exception):
+    """The request conflicts with the state of the candidate (or there is none)"""
+
+
+def label_agreement(live, candidate):
+    """1.0 when both classifications picked the same label"""
+    return 1.0 if live and candidate and live.get('label') == candidate.get('label') else 0.0
+
+
+def entity_agreement(live, candidate):
+    """Jaccard overlap of the (entity group, word) pairs the two taggers found"""
+    live_set = {(entity['entity_group'], entity['word'].lower()) for entity in live or []}
+    candidate_set = {(entity['entity_group'], entity['word'].lower()) for entity in candidate or []}
+    if not live_set and not candidate_set:
+        return 1.0
+    return len(live_set & candidate_set) / len(live_set | candidate_set)
+
+
+COMPARATORS = {'classifier': label_agreement, 'ner': entity_agreement}
+
+
+def model_bytes(model):
+    """Parameter bytes of a transformers pipeline's model, or None when it cannot tell"""
+    try:
+        return sum(parameter.numel() * parameter.element_size() for parameter in model.model.parameters())
+    except Exception:
+        return None
+
+
+def release_memory():
+    """Collect the old model's objects and hand freed memory back to the OS where possible"""
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if sys.platform.startswith('linux'):
+        try:
+            import ctypes
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def read_replay_notes(path):
+    """Notes for warm-up, one per line; blank lines are skipped"""
+    with open(path, encoding='utf-8') as handle:
+        return [line.strip() for line in handle if line.strip()]
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+class Candidate:
+    """A model being prepared to replace the live one"""
+
+    def __init__(self, name, version, shadow_fraction, auto_promote):
+        self.name = name
+        self.version = version
+        self.shadow_fraction = shadow_fraction
+        self.auto_promote = auto_promote
+        self.state = 'loading'
+        self.model = None
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.load_seconds = None
+        self.warmup = None
+        self.shadow_samples = 0
+        self.agreement_total = 0.0
+        self.live_seconds = deque(maxlen=1000)
+        self.candidate_seconds = deque(maxlen=1000)
+        self.shadow_done = threading.Event()
+
+    def agreement(self):
+        return self.agreement_total / self.shadow_samples if self.shadow_samples else None
+
+    def latency_ratio(self):
+        live, candidate = _median(self.live_seconds), _median(self.candidate_seconds)
+        return candidate / live if live and candidate is not None else None
+
+    def describe(self):
+        agreement, ratio = self.agreement(), self.latency_ratio()
+        return {
+            'version': self.version,
+            'state': self.state,
+            'error': self.error,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'load_seconds': self.load_seconds,
+            'warmup': self.warmup,
+            'shadow': {
+                'fraction': self.shadow_fraction,
+                'samples': self.shadow_samples,
+                'agreement': round(agreement, 4) if agreement is not None else None,
+                'latency_ratio': round(ratio, 3) if ratio is not None else None
+            }
+        }
+
+
+class ModelManager:
+    """Loads, warms, shadows and atomically promotes new versions of registry models"""
+
+    def __init__(self, registry, loaders, runners, replay_notes=(), recent_notes=50, warmup_passes=2,
+                 batch_size=8, shadow_fraction=0.0, shadow_samples=200, shadow_timeout=600,
+                 min_agreement=0.95, max_latency_ratio=1.5, auto_promote=True, memory_cap_bytes=0):
+        # loaders[name](version) builds a model; runners[name](model, texts) returns one output per text
+        self.registry = registry
+        self.loaders = loaders
+        self.runners = runners
+        self.replay_notes = list(replay_notes)
+        self.recent = deque(maxlen=recent_notes)
+        self.warmup_passes = warmup_passes
+        self.batch_size = batch_size
+        self.shadow_fraction = shadow_fraction
+        self.shadow_samples = shadow_samples
+        self.shadow_timeout = shadow_timeout
+        self.min_agreement = min_agreement
+        self.max_latency_ratio = max_latency_ratio
+        self.auto_promote = auto_promote
+        self.memory_cap_bytes = memory_cap_bytes
+        self._candidates = {}
+        self._history = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-shadow')
+        self._shadow_busy = False
+
+    def record(self, text):
+        """Remember a live note for the next warm-up"""
+        if self.recent.maxlen:
+            self.recent.append(text)
+
+    def replay_set(self):
+        notes = list(self.recent) + self.replay_notes
+        return notes or list(SAMPLE_NOTES)
+
+    def stage(self, name, version, shadow_fraction=None, auto_promote=None):
+        """Start preparing version as the next name model; returns the candidate"""
+        if name not in self.loaders:
+            raise ValueError(f"Unknown model '{name}', expected one of {sorted(self.loaders)}")
+        with self._lock:
+            current = self._candidates.get(name)
+            if current is not None and current.state in ('loading', 'warming', 'shadowing', 'ready'):
+                raise SwapError(f"A candidate for '{name}' is already {current.state}")
+            candidate = Candidate(
+                name, version,
+                self.shadow_fraction if shadow_fraction is None else shadow_fraction,
+                self.auto_promote if auto_promote is None else auto_promote
+            )
+            self._candidates[name] = candidate
+        threading.Thread(target=self._prepare, args=(candidate,), name=f'model-candidate-{name}',
+                         daemon=True).start()
+        return candidate
+
+    def _check_memory(self, extra_bytes=0):
+        if not self.memory_cap_bytes:
+            return
+        rss = rss_bytes()
+        if rss + extra_bytes > self.memory_cap_bytes:
+            raise MemoryError(
+                f'{(rss + extra_bytes) / 2 ** 20:.0f} MB would exceed the {self.memory_cap_bytes / 2 ** 20:.0f} MB cap'
+            )
+
+    def _prepare(self, candidate):
+        name = candidate.name
+        try:
+            # The candidate is assumed to be about the size of the live model
+            self._check_memory(model_bytes(self.registry.get(name)) or 0)
+            started = time.monotonic()
+            model = self.loaders[name](candidate.version)
+            candidate.load_seconds = round(time.monotonic() - started, 3)
+            with self._lock:
+                if candidate.finished_at is not None:
+                    # Discarded while it loaded
+                    return
+                candidate.model = model
+            del model
+            self._check_memory()
+
+            if not self._advance(candidate, 'loading', 'warming'):
+                return
+            candidate.warmup = self._warm(candidate)
+            self._check_memory()
+
+            expected = 'warming'
+            if candidate.shadow_fraction > 0 and self.registry.get(name) is not None:
+                if not self._advance(candidate, 'warming', 'shadowing'):
+                    return
+                candidate.shadow_done.wait(self.shadow_timeout)
+                reason = self._gate(candidate)
+                if reason:
+                    self._finish(candidate, 'rejected', reason)
+                    return
+                expected = 'shadowing'
+
+            # Fails when the candidate was promoted or discarded by hand meanwhile
+            if not self._advance(candidate, expected, 'ready'):
+                return
+            logger.info(f"Candidate {name} model {candidate.version} is ready")
+            if candidate.auto_promote:
+                self._promote(name, candidate)
+        except Exception as e:
+            self._finish(candidate, 'failed', str(e))
+
+    def _advance(self, candidate, expected, state):
+        """Move the candidate from expected to state; False if it finished or moved on meanwhile"""
+        with self._lock:
+            if candidate.finished_at is not None or candidate.state != expected:
+                return False
+            candidate.state = state
+            return True
+
+    def _warm(self, candidate):
+        runner, model = self.runners[candidate.name], candidate.model
+        notes = self.replay_set()
+        timings = []
+        for _ in range(self.warmup_passes):
+            # Single texts and full batches take different code paths (padding, batching)
+            for note in notes[:self.batch_size]:
+                started = time.perf_counter()
+                runner(model, [note])
+                timings.append(time.perf_counter() - started)
+            for start in range(0, len(notes), self.batch_size):
+                runner(model, notes[start:start + self.batch_size])
+        median = _median(timings)
+        return {
+            'notes': len(notes),
+            'passes': self.warmup_passes,
+            'single_p50_ms': round(median * 1000, 2) if median is not None else None
+        }
+
+    def _gate(self, candidate):
+        """Why the shadowed candidate may not be promoted, or None"""
+        agreement, ratio = candidate.agreement(), candidate.latency_ratio()
+        if agreement is None:
+            return 'No shadow samples were collected'
+        if agreement < self.min_agreement:
+            return f'Agreement {agreement:.3f} is below {self.min_agreement}'
+        if ratio is not None and ratio > self.max_latency_ratio:
+            return f'Latency is {ratio:.2f}x the live model, above {self.max_latency_ratio}x'
+        return None
+
+    def shadow(self, name, texts, live_outputs, live_seconds):
+        """Maybe re-run a live batch on the candidate in the background and compare"""
+        candidate = self._candidates.get(name)
+        if candidate is None or candidate.state != 'shadowing' or random.random() >= candidate.shadow_fraction:
+            return
+        with self._lock:
+            model = candidate.model
+            if self._shadow_busy or model is None:
+                return
+            self._shadow_busy = True
+        self._shadow_pool.submit(self._compare, candidate, model, list(texts), list(live_outputs), live_seconds)
+
+    def _compare(self, candidate, model, texts, live_outputs, live_seconds):
+        try:
+            started = time.perf_counter()
+            outputs = self.runners[candidate.name](model, texts)
+            elapsed = time.perf_counter() - started
+            compare = COMPARATORS[candidate.name]
+            with self._lock:
+                candidate.live_seconds.append(live_seconds)
+                candidate.candidate_seconds.append(elapsed)
+                for live, output in zip(live_outputs, outputs):
+                    candidate.agreement_total += compare(live, output)
+                    candidate.shadow_samples += 1
+            if candidate.shadow_samples >= self.shadow_samples:
+                candidate.shadow_done.set()
+        except Exception as e:
+            logger.error(f"Shadow run of {candidate.name} model {candidate.version} failed: {e}")
+        finally:
+            with self._lock:
+                self._shadow_busy = False
+
+    def promote(self, name):
+        """Make the candidate live; the replaced model is released once requests let go of it"""
+        return self._promote(name, self._candidates.get(name))
+
+    def _promote(self, name, candidate):
+        with self._lock:
+            if (candidate is None or candidate is not self._candidates.get(name)
+                    or candidate.state not in ('ready', 'shadowing')
+                    or candidate.model is None or candidate.finished_at is not None):
+                state = candidate.state if candidate else 'missing'
+                raise SwapError(f"No candidate for '{name}' is ready to promote (it is {state})")
+            previous_version = self.registry.version(name)
+            self.registry.swap(name, candidate.model, candidate.version)
+            self._close(candidate, 'promoted')
+        candidate.shadow_done.set()
+        release_memory()
+        logger.info(f"Promoted {name} model {previous_version} -> {candidate.version}")
+        return candidate
+
+    def discard(self, name):
+        """Drop the candidate, whatever state it is in"""
+        with self._lock:
+            candidate = self._candidates.get(name)
+            if candidate is None or candidate.finished_at is not None:
+                raise SwapError(f"There is no candidate for '{name}' in progress")
+        candidate.shadow_done.set()
+        self._finish(candidate, 'discarded')
+        return candidate
+
+    def _finish(self, candidate, state, error=None):
+        with self._lock:
+            if candidate.finished_at is not None:
+                return
+            self._close(candidate, state, error)
+        if error:
+            logger.warning(f"Candidate {candidate.name} model {candidate.version} {state}: {error}")
+        release_memory()
+
+    def _close(self, candidate, state, error=None):
+        """Record the candidate's final state; the caller holds the lock"""
+        candidate.state = state
+        candidate.error = error
+        candidate.finished_at = time.time()
+        # Live or not, the manager no longer needs its own reference
+        candidate.model = None
+        self._history.append(candidate.describe())
+
+    def stats(self):
+        with self._lock:
+            candidates = {name: candidate.describe() for name, candidate in self._candidates.items()}
+            history = list(self._history)
+        return {
+            'live': {name: self.registry.version(name) for name in self.loaders},
+            'candidates': candidates,
+            'history': history,
+            'rss_bytes': rss_bytes(),
+            'memory_cap_bytes': self.memory_cap_bytes or None
+        }
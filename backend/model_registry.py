@@ -0,0 +1,145 @@
+"""
+Model registry with eager, background or on-demand loading.
+
+The HTTP server can bind its port straight away while the transformer
+pipelines load; callers check readiness (or wait for it) before using them.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LOADING_MODES = ('eager', 'background', 'lazy')
+
+
+class ModelRegistry:
+    """Loads named models once and tracks liveness/readiness"""
+
+    def __init__(self, mode='background'):
+        if mode not in LOADING_MODES:
+            raise ValueError(f"Unknown model loading mode '{mode}', expected one of {LOADING_MODES}")
+        self.mode = mode
+        self.state = 'pending'
+        self.created_at = time.monotonic()
+        self.ready_after = None
+        self._loaders = OrderedDict()
+        self._models = {}
+        self._versions = {}
+        self._errors = {}
+        self._load_seconds = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, name, loader, version=None):
+        """Register a zero-argument callable that builds the model"""
+        self._loaders[name] = loader
+        self._versions[name] = version
+
+    def start(self):
+        """Begin loading according to the configured mode"""
+        if self.mode == 'eager':
+            self.load_all()
+        elif self.mode == 'background':
+            self.load_in_background()
+
+    def load_in_background(self):
+        """Kick off loading on a daemon thread if it has not started yet"""
+        with self._lock:
+            if self.state != 'pending':
+                return
+            self.state = 'loading'
+            self._thread = threading.Thread(target=self._load, name='model-loader', daemon=True)
+            self._thread.start()
+
+    def load_all(self):
+        """Load every registered model on the calling thread"""
+        with self._lock:
+            if self.state != 'pending':
+                starting = False
+            else:
+                self.state = 'loading'
+                starting = True
+        if starting:
+            self._load()
+        else:
+            self._ready.wait()
+
+    def _load(self):
+        logger.info("Loading AI models...")
+        for name, loader in self._loaders.items():
+            started = time.monotonic()
+            try:
+                self._models[name] = loader()
+                logger.info(f"Loaded model '{name}' in {time.monotonic() - started:.1f}s")
+            except Exception as e:
+                logger.error(f"Error loading model '{name}': {e}")
+                self._models[name] = None
+                self._errors[name] = str(e)
+            self._load_seconds[name] = round(time.monotonic() - started, 3)
+
+        with self._lock:
+            self.state = 'failed' if self._errors else 'ready'
+            self.ready_after = round(time.monotonic() - self.created_at, 3)
+        self._ready.set()
+        if self._errors:
+            logger.error(f"AI models finished loading with errors: {', '.join(self._errors)}")
+        else:
+            logger.info("AI models loaded successfully")
+
+    def is_ready(self):
+        """True once every model has been attempted"""
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        """Block until loading finishes, starting it first if it is lazy"""
+        if not self._ready.is_set():
+            self.load_in_background()
+        return self._ready.wait(timeout)
+
+    def get(self, name):
+        """Return a loaded model, or None if it is missing or not loaded yet"""
+        return self._models.get(name)
+
+    def version(self, name):
+        return self._versions.get(name)
+
+    def swap(self, name, model, version):
+        """Replace a loaded model in one step; callers holding the old one keep it"""
+        if name not in self._loaders:
+            raise KeyError(name)
+        with self._lock:
+            previous = self._models.get(name)
+            self._models[name] = model
+            self._versions[name] = version
+            self._errors.pop(name, None)
+        return previous
+
+    def all_loaded(self):
+        return self.is_ready() and all(self._models.get(name) is not None for name in self._loaders)
+
+    def stats(self):
+        """Return readiness details for /api/status"""
+        models = {}
+        for name in self._loaders:
+            if name in self._errors:
+                status = 'failed'
+            elif self._models.get(name) is not None:
+                status = 'loaded'
+            else:
+                status = self.state if self.state != 'ready' else 'missing'
+            models[name] = {
+                'status': status,
+                'version': self._versions.get(name),
+                'load_seconds': self._load_seconds.get(name),
+                'error': self._errors.get(name)
+            }
+        return {
+            'mode': self.mode,
+            'state': self.state,
+            'ready_after_seconds': self.ready_after,
+            'models': models
+        }
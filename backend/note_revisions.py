@@ -0,0 +1,222 @@
+"""
+Incremental re-analysis of notes that are edited and resubmitted.
+
+A note sent with a note_id is analyzed one sentence at a time, and the
+results for each sentence are kept: the classifier's label scores, the NER
+entities and the SOAP lines the vocabulary assigned. Sentences are keyed by
+a fingerprint of their whitespace-normalized text. When the edited note
+comes back, every sentence with a known fingerprint reuses its results,
+wherever it moved, and only new or changed sentences go through the models.
+The note-level result is merged from the sentences. Classification scores
+are averaged, weighted by sentence length as chunking does for windows.
+Entities and SOAP lines follow sentence order. The SOAP note is rebuilt
+from them on every revision, so sections_changed also sees content that
+entities alone put into a section.
+
+The models see single sentences here, not whole windows, so results can
+differ a little from a plain analysis of the same text. They do not drift
+from one revision to the next.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from chunking import sentence_spans
+
+RevisionResult = namedtuple('RevisionResult', ['scores', 'entities', 'lines', 'soap', 'changes'])
+
+
+def fingerprint(sentence):
+    normalized = ' '.join(sentence.split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def split_sentences(text):
+    """Stripped, non-empty sentences of text, in order"""
+    sentences = []
+    for start, end in sentence_spans(text):
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+class _Sentence:
+    __slots__ = ('fingerprint', 'text', 'scores', 'entities', 'lines')
+
+    def __init__(self, sentence_fingerprint, text, scores, entities, lines):
+        self.fingerprint = sentence_fingerprint
+        self.text = text
+        self.scores = scores
+        self.entities = entities
+        self.lines = lines
+
+
+class _NoteState:
+    __slots__ = ('lock', 'revision', 'sentences', 'models', 'index', 'summary', 'touched')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revision = 0
+        self.sentences = []
+        self.models = None
+        self.index = None
+        self.summary = None
+        self.touched = time.monotonic()
+
+
+def merge_scores(sentences):
+    """Length-weighted average of the sentences' label scores, or None without a classifier"""
+    totals = {}
+    total_weight = 0
+    for sentence in sentences:
+        if sentence.scores is None:
+            return None
+        weight = len(sentence.text)
+        total_weight += weight
+        for label, score in sentence.scores.items():
+            totals[label] = totals.get(label, 0.0) + score * weight
+    if not totals:
+        return None
+    return {label: total / (total_weight or 1) for label, total in totals.items()}
+
+
+def summarize(scores, entities, soap):
+    """What the client sees, in a form that can be compared between revisions"""
+    groups = {}
+    for entity in entities:
+        groups.setdefault(entity['entity_group'], []).append(entity['word'])
+    label = max(scores.items(), key=lambda item: item[1])[0] if scores else None
+    return {'label': label, 'sections': dict(soap), 'entities': groups}
+
+
+def _changed_keys(before, after):
+    return sorted(key for key in set(before) | set(after) if before.get(key) != after.get(key))
+
+
+class NoteRevisions:
+    """Per-note sentence results, reused across revisions of the note"""
+
+    def __init__(self, run_models, soap_lines, organize_soap, max_notes=1000, ttl_seconds=3600):
+        # run_models(sentences) -> (scores per sentence or None, entities per sentence or None)
+        # soap_lines(index, sentence) -> [(section, line)]
+        # organize_soap(text, entities, lines) -> {section: text}, the SOAP note returned to the client
+        self.run_models = run_models
+        self.soap_lines = soap_lines
+        self.organize_soap = organize_soap
+        self.max_notes = max_notes
+        self.ttl_seconds = ttl_seconds
+        self._notes = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'revisions': 0,
+            'sentences_reused': 0,
+            'sentences_analyzed': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def _state(self, note_id):
+        now = time.monotonic()
+        with self._lock:
+            state = self._notes.get(note_id)
+            if state is not None and now - state.touched > self.ttl_seconds:
+                self._counters['expirations'] += 1
+                state = None
+            if state is None:
+                state = self._notes[note_id] = _NoteState()
+            self._notes.move_to_end(note_id)
+            state.touched = now
+            while len(self._notes) > self.max_notes:
+                self._notes.popitem(last=False)
+                self._counters['evictions'] += 1
+            return state
+
+    def forget(self, note_id):
+        with self._lock:
+            return self._notes.pop(note_id, None) is not None
+
+    def analyze(self, note_id, text, models, index):
+        """Analyze a revision of a note, re-running the models only on new sentences
+
+        models identifies the loaded models and index is the current
+        vocabulary index; results from other models are never reused, and
+        SOAP lines are recomputed when the vocabulary changes.
+        """
+        state = self._state(note_id)
+        with state.lock:
+            if state.models != models:
+                state.sentences = []
+            known = {sentence.fingerprint: sentence for sentence in state.sentences}
+            relabel = state.index is not index
+
+            sentences = []
+            changed = []
+            missing = {}
+            for position, sentence_text in enumerate(split_sentences(text)):
+                sentence_fingerprint = fingerprint(sentence_text)
+                sentence = known.get(sentence_fingerprint)
+                if sentence is None:
+                    changed.append(position)
+                    # A sentence repeated within the revision is analyzed once
+                    sentence = missing.get(sentence_fingerprint)
+                    if sentence is None:
+                        sentence = missing[sentence_fingerprint] = _Sentence(
+                            sentence_fingerprint, sentence_text, None, [], None
+                        )
+                elif relabel:
+                    sentence.lines = self.soap_lines(index, sentence.text)
+                sentences.append(sentence)
+
+            if missing:
+                pending = list(missing.values())
+                scores, entities = self.run_models([sentence.text for sentence in pending])
+                for offset, sentence in enumerate(pending):
+                    sentence.scores = scores[offset] if scores is not None else None
+                    sentence.entities = entities[offset] if entities is not None else []
+                    sentence.lines = self.soap_lines(index, sentence.text)
+
+            merged_scores = merge_scores(sentences)
+            merged_entities = [entity for sentence in sentences for entity in sentence.entities]
+            lines = [line for sentence in sentences for line in sentence.lines]
+            soap = self.organize_soap(text, merged_entities, lines)
+            summary = summarize(merged_scores, merged_entities, soap)
+
+            previous_summary = state.summary or {
+                'label': None,
+                'sections': self.organize_soap('', [], []),
+                'entities': {}
+            }
+            current = {sentence.fingerprint for sentence in sentences}
+            changes = {
+                'revision': state.revision + 1,
+                'sentences': len(sentences),
+                'analyzed': len(missing),
+                'reused': len(sentences) - len(changed),
+                'removed': len({fp for fp in known if fp not in current}),
+                'changed_sentences': changed,
+                'sections_changed': _changed_keys(previous_summary['sections'], summary['sections']),
+                'entities_changed': _changed_keys(previous_summary['entities'], summary['entities']),
+                'classification_changed': previous_summary['label'] != summary['label']
+            }
+
+            state.revision += 1
+            state.sentences = sentences
+            state.models = models
+            state.index = index
+            state.summary = summary
+
+        with self._lock:
+            self._counters['revisions'] += 1
+            self._counters['sentences_reused'] += changes['reused']
+            self._counters['sentences_analyzed'] += changes['analyzed']
+        return RevisionResult(merged_scores, merged_entities, lines, soap, changes)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['notes'] = len(self._notes)
+        stats['max_notes'] = self.max_notes
+        return stats
@@ -0,0 +1,185 @@
+"""
+Pre-forking server: load the models once, then fork workers that share them.
+
+The parent imports the app with eager model loading, freezes the garbage
+collector and forks the workers, which all accept connections from one
+listening socket. With the default 'mmap' backend the weights are read-only
+views of memory-mapped safetensors files, so they live outside the Python
+heap: reference counting in a worker only touches the small tensor objects,
+never the weight pages, and gc.freeze() stops the collector from writing to
+every object created before the fork. N workers therefore cost about one
+copy of the models plus each worker's own request state.
+
+Socket.IO sessions live in the worker that accepted them, so dictation over
+long-polling needs sticky sessions in front of more than one worker. The
+HTTP API is stateless and can be balanced freely. POSIX only.
+
+Usage (from the backend directory):
+    python prefork_server.py --workers 4
+    kill -USR1 <parent pid>    # log each worker's resident and proportional memory
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger('prefork_server')
+
+
+def memory_summary(pid):
+    """Resident, proportional and shared memory of a process in MB"""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as handle:
+            for line in handle:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        'rss_mb': round(fields.get('Rss', 0), 1),
+        'pss_mb': round(fields.get('Pss', 0), 1),
+        'shared_mb': round(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0), 1),
+    }
+
+
+def load_app(preload_speech):
+    """Import the app in the parent with every model loaded up front"""
+    from config.settings import INFERENCE_BACKEND, MODEL_LOADING
+
+    MODEL_LOADING['mode'] = 'eager'
+    if preload_speech:
+        MODEL_LOADING['speech_mode'] = 'eager'
+    # Memory-mapped weights unless another backend was chosen explicitly
+    if 'INFERENCE_BACKEND' not in os.environ:
+        INFERENCE_BACKEND['backend'] = 'mmap'
+    import app
+    return app
+
+
+def serve_worker(app_module, listener, host, port, threads):
+    """Run one worker on the inherited listening socket; never returns"""
+    from werkzeug.serving import make_server
+
+    # The parent relays Ctrl+C as SIGTERM, which ends the worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    app_module.after_fork()
+    server = make_server(host, port, app_module.app, threaded=True, fd=listener.fileno())
+    logger.info(f'Worker {os.getpid()} serving')
+    server.serve_forever()
+
+
+class Supervisor:
+    """Forks the workers, restarts any that die and stops them on a signal"""
+
+    def __init__(self, app_module, listener, args):
+        self.app_module = app_module
+        self.listener = listener
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                serve_worker(self.app_module, self.listener, self.args.host, self.args.port,
+                             self.args.threads)
+            except Exception:
+                logger.exception(f'Worker {os.getpid()} failed')
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report(self, signum, frame):
+        total_pss = 0.0
+        for pid in [os.getpid()] + list(self.workers):
+            summary = memory_summary(pid)
+            if summary:
+                total_pss += summary['pss_mb']
+                logger.info(f'pid {pid}: {summary}')
+        logger.info(f'Total proportional memory: {total_pss:.0f} MB')
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, self.report)
+        for _ in range(self.args.workers):
+            self.spawn()
+        logger.info(f'Started {len(self.workers)} workers on '
+                    f'http://{self.args.host}:{self.args.port}: {sorted(self.workers)}')
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning(f'Worker {pid} exited with status {status}; restarting')
+            # Do not spin if workers die straight after starting
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            self.spawn()
+
+
+def main():
+    from config.settings import HOST, PORT, PREFORK
+
+    parser = argparse.ArgumentParser(description='Serve the app from pre-forked workers that share the models')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=PREFORK['workers'])
+    parser.add_argument('--threads', type=int, default=PREFORK['threads_per_worker'],
+                        help='torch threads per worker')
+    parser.add_argument('--no-preload-speech', dest='preload_speech', action='store_false',
+                        default=PREFORK['preload_speech'],
+                        help='let each worker load the dictation models on first use')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        parser.error('the pre-forking server needs a POSIX system')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(message)s')
+    app_module = load_app(args.preload_speech)
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+
+    # Move everything allocated so far out of the collector's reach so the
+    # workers never dirty those pages just by collecting
+    gc.collect()
+    gc.freeze()
+    logger.info(f'Models loaded; parent memory {memory_summary(os.getpid())}')
+
+    Supervisor(app_module, listener, args).run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Room-scoped real-time fan-out for Socket.IO.
+
+Messages published to a room (one per encounter, plus a lobby every client
+joins) are coalesced for up to ``flush_ms`` and sent to each member as a
+single 'message_batch' event. Every batch asks for an acknowledgement; a
+client holding ``max_in_flight`` unacknowledged batches is a slow consumer,
+and its messages wait in a bounded backlog (oldest dropped first) instead of
+piling up in the server's send queues.
+
+Publishing goes through a pub/sub adapter. The in-process adapter serves a
+single server and tests; the Redis adapter lets several server processes
+share rooms, each fanning out to the clients connected to it.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+LOBBY_ROOM = 'lobby'
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+
+
+def encounter_room(encounter_id):
+    return f'encounter:{encounter_id}'
+
+
+def patch_for_async_mode(mode):
+    """Monkey-patch the standard library for an event-loop mode; call before other imports"""
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"Unknown Socket.IO async mode '{mode}', expected one of {ASYNC_MODES}")
+    if mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+
+class InProcessPubSub:
+    """Delivers published messages to the subscribers in this process"""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def start(self, start_task):
+        pass
+
+    def publish(self, room, message):
+        for callback in list(self._subscribers):
+            callback(room, message)
+
+
+class RedisPubSub:
+    """Shares published messages between server processes over a Redis channel"""
+
+    def __init__(self, url, channel='diabuddy:realtime', retry_seconds=1.0):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The Redis pub/sub adapter needs the 'redis' package") from e
+        self._redis = redis.Redis.from_url(url)
+        self.channel = channel
+        self.retry_seconds = retry_seconds
+        self._subscribers = []
+        self._started = False
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def start(self, start_task):
+        """Listen on a background task; started lazily so forked workers get their own"""
+        if not self._started:
+            self._started = True
+            start_task(self._listen)
+
+    def publish(self, room, message):
+        self._redis.publish(self.channel, json.dumps({'room': room, 'message': message}))
+
+    def _listen(self):
+        while True:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                for item in pubsub.listen():
+                    try:
+                        payload = json.loads(item['data'])
+                    except (TypeError, ValueError):
+                        continue
+                    for callback in list(self._subscribers):
+                        callback(payload['room'], payload['message'])
+            except Exception as e:
+                logger.error(f'Lost the pub/sub connection, retrying: {e}')
+                time.sleep(self.retry_seconds)
+            finally:
+                pubsub.close()
+
+
+def build_pubsub(url):
+    """In-process pub/sub for an empty URL (or 'memory'), Redis for redis:// URLs"""
+    if not url or url == 'memory':
+        return InProcessPubSub()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisPubSub(url)
+    raise ValueError(f"Unsupported message queue '{url}'")
+
+
+class _Client:
+    __slots__ = ('in_flight', 'sent_at', 'backlog')
+
+    def __init__(self, max_backlog):
+        self.in_flight = 0
+        self.sent_at = deque()
+        self.backlog = deque(maxlen=max_backlog)
+
+
+class RoomBroadcaster:
+    """Coalesces room messages and fans them out with per-client backpressure"""
+
+    def __init__(self, sio, pubsub, flush_ms=25, max_batch=100, max_in_flight=4, max_backlog=500,
+                 ack_timeout=10, event='message_batch', namespace='/'):
+        self.sio = sio
+        self.pubsub = pubsub
+        self.flush_interval = flush_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self.ack_timeout = ack_timeout
+        self.event = event
+        self.namespace = namespace
+        self._pending = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self._counters = {
+            'published': 0,
+            'received': 0,
+            'batches_sent': 0,
+            'messages_sent': 0,
+            'deferred': 0,
+            'dropped': 0,
+            'ack_timeouts': 0
+        }
+        pubsub.subscribe(self._receive)
+
+    def start(self):
+        """Start the flush loop (and the pub/sub listener) in this process"""
+        with self._lock:
+            if self._task is not None:
+                return
+            self._task = self.sio.start_background_task(self._run)
+        self.pubsub.start(self.sio.start_background_task)
+
+    def publish(self, room, message):
+        """Queue a message for every member of room, in every server process"""
+        with self._lock:
+            self._counters['published'] += 1
+        self.pubsub.publish(room, message)
+
+    def forget(self, sid):
+        with self._lock:
+            self._clients.pop(sid, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['clients'] = len(self._clients)
+            stats['slow_clients'] = sum(
+                1 for client in self._clients.values() if client.in_flight >= self.max_in_flight
+            )
+            stats['pending_rooms'] = len(self._pending)
+        return stats
+
+    def _receive(self, room, message):
+        with self._lock:
+            self._counters['received'] += 1
+            pending = self._pending.get(room)
+            if pending is None:
+                pending = self._pending[room] = deque(maxlen=self.max_backlog)
+            elif len(pending) == pending.maxlen:
+                self._counters['dropped'] += 1
+            pending.append(message)
+
+    def _run(self):
+        while True:
+            self.sio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Broadcast flush failed')
+
+    def flush(self):
+        """Send everything queued since the last flush"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for room, messages in pending.items():
+            messages = list(messages)
+            participants = [sid for sid, _ in self.sio.manager.get_participants(self.namespace, room)]
+            for sid in participants:
+                self._send(sid, [(room, message) for message in messages])
+
+        # Clients whose acknowledgements timed out can take their backlog now
+        now = time.monotonic()
+        with self._lock:
+            ready = [sid for sid, client in self._clients.items()
+                     if client.backlog and self._expire(client, now) < self.max_in_flight]
+        for sid in ready:
+            self._send(sid, [])
+
+    def _expire(self, client, now):
+        # Caller holds self._lock; a batch never acknowledged is assumed lost
+        if client.sent_at and now - client.sent_at[0] > self.ack_timeout:
+            client.in_flight = 0
+            client.sent_at.clear()
+            self._counters['ack_timeouts'] += 1
+        return client.in_flight
+
+    def _send(self, sid, items):
+        now = time.monotonic()
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                client = self._clients[sid] = _Client(self.max_backlog)
+            if self._expire(client, now) >= self.max_in_flight:
+                # Slow consumer: hold the newest messages until it catches up
+                overflow = len(client.backlog) + len(items) - self.max_backlog
+                self._counters['dropped'] += max(0, min(overflow, self.max_backlog))
+                self._counters['deferred'] += len(items)
+                client.backlog.extend(items)
+                return
+            if client.backlog:
+                items = list(client.backlog) + items
+                client.backlog.clear()
+
+            batches = []
+            by_room = {}
+            for room, message in items:
+                by_room.setdefault(room, []).append(message)
+            for room, messages in by_room.items():
+                for start in range(0, len(messages), self.max_batch):
+                    batches.append({'room': room, 'messages': messages[start:start + self.max_batch]})
+            client.in_flight += len(batches)
+            client.sent_at.extend([now] * len(batches))
+            self._counters['batches_sent'] += len(batches)
+            self._counters['messages_sent'] += len(items)
+
+        for batch in batches:
+            self.sio.emit(self.event, batch, to=sid, namespace=self.namespace,
+                          callback=lambda *args, sid=sid: self._ack(sid))
+
+    def _ack(self, sid):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is None:
+                return
+            if client.sent_at:
+                client.sent_at.popleft()
+            client.in_flight = max(0, client.in_flight - 1)
+            catch_up = bool(client.backlog) and client.in_flight < self.max_in_flight
+        if catch_up:
+            self._send(sid, [])
@@ -0,0 +1,240 @@
+"""
+Content-addressed cache for model inference results.
+
+Entries are keyed by a hash of the normalized note text plus the identities
+of the models that produced them. The in-process tier is an LRU bounded by
+bytes with TTL expiry; an optional SQLite tier keeps results across restarts.
+The disk tier tracks its size as rows come and go and only sweeps expired
+rows every disk_prune_every writes, so a write does not scan the table.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """Collapse whitespace and unicode forms so trivial edits share a key"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def make_key(text, model_identity):
+    """Hash normalized text together with the models that analyze it"""
+    digest = hashlib.sha256()
+    digest.update(model_identity.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _json_default(obj):
+    # Pipelines return numpy scalars for scores
+    if hasattr(obj, 'item'):
+        return obj.item()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class ResultCache:
+    """LRU-by-bytes cache with TTL expiry and an optional SQLite tier"""
+
+    def __init__(self, max_bytes, ttl_seconds, disk_path=None, disk_max_bytes=None, disk_prune_every=100):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        self.disk_max_bytes = int(disk_max_bytes) if disk_max_bytes else None
+        self.disk_prune_every = max(1, int(disk_prune_every))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'stores': 0
+        }
+        self._disk = None
+        self._disk_bytes = 0
+        self._disk_writes = 0
+        self._disk_path = disk_path
+        self._disk_lock = threading.Lock()
+        self._inherited = []
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def after_fork(self):
+        """Reopen the disk tier in a forked worker; the inherited connection stays unused"""
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        if self._disk is not None:
+            self._inherited.append(self._disk)
+            self._open_disk(self._disk_path)
+
+    def _open_disk(self, path):
+        try:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute('PRAGMA journal_mode=WAL')
+            self._disk.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, payload TEXT NOT NULL, '
+                'size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            self._disk.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)')
+            self._disk.commit()
+            self._disk_bytes = self._disk_size()
+        except sqlite3.Error as e:
+            logger.error(f"Could not open result cache at {path}: {e}")
+            self._disk = None
+
+    def get(self, key):
+        """Return a fresh copy of the cached value, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return json.loads(payload)
+                self._drop(key)
+                self._counters['expirations'] += 1
+
+        row = self._disk_get(key, now)
+        if row is None:
+            with self._lock:
+                self._counters['misses'] += 1
+            return None
+
+        payload, expires_at = row
+        with self._lock:
+            self._counters['disk_hits'] += 1
+            self._insert(key, payload, expires_at)
+        return json.loads(payload)
+
+    def put(self, key, value):
+        """Store a JSON-serializable value"""
+        payload = json.dumps(value, default=_json_default, separators=(',', ':'))
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._counters['stores'] += 1
+            self._insert(key, payload, expires_at)
+        self._disk_put(key, payload, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.execute('DELETE FROM results')
+                self._disk.commit()
+                self._disk_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters for /api/status"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['disk_enabled'] = self._disk is not None
+        return stats
+
+    def _insert(self, key, payload, expires_at):
+        # Caller holds self._lock
+        size = len(payload) + len(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (expires_at, payload)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._counters['evictions'] += 1
+
+    def _drop(self, key):
+        # Caller holds self._lock
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload) + len(key)
+
+    def _disk_get(self, key, now):
+        if self._disk is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    'SELECT payload, expires_at, size FROM results WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] <= now:
+                    self._disk.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._disk.commit()
+                    self._disk_bytes -= row[2]
+                    return None
+                self._disk.execute('UPDATE results SET accessed_at = ? WHERE key = ?', (now, key))
+                self._disk.commit()
+                return row[:2]
+        except sqlite3.Error as e:
+            logger.error(f"Result cache read failed: {e}")
+            return None
+
+    def _disk_put(self, key, payload, expires_at):
+        if self._disk is None:
+            return
+        try:
+            with self._disk_lock:
+                replaced = self._disk.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+                self._disk.execute(
+                    'INSERT OR REPLACE INTO results (key, payload, size, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (key, payload, len(payload), expires_at, time.time())
+                )
+                self._disk_bytes += len(payload) - (replaced[0] if replaced else 0)
+                self._disk_writes += 1
+                if self._disk_writes % self.disk_prune_every == 0:
+                    self._expire_disk()
+                self._prune_disk()
+                self._disk.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Result cache write failed: {e}")
+
+    def _disk_size(self):
+        return self._disk.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def _expire_disk(self):
+        # Caller holds self._disk_lock
+        self._disk.execute('DELETE FROM results WHERE expires_at <= ?', (time.time(),))
+        # Resync the running total; other processes may share the file
+        self._disk_bytes = self._disk_size()
+
+    def _prune_disk(self):
+        # Caller holds self._disk_lock
+        if not self.disk_max_bytes or self._disk_bytes <= self.disk_max_bytes:
+            return
+        # Drop least recently used rows until we are back under budget
+        excess = self._disk_bytes - self.disk_max_bytes
+        rows = self._disk.execute('SELECT key, size FROM results ORDER BY accessed_at')
+        doomed = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+            self._disk_bytes -= size
+        self._disk.executemany('DELETE FROM results WHERE key = ?', doomed)
+        with self._lock:
+            self._counters['evictions'] += len(doomed)
@@ -0,0 +1,98 @@
+"""
+Single-pass multi-keyword matching for SOAP sentence routing.
+
+Keywords are compiled once into an Aho-Corasick automaton so a sentence is
+scanned a single time no matter how large the vocabulary grows. The SOAP
+vocabulary itself is built on top of this in vocabulary.py.
+"""
+
+from collections import deque
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton that reports every keyword occurrence in one scan"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]
+        self._tags = [frozenset()]
+        self._built = False
+
+    def __len__(self):
+        return len(self._goto)
+
+    def add(self, keyword, tag):
+        """Register a keyword and the tag reported when it is found"""
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(())
+                self._tags.append(frozenset())
+            node = next_node
+        self._outputs[node] = self._outputs[node] + ((keyword, tag),)
+        self._built = False
+
+    def build(self):
+        """Compute failure links so matches can be found in linear time"""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        pending = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            pending.append(child)
+
+        while pending:
+            node = pending.popleft()
+            for char, child in goto[node].items():
+                pending.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                # Parents are visited first, so the fallback already carries its suffix outputs
+                outputs[child] = outputs[child] + outputs[fail[child]]
+
+        self._tags = [frozenset(tag for _, tag in output) for output in outputs]
+        self._built = True
+        return self
+
+    def finditer(self, text):
+        """Yield (start, end, keyword, tag) for every occurrence, overlaps included"""
+        if not self._built:
+            self.build()
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for keyword, tag in outputs[state]:
+                yield index - len(keyword) + 1, index + 1, keyword, tag
+
+    def find_tags(self, text):
+        """Return the set of tags whose keywords occur anywhere in text"""
+        if not self._built:
+            self.build()
+        goto = self._goto
+        fail = self._fail
+        tags_at = self._tags
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if tags_at[state]:
+                found |= tags_at[state]
+        return found
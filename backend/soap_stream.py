@@ -0,0 +1,105 @@
+"""
+Incremental SOAP assembly for live dictation.
+
+Each client gets a session that remembers the SOAP note built so far. New
+transcript text is split into sentences and only those sentences are
+classified, so the work per chunk stays flat over a long encounter. Callers
+receive just the delta for the sections that changed.
+"""
+
+import re
+import threading
+from datetime import datetime
+
+# A trailing fragment this long is processed even without a sentence end
+MAX_PENDING_CHARS = 1000
+
+SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s*$')
+
+
+class SoapStreamSession:
+    """Per-client streaming state on top of a SpeechProcessor"""
+
+    def __init__(self, processor, session_id=None):
+        self.processor = processor
+        self.session_id = session_id
+        self.soap = processor.new_soap_state()
+        self.pending = ''
+        self.sentence_count = 0
+        self.sequence = 0
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+
+    def feed(self, text, final=False):
+        """Add transcript text and return the SOAP delta, or None if nothing changed
+
+        The last sentence is held back until more text arrives unless the chunk
+        ends with terminal punctuation or ``final`` is set.
+        """
+        with self._lock:
+            combined = ' '.join(part for part in (self.pending, text.strip()) if part)
+            if not combined:
+                return None
+
+            spans = self.processor.sentence_spans(self.processor.nlp(combined))
+            self.pending = ''
+            if spans and not final and not SENTENCE_END.search(combined) \
+                    and len(spans[-1].text) < MAX_PENDING_CHARS:
+                self.pending = spans.pop().text.strip()
+
+            if not spans:
+                return None
+
+            # One parse per chunk; the spans carry their entities
+            sentences = [span.text.strip() for span in spans]
+            chunk = self.processor.new_soap_state()
+            categories = self.processor.classify_sentences(sentences)
+            for span, sentence, category in zip(spans, sentences, categories):
+                self.processor.add_sentence(chunk, sentence, category, ents=span.ents)
+            self.sentence_count += len(sentences)
+
+            delta = self._merge(chunk)
+            if not delta:
+                return None
+            self.sequence += 1
+            return {
+                'sequence': self.sequence,
+                'timestamp': datetime.now().isoformat(),
+                'sentences': len(sentences),
+                'sections': delta
+            }
+
+    def flush(self):
+        """Process any held-back fragment, e.g. when dictation stops"""
+        return self.feed('', final=True)
+
+    def snapshot(self):
+        """Return the full SOAP note assembled so far"""
+        with self._lock:
+            return self.processor.format_soap(self.soap)
+
+    def _merge(self, chunk):
+        # Only report set members the client has not seen yet
+        for section, field in (('subjective', 'key_findings'), ('assessment', 'diagnoses')):
+            chunk[section][field] -= self.soap[section][field]
+
+        for section, fields in chunk.items():
+            for field, value in fields.items():
+                current = self.soap[section][field]
+                if isinstance(current, list):
+                    current.extend(value)
+                elif isinstance(current, set):
+                    current |= value
+                elif isinstance(current, dict):
+                    # follow_up starts as None, so a later chunk may not have one
+                    current.update(value or {})
+                elif value is not None:
+                    # Scalar fields such as follow_up take the latest value
+                    self.soap[section][field] = value
+
+        delta = {}
+        for name, fields in self.processor.format_soap(chunk)['sections'].items():
+            changed = {field: value for field, value in fields.items() if value}
+            if changed:
+                delta[name] = changed
+        return delta
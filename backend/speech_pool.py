@@ -0,0 +1,117 @@
+"""
+A bounded pool of per-session SpeechProcessors.
+
+The models live once in SpeechResources. Each dictation session checks out
+its own lightweight SpeechProcessor, which holds the session's recognizer
+and noise calibration. It keeps that processor until it checks it back in.
+Returned processors are reset and reused. A session that has been idle for
+longer than idle_timeout is reaped. Its processor goes back to the pool and
+on_reap(key) lets the owner drop whatever else the session held. At most
+max_sessions are checked out at once; beyond that checkout raises
+PoolExhausted.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    """Every session slot is in use; the caller should retry later"""
+
+
+class SpeechProcessorPool:
+    def __init__(self, load_resources, max_sessions=64, idle_timeout=300, on_reap=None):
+        # load_resources() returns the shared SpeechResources, or None while they are unavailable
+        self.load_resources = load_resources
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_reap = on_reap
+        self._active = {}
+        self._free = []
+        self._lock = threading.Lock()
+        self._counters = {'checkouts': 0, 'created': 0, 'reused': 0, 'reaped': 0, 'exhausted': 0}
+
+    def checkout(self, key):
+        """The processor for session key, checking one out on first use; None without models"""
+        with self._lock:
+            entry = self._active.get(key)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                return entry[0]
+
+        if len(self._active) >= self.max_sessions:
+            self.reap_idle()
+        resources = self.load_resources()
+        if resources is None:
+            return None
+
+        with self._lock:
+            entry = self._active.get(key)
+            if entry is not None:
+                return entry[0]
+            if len(self._active) >= self.max_sessions:
+                self._counters['exhausted'] += 1
+                raise PoolExhausted(f'All {self.max_sessions} dictation sessions are in use')
+            processor = None
+            while self._free and processor is None:
+                candidate = self._free.pop()
+                # Processors built on models that have since been replaced are dropped
+                if candidate.resources is resources:
+                    processor = candidate
+            if processor is None:
+                # Imported here so importing the pool does not pull in spaCy and transformers
+                from speech_processor import SpeechProcessor
+                # Cheap: the models are shared, only the recognizer is new
+                processor = SpeechProcessor(resources)
+                self._counters['created'] += 1
+            else:
+                self._counters['reused'] += 1
+            self._counters['checkouts'] += 1
+            self._active[key] = [processor, time.monotonic()]
+            return processor
+
+    def touch(self, key):
+        with self._lock:
+            entry = self._active.get(key)
+            if entry is not None:
+                entry[1] = time.monotonic()
+
+    def checkin(self, key):
+        """Return the session's processor to the pool; False if it had none"""
+        with self._lock:
+            entry = self._active.pop(key, None)
+        if entry is None:
+            return False
+        processor = entry[0]
+        processor.reset()
+        with self._lock:
+            if len(self._free) < self.max_sessions:
+                self._free.append(processor)
+        return True
+
+    def reap_idle(self):
+        """Check in sessions idle for longer than idle_timeout; returns their keys"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [key for key, (_, last_used) in self._active.items() if last_used < cutoff]
+        for key in idle:
+            if self.on_reap is not None:
+                try:
+                    self.on_reap(key)
+                except Exception as e:
+                    logger.error(f'Error closing idle dictation session {key}: {e}')
+            if self.checkin(key):
+                with self._lock:
+                    self._counters['reaped'] += 1
+        return idle
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['active'] = len(self._active)
+            stats['free'] = len(self._free)
+        stats['max_sessions'] = self.max_sessions
+        return stats
@@ -1,147 +1,259 @@
 import speech_recognition as sr
 import spacy
 from transformers import pipeline, AutoTokenizer, AutoModel
+import io
 import json
+import threading
+from collections import OrderedDict
 from datetime import datetime
-import re
 
-class SpeechProcessor:
+from audio_ingest import frame_rms
+from cascade import LabelLog, TierStats, load_local_model
+from config.settings import CASCADE, SPACY, SPEECH_RECOGNITION, ZERO_SHOT
+from extraction import ExtractionEngine
+from metrics import stage
+from vocabulary import shared_vocabulary
+
+# Zero-shot hypotheses and the SOAP section each one stands for
+CANDIDATE_LABELS = {
+    "subjective patient complaints and history": "subjective",
+    "objective medical findings and measurements": "objective",
+    "assessment and diagnosis": "assessment",
+    "treatment plan and recommendations": "plan",
+}
+
+NOT_UNDERSTOOD = "Speech recognition could not understand the audio"
+
+# Frame length for measuring audio energy
+FRAME_MS = 30
+
+def frame_energies(audio_data):
+    """RMS energy of each FRAME_MS frame of AudioData"""
+    pcm = audio_data.get_raw_data(convert_width=2)
+    step = max(2, int(audio_data.sample_rate * FRAME_MS / 1000) * 2)
+    return [frame_rms(pcm[start:start + step]) for start in range(0, len(pcm) - 1, step)]
+
+class SpeechResources:
+    """The heavyweight models and tables, loaded once and shared by every session
+
+    Nothing here changes per session. spaCy pipelines can be called from
+    several threads. The transformers pipeline cannot: its fast tokenizer
+    raises "Already borrowed" on concurrent calls, so zero-shot batches take
+    turns. They already use every core between them.
+    """
+
     def __init__(self):
-        # Initialize speech recognizer with custom settings
-        self.recognizer = sr.Recognizer()
-        self.recognizer.energy_threshold = 300  # Increased sensitivity
-        self.recognizer.dynamic_energy_threshold = True
-        self.recognizer.pause_threshold = 0.8  # Shorter pause detection
-        
-        # Load SpaCy model for medical text processing
-        self.nlp = spacy.load("en_core_web_sm")
-        
+        # Load SpaCy model for medical text processing; we only need
+        # sentence boundaries and entities, so skip the other components
+        self.nlp = spacy.load(SPACY['model'], exclude=SPACY['exclude'])
+
         # Initialize BERT-based text classification
         self.classifier = pipeline("zero-shot-classification")
-        
-        # Common medical terms and abbreviations
-        self.medical_terms = {
-            "vitals": ["BP", "HR", "RR", "T", "SpO2", "blood pressure", "heart rate", "respiratory rate", "temperature", "oxygen saturation"],
-            "measurements": ["kg", "cm", "mm Hg", "bpm", "celsius", "fahrenheit"],
-            "assessments": ["diagnosis", "differential", "impression", "assessment", "suspected"],
-            "medications": ["mg", "mcg", "ml", "tablet", "capsule", "injection", "oral", "IV", "IM"],
-            "timing": ["bid", "tid", "qid", "prn", "daily", "weekly", "q4h", "q6h", "q8h", "q12h"],
-        }
-        
-        # SOAP section keywords
-        self.soap_keywords = {
-            "subjective": [
-                "patient reports", "complains of", "states", "describes", "feels",
-                "denies", "admits", "history", "symptoms", "pain scale"
-            ],
-            "objective": [
-                "vital signs", "examination reveals", "observed", "auscultation",
-                "palpation", "measured", "test results", "lab values", "findings"
-            ],
-            "assessment": [
-                "diagnosis", "impression", "likely", "suspected", "differential",
-                "consistent with", "suggests", "indicates", "assessment"
-            ],
-            "plan": [
-                "recommend", "prescribe", "plan", "treatment", "follow up",
-                "refer", "order", "schedule", "instructions", "education"
-            ]
-        }
+        self.candidate_labels = list(CANDIDATE_LABELS)
+        self._zero_shot_lock = threading.Lock()
+        # Zero-shot results for recently seen sentences
+        self.zero_shot_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        # Cheap local model consulted before zero-shot, and which tier answered
+        self.local_model = load_local_model(CASCADE['model_path']) if CASCADE['enabled'] else None
+        self.local_threshold = CASCADE['threshold']
+        self.label_log = LabelLog(CASCADE['label_log']) if CASCADE['label_log'] else None
+        self.tiers = TierStats()
+
+        # Vitals, measurement, medication and correction patterns, compiled once
+        self.extractor = ExtractionEngine.from_settings()
+
+        # SOAP keywords and medical terms, shared with the HTTP analyzer
+        self.vocabulary = shared_vocabulary()
+
+    def zero_shot(self, sentences):
+        """Run the zero-shot pipeline over sentences; results follow their order"""
+        with self._zero_shot_lock:
+            results = self.classifier(sentences, self.candidate_labels, batch_size=ZERO_SHOT['batch_size'])
+        return [results] if isinstance(results, dict) else results
+
+    def cached_category(self, sentence):
+        with self._cache_lock:
+            category = self.zero_shot_cache.get(sentence)
+            if category is not None:
+                self.zero_shot_cache.move_to_end(sentence)
+            return category
+
+    def remember(self, sentence, category):
+        with self._cache_lock:
+            self.zero_shot_cache[sentence] = category
+            if len(self.zero_shot_cache) > ZERO_SHOT['cache_size']:
+                self.zero_shot_cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self.zero_shot_cache.clear()
+
+class SpeechProcessor:
+    """Per-session speech state on top of shared SpeechResources
+
+    Only the recognizer and its noise calibration belong to the session, so
+    a processor is cheap. Pass resources to share already-loaded models;
+    without them the models are loaded here.
+    """
+
+    def __init__(self, resources=None):
+        self.resources = resources or SpeechResources()
+        self.nlp = self.resources.nlp
+        self.classifier = self.resources.classifier
+        self.candidate_labels = self.resources.candidate_labels
+        self.extractor = self.resources.extractor
+        self.vocabulary = self.resources.vocabulary
+        self.reset()
+
+    def reset(self):
+        """Forget the session's recognizer state so the processor can serve another session"""
+        # Initialize speech recognizer with custom settings
+        self.recognizer = sr.Recognizer()
+        self.recognizer.energy_threshold = SPEECH_RECOGNITION['energy_threshold']
+        self.recognizer.dynamic_energy_threshold = SPEECH_RECOGNITION['dynamic_energy_threshold']
+        self.recognizer.pause_threshold = SPEECH_RECOGNITION['pause_threshold']
+        # Ambient noise energy, measured once from the session's first audio
+        self.ambient_energy = None
+
+    def calibrate(self, audio_data):
+        """Set the energy threshold from the quietest frames of the session's first audio
+
+        The result is kept for the rest of the session. Each later chunk is
+        only checked against the threshold, not re-measured.
+        """
+        energies = frame_energies(audio_data)
+        if not energies:
+            return
+        seconds = SPEECH_RECOGNITION['calibration_seconds']
+        frames = max(1, int(seconds * 1000 / FRAME_MS))
+        quietest = sorted(energies[:frames])
+        self.ambient_energy = quietest[len(quietest) // 10]
+        if self.recognizer.dynamic_energy_threshold:
+            self.recognizer.energy_threshold = self.ambient_energy * SPEECH_RECOGNITION['dynamic_energy_ratio']
+
+    def is_silent(self, audio_data):
+        """True when no frame of the chunk rises above the session's energy threshold"""
+        energies = frame_energies(audio_data)
+        return not energies or max(energies) < self.recognizer.energy_threshold
 
     def preprocess_audio(self, audio_data):
-        """Enhance audio quality for better recognition"""
-        try:
-            # Adjust for ambient noise
-            self.recognizer.adjust_for_ambient_noise(audio_data)
-            return audio_data
-        except Exception as e:
-            print(f"Error preprocessing audio: {e}")
-            return audio_data
+        """Calibrate to the session's ambient noise on its first chunk"""
+        if self.ambient_energy is None:
+            self.calibrate(audio_data)
+        return audio_data
+
+    def load_wav(self, wav_bytes):
+        """Read WAV/AIFF/FLAC bytes into AudioData for recognition"""
+        with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            return self.recognizer.record(source)
 
     def transcribe_audio(self, audio_data):
         """Convert audio to text using Google Speech Recognition with medical context"""
         try:
             # Preprocess audio
             audio_data = self.preprocess_audio(audio_data)
-            
+            if SPEECH_RECOGNITION['skip_silence'] and self.is_silent(audio_data):
+                return NOT_UNDERSTOOD
+
             # Perform recognition
-            text = self.recognizer.recognize_google(audio_data)
+            with stage('speech.recognize'):
+                text = self.recognizer.recognize_google(audio_data)
             
             # Post-process medical terms
-            text = self.post_process_medical_terms(text)
+            with stage('speech.corrections'):
+                text = self.post_process_medical_terms(text)
             return text
         except sr.UnknownValueError:
-            return "Speech recognition could not understand the audio"
+            return NOT_UNDERSTOOD
         except sr.RequestError as e:
             return f"Could not request results from speech recognition service; {e}"
 
     def post_process_medical_terms(self, text):
         """Correct common medical terms and abbreviations"""
-        # Convert text to lowercase for matching
-        text_lower = text.lower()
-        
-        # Replace common misheard medical terms
-        corrections = {
-            "blood pressure": ["blood fresher", "blood presser"],
-            "hypertension": ["high pertension", "high tension"],
-            "diabetes": ["diabetics", "diabeties"],
-            "medication": ["medications", "medicine"],
-            "temperature": ["temp"],
-            # Add more common corrections
-        }
-        
-        for correct, variants in corrections.items():
-            for variant in variants:
-                text_lower = text_lower.replace(variant, correct)
-        
-        # Correct units and measurements
-        measurement_patterns = {
-            r'(\d+)\s*over\s*(\d+)': r'\1/\2',  # Blood pressure format
-            r'(\d+)\s*bpm': r'\1 BPM',  # Heart rate
-            r'(\d+)\s*degrees?': r'\1°',  # Temperature
-        }
-        
-        for pattern, replacement in measurement_patterns.items():
-            text_lower = re.sub(pattern, replacement, text_lower)
-        
-        return text_lower
+        return self.extractor.correct(text)
+
+    def keyword_category(self, sentence):
+        """Return the best-scoring SOAP section by keywords, if any scores high enough"""
+        return self.vocabulary.current().classify(sentence).section
 
     def classify_sentence(self, sentence):
         """Classify sentence into SOAP categories with improved accuracy"""
+        return self.classify_sentences([sentence])[0]
+
+    def classify_sentences(self, sentences):
+        """Classify many sentences: keywords, then the local model, then zero-shot in one batch"""
+        resources = self.resources
         # First check for strong keyword matches
-        sentence_lower = sentence.lower()
-        
-        for category, keywords in self.soap_keywords.items():
-            for keyword in keywords:
-                if keyword in sentence_lower:
-                    return category
-        
-        # If no strong keyword matches, use zero-shot classification
-        candidate_labels = [
-            "subjective patient complaints and history",
-            "objective medical findings and measurements",
-            "assessment and diagnosis",
-            "treatment plan and recommendations"
-        ]
-        
-        result = self.classifier(sentence, candidate_labels)
-        scores = result['scores']
-        labels = result['labels']
-        
-        # Get the highest scoring category
-        max_score_index = scores.index(max(scores))
-        category = labels[max_score_index].split()[0].lower()
-        
-        return category
+        with stage('speech.keywords'):
+            categories = [self.keyword_category(sentence) for sentence in sentences]
+        resources.tiers.record('keyword', sum(category is not None for category in categories))
 
-    def organize_into_soap(self, text):
-        """Organize transcribed text into SOAP format with enhanced structure"""
-        # Split text into sentences
-        doc = self.nlp(text)
-        sentences = [sent.text.strip() for sent in doc.sents]
-        
-        # Initialize SOAP sections with metadata
-        soap = {
+        # Collect the sentences that still need the model, skipping repeats
+        unresolved = {}
+        cached_hits = 0
+        for index, category in enumerate(categories):
+            if category is None:
+                cached = resources.cached_category(sentences[index])
+                if cached is not None:
+                    categories[index] = cached
+                    cached_hits += 1
+                else:
+                    unresolved.setdefault(sentences[index], []).append(index)
+        resources.tiers.record('cache', cached_hits)
+
+        if unresolved and resources.local_model is not None:
+            # The local model keeps confident answers off the zero-shot model
+            with stage('speech.local_model'):
+                for sentence in list(unresolved):
+                    category, confidence = resources.local_model.predict(sentence)
+                    if confidence >= resources.local_threshold:
+                        indexes = unresolved.pop(sentence)
+                        for index in indexes:
+                            categories[index] = category
+                        resources.tiers.record('local', len(indexes))
+
+        if unresolved:
+            # If no strong keyword matches, use zero-shot classification
+            pending = list(unresolved)
+            with stage('speech.zero_shot'):
+                results = resources.zero_shot(pending)
+            decisions = []
+            for sentence, result in zip(pending, results):
+                # Labels come back sorted by score, highest first
+                category = CANDIDATE_LABELS[result['labels'][0]]
+                resources.remember(sentence, category)
+                for index in unresolved[sentence]:
+                    categories[index] = category
+                resources.tiers.record('zero_shot', len(unresolved[sentence]))
+                decisions.append({'text': sentence, 'label': category, 'score': round(result['scores'][0], 4)})
+            if resources.label_log is not None:
+                resources.label_log.append(decisions)
+
+        return categories
+
+    def cascade_stats(self):
+        """Sentences answered by each classification tier, for /api/status"""
+        resources = self.resources
+        stats = resources.tiers.snapshot()
+        stats['local_model'] = resources.local_model.version if resources.local_model is not None else None
+        stats['threshold'] = resources.local_threshold
+        return stats
+
+    def sentence_spans(self, doc):
+        """Return the non-empty sentence spans of a parsed document"""
+        return [sent for sent in doc.sents if sent.text.strip()]
+
+    def split_sentences(self, text):
+        """Split text into stripped, non-empty sentences"""
+        with stage('speech.spacy'):
+            doc = self.nlp(text)
+        return [sent.text.strip() for sent in self.sentence_spans(doc)]
+
+    def new_soap_state(self):
+        """Create the working structure that sentences are accumulated into"""
+        return {
             "subjective": {
                 "content": [],
                 "key_findings": set()
@@ -161,40 +273,46 @@ class SpeechProcessor:
                 "follow_up": None
             }
         }
-        
-        # Process each sentence
-        for sentence in sentences:
-            category = self.classify_sentence(sentence)
-            
-            # Extract and categorize information based on section
-            if category == "subjective":
-                soap["subjective"]["content"].append(sentence)
-                # Extract key symptoms/complaints
-                doc = self.nlp(sentence)
-                for ent in doc.ents:
-                    if ent.label_ in ["SYMPTOM", "CONDITION"]:
-                        soap["subjective"]["key_findings"].add(ent.text)
-                        
-            elif category == "objective":
-                soap["objective"]["content"].append(sentence)
-                # Extract measurements and vitals
+
+    def add_sentence(self, soap, sentence, category, ents=None):
+        """Extract and categorize information from a sentence based on its section
+
+        Pass the entities of the sentence span when the text was already parsed;
+        otherwise the sentence is parsed again to find them.
+        """
+        if ents is None and category in ("subjective", "assessment"):
+            with stage('speech.spacy'):
+                ents = self.nlp(sentence).ents
+
+        if category == "subjective":
+            soap["subjective"]["content"].append(sentence)
+            # Extract key symptoms/complaints
+            for ent in ents:
+                if ent.label_ in ["SYMPTOM", "CONDITION"]:
+                    soap["subjective"]["key_findings"].add(ent.text)
+
+        elif category == "objective":
+            soap["objective"]["content"].append(sentence)
+            # Extract measurements and vitals
+            with stage('speech.extract'):
                 self.extract_measurements(sentence, soap["objective"])
-                
-            elif category == "assessment":
-                soap["assessment"]["content"].append(sentence)
-                # Extract potential diagnoses
-                doc = self.nlp(sentence)
-                for ent in doc.ents:
-                    if ent.label_ in ["CONDITION", "DISEASE"]:
-                        soap["assessment"]["diagnoses"].add(ent.text)
-                        
-            elif category == "plan":
-                soap["plan"]["content"].append(sentence)
-                # Extract medications and follow-up
+
+        elif category == "assessment":
+            soap["assessment"]["content"].append(sentence)
+            # Extract potential diagnoses
+            for ent in ents:
+                if ent.label_ in ["CONDITION", "DISEASE"]:
+                    soap["assessment"]["diagnoses"].add(ent.text)
+
+        elif category == "plan":
+            soap["plan"]["content"].append(sentence)
+            # Extract medications and follow-up
+            with stage('speech.extract'):
                 self.extract_plan_details(sentence, soap["plan"])
-        
-        # Format the result
-        formatted_soap = {
+
+    def format_soap(self, soap):
+        """Format the working structure as the SOAP note returned to clients"""
+        return {
             "timestamp": datetime.now().isoformat(),
             "sections": {
                 "Subjective": {
@@ -217,64 +335,87 @@ class SpeechProcessor:
                 }
             }
         }
-        
-        return formatted_soap
+
+    def organize_into_soap(self, text):
+        """Organize transcribed text into SOAP format with enhanced structure"""
+        # Parse once; sentence spans carry their own entities
+        with stage('speech.spacy'):
+            doc = self.nlp(text)
+        return self.organize_docs([doc])[0]
+
+    def organize_docs(self, docs):
+        """Organize already-parsed documents, classifying all their sentences in one batch"""
+        spans_per_doc = [self.sentence_spans(doc) for doc in docs]
+        sentences = [span.text.strip() for spans in spans_per_doc for span in spans]
+        categories = iter(self.classify_sentences(sentences))
+
+        results = []
+        for spans in spans_per_doc:
+            # Initialize SOAP sections with metadata
+            soap = self.new_soap_state()
+            for span in spans:
+                self.add_sentence(soap, span.text.strip(), next(categories), ents=span.ents)
+            # Format the result
+            results.append(self.format_soap(soap))
+        return results
+
+    def organize_many(self, texts, batch_size=None, n_process=None):
+        """Organize many transcripts using nlp.pipe, yielding SOAP notes in input order"""
+        batch_size = batch_size or SPACY['batch_size']
+        n_process = n_process or SPACY['n_process']
+        docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield from self.organize_docs(batch)
+                batch = []
+        if batch:
+            yield from self.organize_docs(batch)
 
     def extract_measurements(self, text, objective_data):
         """Extract measurements and vital signs from text"""
-        # Extract vital signs
-        vitals_patterns = {
-            'blood_pressure': r'BP[:\s]*(\d+/\d+)',
-            'heart_rate': r'HR[:\s]*(\d+)',
-            'temperature': r'T[:\s]*(\d+\.?\d*)',
-            'respiratory_rate': r'RR[:\s]*(\d+)',
-            'oxygen_saturation': r'SpO2[:\s]*(\d+%?)',
-        }
-        
-        for vital, pattern in vitals_patterns.items():
-            match = re.search(pattern, text)
-            if match:
-                objective_data["vitals"][vital] = match.group(1)
-        
-        # Extract other measurements
-        measurement_patterns = {
-            'weight': r'(\d+\.?\d*)\s*(kg|pounds|lbs)',
-            'height': r'(\d+\.?\d*)\s*(cm|meters|m)',
-            'bmi': r'BMI[:\s]*(\d+\.?\d*)',
-        }
-        
-        for measure, pattern in measurement_patterns.items():
-            match = re.search(pattern, text)
-            if match:
-                objective_data["measurements"][measure] = {
-                    "value": match.group(1),
-                    "unit": match.group(2) if len(match.groups()) > 1 else None
-                }
+        # The first reading of each kind in the sentence is the one recorded
+        vitals = {}
+        for match in self.extractor.find("vitals", text):
+            vitals.setdefault(match.name, match.groups["value"])
+        objective_data["vitals"].update(vitals)
+
+        measurements = {}
+        for match in self.extractor.find("measurements", text):
+            measurements.setdefault(match.name, {
+                "value": match.groups["value"],
+                "unit": match.groups.get("unit")
+            })
+        objective_data["measurements"].update(measurements)
 
     def extract_plan_details(self, text, plan_data):
         """Extract medication and follow-up details from plan section"""
-        # Extract medications
-        med_pattern = r'(\d+\s*(?:mg|mcg|ml|g|mg/ml|mcg/ml))\s*of\s*([A-Za-z]+)'
-        meds = re.findall(med_pattern, text)
-        for dose, med in meds:
+        for match in self.extractor.find("medications", text):
             plan_data["medications"].append({
-                "medication": med,
-                "dosage": dose
+                "medication": match.groups["medication"],
+                "dosage": match.groups["dosage"]
             })
-        
-        # Extract follow-up timing
-        follow_up_pattern = r'follow\s*(?:up|-up)\s*in\s*(\d+)\s*(days|weeks|months)'
-        follow_up = re.search(follow_up_pattern, text.lower())
-        if follow_up:
+
+        follow_ups = self.extractor.find("follow_up", text)
+        if follow_ups:
             plan_data["follow_up"] = {
-                "duration": follow_up.group(1),
-                "unit": follow_up.group(2)
+                "duration": follow_ups[0].groups["duration"],
+                "unit": follow_ups[0].groups["unit"].lower()
             }
 
-    def process_realtime(self, audio_chunk):
-        """Process audio chunk in real-time with enhanced features"""
+    def process_realtime(self, audio_chunk, session=None):
+        """Process audio chunk in real-time with enhanced features
+
+        With a streaming session only the new sentences are classified and
+        the SOAP delta for this chunk is returned instead of the full note.
+        """
         text = self.transcribe_audio(audio_chunk)
-        if text and text != "Speech recognition could not understand the audio":
+        if text and text != NOT_UNDERSTOOD:
+            if session is not None:
+                # A recognized utterance ends at a pause, so flush it as complete
+                return session.feed(text, final=True)
             soap_notes = self.organize_into_soap(text)
             return soap_notes
         return None 
\ No newline at end of file
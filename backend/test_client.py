@@ -1,7 +1,10 @@
+import os
 import requests
 import socketio
 import time
 
+SERVER_URL = os.getenv('SERVER_URL', 'http://localhost:5000')
+
 # Create a Socket.IO client
 sio = socketio.Client()
 
@@ -17,20 +20,21 @@ def disconnect():
 def on_connection_status(data):
     print(f'Connection status: {data}')
 
-@sio.on('message')
-def on_message(data):
-    print(f'Received message: {data}')
+@sio.on('message_batch')
+def on_message_batch(batch):
+    for data in batch['messages']:
+        print(f'Received message: {data}')
 
 def test_http():
     # Test HTTP endpoints
     print("\nTesting HTTP endpoints...")
     
     # Test home endpoint
-    response = requests.get('http://localhost:8080/')
+    response = requests.get(f'{SERVER_URL}/')
     print(f"Home endpoint: {response.text}")
     
     # Test status endpoint
-    response = requests.get('http://localhost:8080/api/status')
+    response = requests.get(f'{SERVER_URL}/api/status')
     print(f"Status endpoint: {response.json()}")
 
 def test_websocket():
@@ -38,7 +42,7 @@ def test_websocket():
     
     try:
         # Connect to the server
-        sio.connect('http://localhost:8080')
+        sio.connect(SERVER_URL)
         
         # Send a test message
         sio.emit('message', {'text': 'Hello from test client!'})
@@ -5,8 +5,8 @@ def test_server():
     try:
         # Try both localhost and 127.0.0.1
         urls = [
-            'http://localhost:8080',
-            'http://127.0.0.1:8080'
+            'http://localhost:5000',
+            'http://127.0.0.1:5000'
         ]
         
         for url in urls:
@@ -0,0 +1,206 @@
+"""
+The SOAP keyword vocabulary shared by /api/analyze and SpeechProcessor.
+
+Section keywords, plan sub-categories and medical terms live in
+config/vocabulary.json. They are compiled once into an immutable
+VocabularyIndex (an Aho-Corasick automaton over all keywords), so a
+sentence is scanned a single time however large the vocabulary grows.
+Keywords match at the start of a word, so "symptom" also covers
+"symptoms" but "rest" no longer fires inside "interest".
+
+Every section is scored instead of taking the first hit: each distinct
+keyword adds its weight (the number of words in it unless the data file's
+"weights" table says otherwise), and a keyword inside a longer hit of the
+same section is not counted again. Ties go to the section listed first in
+"section_priority".
+
+Vocabulary watches the data file and swaps in a freshly built index when
+it changes, so edits take effect without a restart.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from config.settings import VOCABULARY
+from soap_matcher import KeywordAutomaton
+
+logger = logging.getLogger(__name__)
+
+Classification = namedtuple('Classification', ['section', 'subcategory', 'score', 'scores'])
+
+NO_MATCH = Classification(None, None, 0.0, {})
+
+
+def _outermost(hits):
+    """Drop hits lying inside a longer hit; hits are (start, end, keyword)"""
+    kept = []
+    for start, end, keyword in sorted(hits, key=lambda hit: (hit[0], -hit[1])):
+        if kept and end <= kept[-1][1]:
+            continue
+        kept.append((start, end, keyword))
+    return kept
+
+
+class VocabularyIndex:
+    """Immutable compiled vocabulary; safe to share between threads"""
+
+    def __init__(self, data):
+        self.version = data.get('version')
+        self.min_score = float(data.get('min_score', 1.0))
+        self.section_priority = list(data['section_priority'])
+        self.plan_subcategories = {
+            name: {'label': details['label'], 'keywords': [k.lower() for k in details['keywords']]}
+            for name, details in data.get('plan_subcategories', {}).items()
+        }
+        self.medical_terms = {
+            category: tuple(terms) for category, terms in data.get('medical_terms', {}).items()
+        }
+        weights = {keyword.lower(): float(weight) for keyword, weight in data.get('weights', {}).items()}
+
+        self.automaton = KeywordAutomaton()
+        self.weights = {}
+        for section, keywords in data['sections'].items():
+            if section not in self.section_priority:
+                raise ValueError(f"Section '{section}' is missing from section_priority")
+            for keyword in keywords:
+                self._add(keyword.lower(), ('section', section), weights)
+        for subcategory, details in self.plan_subcategories.items():
+            for keyword in details['keywords']:
+                self._add(keyword, ('plan', subcategory), weights)
+        self.automaton.build()
+        self.vocabulary_size = len(self.weights)
+
+    def _add(self, keyword, tag, weights):
+        if not keyword:
+            return
+        self.automaton.add(keyword, tag)
+        self.weights[keyword] = weights.get(keyword, float(len(keyword.split())))
+
+    def scores(self, sentence):
+        """Section and plan sub-category scores for a sentence"""
+        sentence = sentence.lower()
+        hits = {}
+        for start, end, keyword, tag in self.automaton.finditer(sentence):
+            if start == 0 or not sentence[start - 1].isalnum():
+                hits.setdefault(tag, []).append((start, end, keyword))
+
+        weights = self.weights
+        scores = {}
+        for tag, tag_hits in hits.items():
+            if len(tag_hits) == 1:
+                scores[tag] = weights[tag_hits[0][2]]
+            else:
+                # A keyword repeated in the sentence counts once
+                scores[tag] = sum(weights[keyword] for keyword in {keyword for _, _, keyword in _outermost(tag_hits)})
+        return scores
+
+    def classify(self, sentence):
+        """Return the best-scoring section (and plan sub-category) for a sentence"""
+        scores = self.scores(sentence)
+        if not scores:
+            return NO_MATCH
+
+        section_scores = {name: score for (kind, name), score in scores.items() if kind == 'section'}
+        best, best_score = None, 0.0
+        for section in self.section_priority:
+            score = section_scores.get(section, 0.0)
+            if score > best_score:
+                best, best_score = section, score
+        if best is None or best_score < self.min_score:
+            return Classification(None, None, best_score, section_scores)
+
+        subcategory = None
+        if best == 'plan':
+            sub_score = 0.0
+            for name in self.plan_subcategories:
+                score = scores.get(('plan', name), 0.0)
+                if score > sub_score:
+                    subcategory, sub_score = name, score
+        return Classification(best, subcategory, best_score, section_scores)
+
+    def label(self, subcategory):
+        return self.plan_subcategories[subcategory]['label']
+
+
+def load_index(path):
+    with open(path, encoding='utf-8') as handle:
+        return VocabularyIndex(json.load(handle))
+
+
+class Vocabulary:
+    """The current VocabularyIndex for a data file, rebuilt when the file changes"""
+
+    def __init__(self, path, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._mtime = self._stat()
+        self._index = load_index(path)
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def current(self):
+        """Return the live index, picking up file changes at most every check_interval"""
+        if self.check_interval is not None and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._index
+
+    def reload(self, force=False):
+        """Rebuild the index if the file changed; a broken file keeps the old index"""
+        if not self._lock.acquire(blocking=False):
+            # Another thread is already rebuilding; keep serving the current index
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            mtime = self._stat()
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                index = load_index(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.last_error = str(e)
+                logger.error(f'Keeping the previous vocabulary, {self.path} is invalid: {e}')
+                self._mtime = mtime
+                return False
+            self._index = index
+            self._mtime = mtime
+            self.reloads += 1
+            self.last_error = None
+            logger.info(f'Reloaded vocabulary version {index.version} ({index.vocabulary_size} keywords)')
+            return True
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        index = self._index
+        return {
+            'path': self.path,
+            'version': index.version,
+            'keywords': index.vocabulary_size,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_vocabulary():
+    """The process-wide Vocabulary configured in settings"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Vocabulary(VOCABULARY['path'], VOCABULARY['reload_interval'])
+        return _shared
@@ -28,7 +28,11 @@ function App() {
   useEffect(() => {
     socketRef.current = io('http://localhost:5000');
     socketRef.current.on('connect', () => console.log('Connected to server'));
-    socketRef.current.on('message', (data) => setMessages(prev => [...prev, data]));
+    // Messages arrive in batches; acknowledging lets the server send the next one
+    socketRef.current.on('message_batch', (batch, ack) => {
+      setMessages(prev => [...prev, ...batch.messages]);
+      if (ack) ack();
+    });
     
     if ('webkitSpeechRecognition' in window) {
       recognitionRef.current = new window.webkitSpeechRecognition();